@@ -1,6 +1,6 @@
 # chatbot/admin.py
 from django.contrib import admin
-from .models import PreguntaFrecuente, ConversacionChatbot, MensajeChatbot, TicketSoporte, HistorialTicket
+from .models import PreguntaFrecuente, ConversacionChatbot, MensajeChatbot, TicketSoporte, HistorialTicket, RespuestaCacheada
 
 @admin.register(PreguntaFrecuente)
 class PreguntaFrecuenteAdmin(admin.ModelAdmin):
@@ -31,6 +31,16 @@ class PreguntaFrecuenteAdmin(admin.ModelAdmin):
             obj.creada_por = request.user
         super().save_model(request, obj, form, change)
 
+@admin.register(RespuestaCacheada)
+class RespuestaCacheadaAdmin(admin.ModelAdmin):
+    list_display = ['consulta', 'origen', 'modelo', 'aciertos', 'ultimo_acierto', 'expira_en']
+    list_filter = ['origen', 'modelo']
+    search_fields = ['consulta', 'respuesta']
+    readonly_fields = [f.name for f in RespuestaCacheada._meta.fields]
+    
+    def has_add_permission(self, request):
+        return False  # Las entradas las crea el chatbot al responder
+
 @admin.register(ConversacionChatbot)
 class ConversacionChatbotAdmin(admin.ModelAdmin):
     list_display = ['cliente', 'estado', 'fecha_inicio', 'agente_asignado', 'satisfaccion']
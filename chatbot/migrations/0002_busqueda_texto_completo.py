@@ -0,0 +1,33 @@
+# Generated by Django 5.0.2 on 2026-10-18 00:45
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.conf import settings
+from django.db import migrations
+
+
+class AddIndexPostgres(migrations.AddIndex):
+    """AddIndex que sólo toca la base de datos en PostgreSQL (GIN no existe en SQLite)"""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexPostgres(
+            model_name='preguntafrecuente',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.search.CombinedSearchVector(django.contrib.postgres.search.CombinedSearchVector(django.contrib.postgres.search.SearchVector('pregunta', config='spanish', weight='A'), '||', django.contrib.postgres.search.SearchVector('palabras_clave', config='spanish', weight='A'), django.contrib.postgres.search.SearchConfig('spanish')), '||', django.contrib.postgres.search.SearchVector('respuesta', config='spanish', weight='C'), django.contrib.postgres.search.SearchConfig('spanish')), name='chatbot_pf_busqueda_gin'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.0.2 on 2026-10-18 00:49
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0002_busqueda_texto_completo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RespuestaCacheada',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('huella', models.CharField(max_length=64, unique=True)),
+                ('origen', models.CharField(choices=[('openai', 'OpenAI'), ('faq', 'Preguntas frecuentes')], max_length=10)),
+                ('modelo', models.CharField(max_length=100)),
+                ('prompt_hash', models.CharField(max_length=32)),
+                ('consulta', models.TextField(help_text='Mensaje normalizado que generó la entrada')),
+                ('respuesta', models.TextField()),
+                ('sugerir_ticket', models.BooleanField(default=False)),
+                ('aciertos', models.PositiveIntegerField(default=0)),
+                ('creada_en', models.DateTimeField(auto_now_add=True)),
+                ('ultimo_acierto', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('expira_en', models.DateTimeField(db_index=True)),
+                ('pregunta', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='respuestas_cacheadas', to='chatbot.preguntafrecuente')),
+            ],
+            options={
+                'verbose_name': 'Respuesta en Caché',
+                'verbose_name_plural': 'Respuestas en Caché',
+                'ordering': ['-aciertos'],
+            },
+        ),
+    ]
@@ -1,11 +1,29 @@
 # chatbot/models.py
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector
+from cobramax_core.contadores import ContadorDiferido
 from django.utils import timezone
 from clientes.models import Cliente
 
 Usuario = get_user_model()
 
+BUSQUEDA_CONFIG = 'spanish'
+
+
+def vector_busqueda_faq():
+    """Vector de texto completo de una FAQ (PostgreSQL).
+
+    La consulta y el índice GIN usan esta misma expresión para que el
+    planificador pueda aprovechar el índice.
+    """
+    return (
+        SearchVector('pregunta', weight='A', config=BUSQUEDA_CONFIG)
+        + SearchVector('palabras_clave', weight='A', config=BUSQUEDA_CONFIG)
+        + SearchVector('respuesta', weight='C', config=BUSQUEDA_CONFIG)
+    )
+
 class PreguntaFrecuente(models.Model):
     CATEGORIA_CHOICES = [
         ('pagos', '💳 Pagos y Facturación'),
@@ -29,13 +47,45 @@ class PreguntaFrecuente(models.Model):
         verbose_name = "Pregunta Frecuente"
         verbose_name_plural = "Preguntas Frecuentes"
         ordering = ['categoria', 'veces_consultada']
+        indexes = [
+            GinIndex(vector_busqueda_faq(), name='chatbot_pf_busqueda_gin'),
+        ]
     
     def __str__(self):
         return f"{self.pregunta} ({self.get_categoria_display()})"
     
     def incrementar_consultas(self):
-        self.veces_consultada += 1
-        self.save(update_fields=['veces_consultada'])
+        # Escritura diferida: se aplica al volcar los contadores
+        contador_consultas.incrementar(self.pk)
+
+class RespuestaCacheada(models.Model):
+    """Respuesta reutilizable para mensajes equivalentes (caché semántica del chatbot)"""
+
+    ORIGEN_CHOICES = [
+        ('openai', 'OpenAI'),
+        ('faq', 'Preguntas frecuentes'),
+    ]
+
+    huella = models.CharField(max_length=64, unique=True)
+    origen = models.CharField(max_length=10, choices=ORIGEN_CHOICES)
+    modelo = models.CharField(max_length=100)
+    prompt_hash = models.CharField(max_length=32)
+    consulta = models.TextField(help_text="Mensaje normalizado que generó la entrada")
+    respuesta = models.TextField()
+    sugerir_ticket = models.BooleanField(default=False)
+    pregunta = models.ForeignKey(PreguntaFrecuente, on_delete=models.CASCADE, null=True, blank=True, related_name='respuestas_cacheadas')
+    aciertos = models.PositiveIntegerField(default=0)
+    creada_en = models.DateTimeField(auto_now_add=True)
+    ultimo_acierto = models.DateTimeField(default=timezone.now, db_index=True)
+    expira_en = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name = "Respuesta en Caché"
+        verbose_name_plural = "Respuestas en Caché"
+        ordering = ['-aciertos']
+
+    def __str__(self):
+        return f"[{self.get_origen_display()}] {self.consulta[:50]}"
 
 class ConversacionChatbot(models.Model):
     ESTADO_CHOICES = [
@@ -129,4 +179,24 @@ class HistorialTicket(models.Model):
         ordering = ['-timestamp']
     
     def __str__(self):
-        return f"Historial Ticket #{self.ticket.id} - {self.accion}"
\ No newline at end of file
+        return f"Historial Ticket #{self.ticket.id} - {self.accion}"
+
+# Contadores de popularidad con escritura diferida (ver cobramax_core.contadores)
+contador_consultas = ContadorDiferido('chatbot.consultas_faq', 'chatbot.PreguntaFrecuente', 'veces_consultada')
+contador_aciertos_cache = ContadorDiferido(
+    'chatbot.aciertos_cache', 'chatbot.RespuestaCacheada', 'aciertos', campo_fecha='ultimo_acierto'
+)
+
+
+# Señales: el índice de búsqueda de FAQ se reconstruye tras cualquier cambio
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+
+@receiver(post_save, sender=PreguntaFrecuente)
+@receiver(post_delete, sender=PreguntaFrecuente)
+def pregunta_frecuente_invalidar_indice(sender, instance, **kwargs):
+    if kwargs.get('update_fields') and set(kwargs['update_fields']) <= {'veces_consultada'}:
+        return
+    from .utils import invalidar_indice_faq
+    invalidar_indice_faq()
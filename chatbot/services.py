@@ -0,0 +1,396 @@
+# chatbot/services.py
+import hashlib
+import json
+import logging
+import operator
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import timedelta
+from functools import reduce
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+from cobramax_core.caches import contador_en_curso, exigir_cache_compartida
+from .models import (
+    PreguntaFrecuente, BUSQUEDA_CONFIG, vector_busqueda_faq, TicketSoporte, HistorialTicket, RespuestaCacheada,
+    contador_aciertos_cache,
+)
+from .utils import normalizar_texto, obtener_indice_faq
+
+logger = logging.getLogger(__name__)
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+    REQUESTS_AVAILABLE = True
+except ImportError:
+    requests = None
+    HTTPAdapter = None
+    REQUESTS_AVAILABLE = False
+    logger.warning("La librería 'requests' no está instalada. El asistente OpenAI no estará disponible.")
+
+# Peso de cada campo en la búsqueda portable (equivale a los pesos A/A/C)
+PESOS_FALLBACK = {'pregunta': 3, 'palabras_clave': 3, 'respuesta': 1}
+
+
+def buscar_preguntas(consulta, limite=5):
+    """Preguntas frecuentes activas que coinciden con `consulta`, de mejor a peor.
+
+    Se resuelve en una sola consulta. En PostgreSQL usa búsqueda de texto
+    completo (índice GIN + `SearchRank`) con las palabras unidas por OR.
+    En otros motores puntúa cada palabra encontrada en pregunta, palabras
+    clave o respuesta. Los empates se ordenan por `veces_consultada`.
+    """
+    palabras = consulta.lower().split()
+    if not palabras:
+        return []
+
+    preguntas = PreguntaFrecuente.objects.filter(activa=True)
+    if connection.vendor == 'postgresql':
+        query = reduce(operator.or_, (SearchQuery(p, config=BUSQUEDA_CONFIG) for p in palabras))
+        preguntas = (
+            preguntas.annotate(documento=vector_busqueda_faq())
+            .filter(documento=query)
+            .annotate(rango=SearchRank(F('documento'), query))
+        )
+    else:
+        puntajes = [
+            Case(When(**{f'{campo}__icontains': palabra}, then=Value(peso)), default=Value(0), output_field=IntegerField())
+            for palabra in palabras
+            for campo, peso in PESOS_FALLBACK.items()
+        ]
+        preguntas = preguntas.annotate(rango=reduce(operator.add, puntajes)).filter(rango__gt=0)
+
+    return list(preguntas.order_by('-rango', '-veces_consultada')[:limite])
+
+
+# =======================
+# Asistente OpenAI
+# =======================
+
+# Preguntas con las que arranca el chatbot (seed_chatbot y los datos sintéticos)
+PREGUNTAS_INICIALES = [
+    {
+        'pregunta': '¿Cómo puedo pagar mi factura?',
+        'respuesta': 'Puedes pagar tu factura a través de nuestra plataforma en línea, en agentes autorizados o por transferencia bancaria. Dirígete al menú Cobranza para más opciones.',
+        'categoria': 'pagos',
+        'palabras_clave': 'pago,factura,transferencia,cuota'
+    },
+    {
+        'pregunta': 'Mi Internet va muy lento, ¿qué hago?',
+        'respuesta': 'Prueba reiniciar tu router y verificar las conexiones. Si el problema persiste, abre un ticket de soporte desde el área de clientes.',
+        'categoria': 'tecnico',
+        'palabras_clave': 'internet,lento,router,conexion,velocidad'
+    },
+    {
+        'pregunta': '¿Cómo cambio mi plan?',
+        'respuesta': 'Puedes solicitar un cambio de plan desde el panel de cliente o contactando a soporte. Revisa los planes disponibles en la sección Planes.',
+        'categoria': 'servicio',
+        'palabras_clave': 'plan,cambio,contrato'
+    },
+    {
+        'pregunta': '¿Cómo actualizo mis datos de contacto?',
+        'respuesta': 'Ve a tu perfil y edita tu teléfono y correo. Si necesitas asistencia, contacta a soporte.',
+        'categoria': 'cuenta',
+        'palabras_clave': 'perfil,telefono,email,direccion'
+    },
+]
+
+
+def sembrar_preguntas_frecuentes(usuario):
+    """Crea las `PREGUNTAS_INICIALES` que falten; retorna cuántas creó"""
+    creadas = 0
+    for item in PREGUNTAS_INICIALES:
+        _, creada = PreguntaFrecuente.objects.get_or_create(
+            pregunta=item['pregunta'],
+            defaults={
+                'respuesta': item['respuesta'],
+                'categoria': item['categoria'],
+                'palabras_clave': item['palabras_clave'],
+                'activa': True,
+                'creada_por': usuario
+            }
+        )
+        creadas += creada
+    return creadas
+
+
+OPENAI_API_URL = 'https://api.openai.com/v1/chat/completions'
+
+SYSTEM_PROMPT = (
+    "Eres un asistente técnico especializado EXCLUSIVAMENTE en el proyecto de "
+    "telecomunicaciones COBRA-MAX. Responde solo a preguntas relacionadas con este proyecto: "
+    "pagos, facturación, fechas de vencimiento, cortes y reconexiones, problemas técnicos de conexión, "
+    "configuración de clientes, asignación de zonas, notificaciones (email/Twilio), despliegue (Docker, Celery, Redis), "
+    "integraciones y administración del sistema. Si la consulta NO está relacionada con COBRA-MAX o es temática general "
+    "(recetas, política, medicina, etc.), responde exactamente: 'Lo siento, solo puedo responder preguntas relacionadas con el proyecto COBRA-MAX.' "
+    "No inventes información fuera del repositorio ni supongas credenciales. Si no conoces la respuesta, di 'No sé' y sugiere crear un ticket. "
+    "Responde en español de forma concisa y con pasos accionables cuando aplique."
+)
+
+MENSAJE_SATURADO = 'Lo siento, el servicio de respuestas está temporalmente sobrecargado. Intenta de nuevo en unos segundos.'
+MENSAJE_ERROR_AI = 'Lo siento, hubo un error al procesar tu consulta. Puedes intentar de nuevo o solicitar atención personalizada.'
+
+
+class OpenAIError(Exception):
+    """Fallo al consultar OpenAI (red, 5xx, respuesta inválida)"""
+
+
+class OpenAISaturado(OpenAIError):
+    """OpenAI respondió 429 o se alcanzó el cupo global de llamadas simultáneas"""
+
+
+_sesion_openai = None
+_sesion_openai_lock = threading.Lock()
+
+
+def _sesion_http():
+    """Sesión HTTP compartida por el proceso (pool de conexiones keep-alive)"""
+    global _sesion_openai
+    with _sesion_openai_lock:
+        if _sesion_openai is None:
+            tamanio = getattr(settings, 'CHATBOT_OPENAI_POOL', 10)
+            sesion = requests.Session()
+            sesion.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=tamanio))
+            _sesion_openai = sesion
+    return _sesion_openai
+
+
+CUPO_KEY = 'chatbot:openai:en_curso'
+
+
+@contextmanager
+def cupo_openai():
+    """Limita las llamadas simultáneas a OpenAI entre todos los workers.
+
+    El contador vive en la caché compartida; con una caché local falla
+    (ver `exigir_cache_compartida`) en vez de limitar por proceso. Si ya hay
+    `CHATBOT_OPENAI_CONCURRENCIA` llamadas en curso lanza `OpenAISaturado`
+    en vez de esperar, para no retener un worker. La clave expira sola, así
+    que un proceso que muera sin liberar no bloquea el cupo para siempre.
+    """
+    exigir_cache_compartida('El cupo de llamadas a OpenAI (CHATBOT_OPENAI_CONCURRENCIA)')
+    limite = getattr(settings, 'CHATBOT_OPENAI_CONCURRENCIA', 8)
+    timeout = getattr(settings, 'CHATBOT_OPENAI_TIMEOUT', 10)
+    with contador_en_curso(CUPO_KEY, timeout * 6) as en_curso:
+        if en_curso > limite:
+            raise OpenAISaturado(f'{en_curso - 1} llamadas en curso (límite {limite})')
+        yield
+
+
+def consultar_openai(mensaje, on_token=None):
+    """Pide a OpenAI la respuesta a `mensaje` y retorna el texto completo.
+
+    Con `on_token` la respuesta se pide en streaming y se invoca
+    `on_token(texto_acumulado)` a medida que llegan los fragmentos.
+    Lanza `OpenAISaturado` u `OpenAIError`; no reintenta ni duerme.
+    """
+    if not REQUESTS_AVAILABLE:
+        raise OpenAIError("La librería 'requests' no está instalada")
+
+    body = {
+        'model': getattr(settings, 'OPENAI_MODEL', 'gpt-3.5-turbo'),
+        'messages': [
+            {'role': 'system', 'content': SYSTEM_PROMPT},
+            {'role': 'user', 'content': mensaje}
+        ],
+        'max_tokens': 256,
+        'temperature': 0.2,
+        'stream': on_token is not None,
+    }
+    headers = {
+        'Authorization': f"Bearer {getattr(settings, 'OPENAI_API_KEY', '')}",
+        'Content-Type': 'application/json'
+    }
+    timeout = getattr(settings, 'CHATBOT_OPENAI_TIMEOUT', 10)
+
+    with cupo_openai():
+        try:
+            resp = _sesion_http().post(OPENAI_API_URL, data=json.dumps(body), headers=headers,
+                                       timeout=timeout, stream=on_token is not None)
+        except Exception as e:
+            raise OpenAIError(str(e)) from e
+        try:
+            if resp.status_code == 429:
+                raise OpenAISaturado('OpenAI respondió 429')
+            if resp.status_code >= 400:
+                raise OpenAIError(f'OpenAI respondió {resp.status_code}')
+            if on_token is None:
+                return resp.json()['choices'][0]['message']['content'].strip()
+
+            texto = ''
+            for linea in resp.iter_lines(decode_unicode=True):
+                if not linea or not linea.startswith('data: '):
+                    continue
+                datos = linea[len('data: '):]
+                if datos == '[DONE]':
+                    break
+                fragmento = json.loads(datos)['choices'][0].get('delta', {}).get('content')
+                if fragmento:
+                    texto += fragmento
+                    on_token(texto)
+            return texto.strip()
+        except OpenAIError:
+            raise
+        except Exception as e:
+            raise OpenAIError(f'Respuesta inválida de OpenAI: {e}') from e
+        finally:
+            resp.close()
+
+
+def crear_ticket_fallo_ai(conversacion, usuario, mensaje, error):
+    """Ticket automático cuando el asistente no pudo responder"""
+    ticket = TicketSoporte.objects.create(
+        conversacion=conversacion,
+        titulo=f'Falló asistente AI para cliente {conversacion.cliente_id}',
+        descripcion=f'Fallo al intentar usar OpenAI: {error}\nMensaje del usuario: {mensaje}',
+        prioridad='media',
+        categoria='tecnico',
+        creado_por=usuario
+    )
+    HistorialTicket.objects.create(ticket=ticket, usuario=usuario, accion='Ticket generado por fallo AI')
+    return ticket
+
+
+def clave_respuesta(mensaje_id):
+    """Clave de caché con el estado de la respuesta asíncrona a un mensaje"""
+    return f'chatbot:respuesta:{mensaje_id}'
+
+
+# =======================
+# Caché de respuestas
+# =======================
+
+# Sólo artículos, preposiciones y pronombres: saludos, despedidas y verbos de
+# petición (hola, gracias, quiero...) cambian la respuesta y forman parte de la huella
+STOP_WORDS = frozenset("""
+    a al algo como con cual cuales cuando de del donde el ella ellos en es esta este esto ha hay la las le les lo los
+    me mi mis mucho muy nos o os para pero por porfavor favor que quien se sea ser si sin sobre su sus te ti tu tus
+    un una uno unos unas y ya yo
+""".split())
+
+
+def huella_mensaje(mensaje, origen, modelo, prompt):
+    """Huella de un mensaje para la caché de respuestas.
+
+    Normaliza el texto (minúsculas, sin tildes ni signos, sin palabras vacías)
+    y lo combina con el origen, el modelo y un hash del prompt, de modo que
+    cambiar el prompt o el modelo no reutiliza respuestas antiguas.
+    Retorna (huella, consulta_normalizada, prompt_hash); la huella es None si
+    no queda ninguna palabra: esos mensajes no se cachean ni se buscan.
+    """
+    consulta = ' '.join(p for p in normalizar_texto(mensaje).split() if p not in STOP_WORDS)
+    prompt_hash = hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:16]
+    if not consulta:
+        return None, consulta, prompt_hash
+    huella = hashlib.sha256(f'{origen}|{modelo}|{prompt_hash}|{consulta}'.encode('utf-8')).hexdigest()
+    return huella, consulta, prompt_hash
+
+
+def huella_openai(mensaje):
+    return huella_mensaje(mensaje, 'openai', getattr(settings, 'OPENAI_MODEL', 'gpt-3.5-turbo'), SYSTEM_PROMPT)
+
+
+def huella_faq(mensaje):
+    # La versión del índice de FAQ invalida las entradas al editar preguntas
+    return huella_mensaje(mensaje, 'faq', 'faq', f'faq-v{obtener_indice_faq().version}')
+
+
+class CacheRespuestas:
+    """Caché de respuestas en dos niveles.
+
+    Un LRU en memoria del proceso (`CHATBOT_CACHE_MAX_LOCAL` entradas) atiende
+    las preguntas repetidas sin consultas. Detrás, la tabla `RespuestaCacheada`
+    comparte las entradas entre procesos y guarda sus aciertos para el admin.
+    Las entradas caducan a los `CHATBOT_CACHE_TTL` segundos; la tarea
+    periódica `recortar_cache_respuestas_task` borra las caducadas y recorta la
+    tabla a `CHATBOT_CACHE_MAX_FILAS` descartando las menos usadas recientemente.
+    """
+
+    def __init__(self):
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _guardar_local(self, huella, entrada):
+        limite = getattr(settings, 'CHATBOT_CACHE_MAX_LOCAL', 512)
+        with self._lock:
+            self._lru[huella] = entrada
+            self._lru.move_to_end(huella)
+            while len(self._lru) > limite:
+                self._lru.popitem(last=False)
+
+    def obtener(self, huella):
+        """Entrada vigente para `huella` (dict) o None; cuenta el acierto"""
+        if huella is None:
+            return None
+        ahora = timezone.now()
+        with self._lock:
+            entrada = self._lru.get(huella)
+            if entrada is not None:
+                if entrada['expira_en'] > ahora:
+                    self._lru.move_to_end(huella)
+                else:
+                    del self._lru[huella]
+                    entrada = None
+        if entrada is None:
+            entrada = (
+                RespuestaCacheada.objects.filter(huella=huella, expira_en__gt=ahora)
+                .values('id', 'respuesta', 'sugerir_ticket', 'pregunta_id', 'expira_en')
+                .first()
+            )
+            if entrada is None:
+                return None
+            self._guardar_local(huella, entrada)
+        # Acierto con escritura diferida: servir desde el LRU no toca la base de datos
+        contador_aciertos_cache.incrementar(entrada['id'])
+        return entrada
+
+    def guardar(self, huella, origen, modelo, prompt_hash, consulta, respuesta, sugerir_ticket=False, pregunta_id=None):
+        if huella is None:
+            return
+        ahora = timezone.now()
+        expira_en = ahora + timedelta(seconds=getattr(settings, 'CHATBOT_CACHE_TTL', 24 * 3600))
+        fila, _ = RespuestaCacheada.objects.update_or_create(
+            huella=huella,
+            defaults={
+                'origen': origen, 'modelo': modelo, 'prompt_hash': prompt_hash, 'consulta': consulta,
+                'respuesta': respuesta, 'sugerir_ticket': sugerir_ticket, 'pregunta_id': pregunta_id,
+                'ultimo_acierto': ahora, 'expira_en': expira_en,
+            },
+        )
+        self._guardar_local(huella, {
+            'id': fila.id, 'respuesta': respuesta, 'sugerir_ticket': sugerir_ticket, 'pregunta_id': pregunta_id, 'expira_en': expira_en,
+        })
+
+    def recortar(self, ahora=None):
+        """Elimina entradas caducadas y las menos usadas por encima del máximo"""
+        RespuestaCacheada.objects.filter(expira_en__lte=ahora or timezone.now()).delete()
+        maximo = getattr(settings, 'CHATBOT_CACHE_MAX_FILAS', 5000)
+        sobrantes = list(
+            RespuestaCacheada.objects.order_by('-ultimo_acierto').values_list('id', flat=True)[maximo:]
+        )
+        if sobrantes:
+            RespuestaCacheada.objects.filter(id__in=sobrantes).delete()
+
+    def limpiar_local(self):
+        with self._lock:
+            self._lru.clear()
+
+
+cache_respuestas = CacheRespuestas()
+
+
+def respuesta_openai_cacheada(mensaje):
+    """Respuesta de OpenAI ya obtenida para un mensaje equivalente, o None"""
+    entrada = cache_respuestas.obtener(huella_openai(mensaje)[0])
+    return entrada['respuesta'] if entrada else None
+
+
+def guardar_respuesta_openai(mensaje, respuesta):
+    huella, consulta, prompt_hash = huella_openai(mensaje)
+    cache_respuestas.guardar(
+        huella, 'openai', getattr(settings, 'OPENAI_MODEL', 'gpt-3.5-turbo'), prompt_hash, consulta, respuesta
+    )
@@ -0,0 +1,91 @@
+# chatbot/tasks.py
+from celery import shared_task
+from django.conf import settings
+from django.core.cache import cache
+import logging
+import time
+from .models import MensajeChatbot
+from .services import (
+    cache_respuestas, consultar_openai, crear_ticket_fallo_ai, clave_respuesta, guardar_respuesta_openai,
+    OpenAIError, OpenAISaturado, MENSAJE_SATURADO, MENSAJE_ERROR_AI,
+)
+
+logger = logging.getLogger(__name__)
+
+ESTADO_TTL = 600
+
+
+def _registrar_fallo(mensaje, exc, saturado=False):
+    """Guarda la respuesta de error (mensaje del bot y estado en caché) de un mensaje sin respuesta"""
+    conversacion = mensaje.conversacion
+    resultado = {
+        'estado': 'error',
+        'success': False,
+        'error': 'rate_limited' if saturado else 'ai_unavailable',
+        'mensaje': MENSAJE_SATURADO if saturado else MENSAJE_ERROR_AI,
+        'sugerir_ticket': not saturado,
+        'conversacion_id': conversacion.id,
+    }
+    if not saturado and getattr(settings, 'AUTO_TICKET_ON_AI_ERROR', False):
+        try:
+            ticket = crear_ticket_fallo_ai(conversacion, conversacion.cliente.usuario, mensaje.contenido, exc)
+            resultado['ticket_id'] = ticket.id
+        except Exception:
+            logger.exception('Error creando ticket automático tras fallo AI')
+    MensajeChatbot.objects.create(conversacion=conversacion, tipo='bot', contenido=resultado['mensaje'])
+    cache.set(clave_respuesta(mensaje.id), resultado, ESTADO_TTL)
+    return resultado
+
+
+@shared_task(bind=True)
+def responder_con_openai(self, mensaje_id):
+    """Responde con OpenAI un mensaje del cliente fuera del ciclo request/response.
+
+    Mientras llegan los tokens se publica el texto parcial en la caché
+    (`clave_respuesta`) para que `chatbot_respuesta` lo muestre. Los
+    reintentos usan el countdown de Celery en lugar de dormir un worker.
+    """
+    mensaje = MensajeChatbot.objects.select_related('conversacion__cliente__usuario').get(id=mensaje_id)
+    conversacion = mensaje.conversacion
+    clave = clave_respuesta(mensaje_id)
+    ultimo_envio = [0.0]
+
+    def publicar_parcial(texto):
+        ahora = time.monotonic()
+        if ahora - ultimo_envio[0] >= 0.2:
+            cache.set(clave, {'estado': 'procesando', 'parcial': texto}, ESTADO_TTL)
+            ultimo_envio[0] = ahora
+
+    try:
+        respuesta = consultar_openai(mensaje.contenido, on_token=publicar_parcial)
+    except OpenAIError as exc:
+        reintentos = getattr(settings, 'CHATBOT_RETRY_COUNT', 2)
+        if self.request.retries < reintentos:
+            backoff = getattr(settings, 'CHATBOT_RETRY_BACKOFF', 1)
+            raise self.retry(exc=exc, countdown=backoff * (self.request.retries + 1), max_retries=reintentos)
+
+        logger.error('OpenAI falló para el mensaje %s tras %s intentos: %r', mensaje_id, reintentos + 1, exc)
+        return _registrar_fallo(mensaje, exc, saturado=isinstance(exc, OpenAISaturado))
+    except Exception as exc:
+        # Cualquier otro fallo (configuración, bug) también deja un estado final:
+        # si no, el navegador seguiría viendo 'pendiente'
+        logger.exception('Error inesperado respondiendo el mensaje %s', mensaje_id)
+        return _registrar_fallo(mensaje, exc)
+
+    guardar_respuesta_openai(mensaje.contenido, respuesta)
+    MensajeChatbot.objects.create(conversacion=conversacion, tipo='bot', contenido=respuesta)
+    resultado = {
+        'estado': 'completada',
+        'success': True,
+        'respuesta': respuesta,
+        'sugerir_ticket': False,
+        'conversacion_id': conversacion.id,
+    }
+    cache.set(clave, resultado, ESTADO_TTL)
+    return resultado
+
+
+@shared_task
+def recortar_cache_respuestas_task():
+    """Borra las respuestas cacheadas caducadas y las menos usadas por encima del máximo"""
+    cache_respuestas.recortar()
@@ -1,7 +1,10 @@
-from django.test import TestCase
+from unittest import mock
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from clientes.models import Cliente
+from cobramax_core.contadores import volcar_contadores
+from cobramax_core.pruebas import ConsultasMixin
 from .models import ConversacionChatbot, MensajeChatbot
 import json
 
@@ -72,20 +75,21 @@ class ChatbotSendTests(TestCase):
 			self.assertEqual(resp2.status_code, 429)
 
 	def test_openai_mocked_response(self):
-		# Simular que OPENAI_API_KEY está presente y que urllib.request.urlopen devuelve respuesta conocida
+		# Simular que OPENAI_API_KEY está presente y que la sesión HTTP devuelve respuesta conocida
 		self.client.force_login(self.user)
 		url = reverse('chatbot_send')
 		from unittest.mock import patch, MagicMock
-		fake_response = MagicMock()
+		fake_response = MagicMock(status_code=200)
 		fake_payload = {
 			'choices': [
 				{'message': {'content': 'Respuesta simulada por OpenAI.'}}
 			]
 		}
-		# make the mock usable as a context manager
-		fake_response.__enter__.return_value.read.return_value = json.dumps(fake_payload).encode('utf-8')
-		# patch urlopen
-		with patch('urllib.request.urlopen', return_value=fake_response):
+		fake_response.json.return_value = fake_payload
+		sesion = MagicMock()
+		sesion.post.return_value = fake_response
+		# patch de la sesión HTTP compartida
+		with patch('chatbot.services._sesion_http', return_value=sesion):
 			with self.settings(OPENAI_API_KEY='sk-test'):
 				resp = self.client.post(url, data={ 'message': 'Consulta OpenAI' }, content_type='application/json')
 				self.assertEqual(resp.status_code, 200)
@@ -113,8 +117,9 @@ class ChatbotSendTests(TestCase):
 		self.client.force_login(self.user)
 		url = reverse('chatbot_send')
 		from unittest.mock import patch
-		# Simular que urlopen lanza excepción
-		with patch('urllib.request.urlopen', side_effect=Exception('network')):
+		# Simular que la llamada HTTP lanza excepción
+		with patch('chatbot.services._sesion_http') as sesion:
+			sesion.return_value.post.side_effect = Exception('network')
 			with self.settings(OPENAI_API_KEY='sk-test', AUTO_TICKET_ON_AI_ERROR=True, CHATBOT_RETRY_COUNT=0):
 				resp = self.client.post(url, data={ 'message': 'Consulta que falla' }, content_type='application/json')
 				# la vista devuelve un JSON indicando ai_unavailable y ticket_id
@@ -125,3 +130,363 @@ class ChatbotSendTests(TestCase):
 				self.assertIsNotNone(data.get('ticket_id'))
 				from .models import TicketSoporte
 				self.assertTrue(TicketSoporte.objects.filter(id=data.get('ticket_id')).exists())
+
+
+class IndiceFAQTests(TestCase):
+	def setUp(self):
+		from django.core.cache import cache
+		from .models import PreguntaFrecuente
+		cache.clear()
+		self.admin = User.objects.create_user(username='adm', password='x')
+		crear = lambda **kw: PreguntaFrecuente.objects.create(creada_por=self.admin, **kw)
+		self.horario = crear(pregunta='¿Cuál es el horario de atención?', respuesta='Lunes a viernes', categoria='general', palabras_clave='horario, atención, oficina')
+		self.pago = crear(pregunta='¿Cómo pago con Yape?', respuesta='Escanea el QR', categoria='pagos', palabras_clave='yape, plin, pagar')
+		self.lento = crear(pregunta='Mi internet está lento', respuesta='Reinicia el router', categoria='tecnico', palabras_clave='lento, velocidad, router')
+
+	def busqueda_lineal(self, mensaje):
+		from difflib import SequenceMatcher
+		from .models import PreguntaFrecuente
+		mejor, mejor_puntaje = None, 0
+		for pf in PreguntaFrecuente.objects.filter(activa=True):
+			textos = [pf.pregunta.lower()] + [p.strip().lower() for p in pf.palabras_clave.split(',')]
+			puntaje = max(SequenceMatcher(None, mensaje, t).ratio() for t in textos)
+			if puntaje > mejor_puntaje and puntaje > 0.6:
+				mejor, mejor_puntaje = pf, puntaje
+		return mejor
+
+	def test_mismas_coincidencias_que_busqueda_lineal(self):
+		from .utils import obtener_indice_faq
+		indice = obtener_indice_faq()
+		for mensaje in ['cual es el horario de atencion?', 'como pago con yape', 'router', 'mi internet esta lento', 'pizza margarita']:
+			esperado = self.busqueda_lineal(mensaje)
+			encontrado, _ = indice.buscar(mensaje)
+			self.assertEqual(getattr(encontrado, 'id', None), getattr(esperado, 'id', None), mensaje)
+
+	def test_solo_puntua_los_candidatos(self):
+		from unittest.mock import patch
+		from difflib import SequenceMatcher
+		from .utils import obtener_indice_faq
+		indice = obtener_indice_faq()
+		with patch('chatbot.utils.SequenceMatcher', wraps=SequenceMatcher) as matcher:
+			encontrado, _ = indice.buscar('como pago con yape', k=2)
+		self.assertEqual(encontrado.id, self.pago.id)
+		self.assertLessEqual(matcher.call_count, 2)
+		self.assertEqual(indice.buscar('pizza margarita', k=0), (None, 0))
+
+	@override_settings(CHATBOT_INDICE_REVISION=0)
+	def test_cambio_hecho_en_otro_proceso_reconstruye_el_indice(self):
+		from django.utils import timezone
+		from .models import PreguntaFrecuente
+		from .services import huella_faq
+		from .utils import obtener_indice_faq
+		indice = obtener_indice_faq()
+		huella = huella_faq('no tengo señal')[0]
+		# update() no dispara señales: equivale a una edición en otro worker
+		PreguntaFrecuente.objects.filter(pk=self.lento.pk).update(pregunta='No tengo señal', actualizada_en=timezone.now())
+		nuevo = obtener_indice_faq()
+		self.assertIsNot(nuevo, indice)
+		self.assertEqual(nuevo.buscar('no tengo señal')[0].id, self.lento.id)
+		self.assertNotEqual(huella_faq('no tengo señal')[0], huella)
+
+	def test_guardar_pregunta_invalida_el_indice(self):
+		from .utils import obtener_indice_faq, ChatbotEngine
+		indice = obtener_indice_faq()
+		self.assertIs(obtener_indice_faq(), indice)
+		self.lento.pregunta = 'No tengo señal de internet'
+		self.lento.save()
+		nuevo = obtener_indice_faq()
+		self.assertIsNot(nuevo, indice)
+		self.assertEqual(nuevo.buscar('no tengo señal de internet')[0].id, self.lento.id)
+
+		# Contar consultas no reconstruye el índice
+		respuesta = ChatbotEngine()._buscar_en_preguntas_frecuentes('no tengo señal de internet')
+		self.assertEqual(respuesta['respuesta'], 'Reinicia el router')
+		self.assertIs(obtener_indice_faq(), nuevo)
+		volcar_contadores()
+		self.lento.refresh_from_db()
+		self.assertEqual(self.lento.veces_consultada, 1)
+
+
+class BuscarRespuestaTests(ConsultasMixin, TestCase):
+	def setUp(self):
+		from django.core.cache import cache
+		from .models import PreguntaFrecuente
+		cache.clear()
+		self.user = User.objects.create_user(username='cli2', password='x', tipo_usuario='cliente')
+		crear = lambda **kw: PreguntaFrecuente.objects.create(creada_por=self.user, **kw)
+		self.yape = crear(pregunta='¿Cómo pago con Yape?', respuesta='Escanea el QR', categoria='pagos', palabras_clave='yape, pagar')
+		self.recibo = crear(pregunta='¿Dónde veo mi recibo?', respuesta='En tu cuenta puedes pagar o descargarlo', categoria='pagos', palabras_clave='recibo', veces_consultada=50)
+		crear(pregunta='Mi internet está lento', respuesta='Reinicia el router', categoria='tecnico', palabras_clave='lento')
+
+	def test_mejor_respuesta_y_sugerencias_en_una_consulta(self):
+		from .services import buscar_preguntas
+		with self.assertNumQueries(1):
+			resultados = buscar_preguntas('quiero pagar con yape')
+		self.assertEqual([p.id for p in resultados], [self.yape.id, self.recibo.id])
+
+	def test_vista_devuelve_respuesta_y_sugerencias(self):
+		self.client.force_login(self.user)
+		with self.assertMaxQueries(5):
+			resp = self.client.post(reverse('buscar_respuesta'), data={'consulta': 'pagar con yape'})
+		data = resp.json()
+		self.assertTrue(data['success'])
+		self.assertEqual(data['respuesta'], 'Escanea el QR')
+		self.assertEqual(data['sugerencias'], [{'pregunta': self.recibo.pregunta, 'id': self.recibo.id}])
+		volcar_contadores()
+		self.yape.refresh_from_db()
+		self.assertEqual(self.yape.veces_consultada, 1)
+
+
+class OpenAIAsincronoTests(TestCase):
+	def setUp(self):
+		from django.core.cache import cache
+		from zonas.models import Zona
+		from cobramax_core.celery import app
+		cache.clear()
+		self.app = app
+		self.app.conf.task_always_eager = True
+		self.user = User.objects.create_user(username='cli3', password='x', tipo_usuario='cliente')
+		zona = Zona.objects.create(nombre='Zona Test', codigo='ZT')
+		Cliente.objects.create(
+			usuario=self.user, dni='33333333', telefono_principal='900000000', direccion='Calle Test',
+			zona=zona, fecha_instalacion='2025-01-01',
+		)
+		self.client.force_login(self.user)
+
+	def tearDown(self):
+		self.app.conf.task_always_eager = False
+
+	def sesion_streaming(self, *fragmentos):
+		from unittest.mock import MagicMock
+		lineas = [f'data: {json.dumps({"choices": [{"delta": {"content": f}}]})}' for f in fragmentos]
+		respuesta = MagicMock(status_code=200)
+		respuesta.iter_lines.return_value = lineas + ['', 'data: [DONE]']
+		sesion = MagicMock()
+		sesion.post.return_value = respuesta
+		return sesion
+
+	def test_respuesta_por_celery_y_consulta_de_estado(self):
+		from unittest.mock import patch
+		with patch('chatbot.services._sesion_http', return_value=self.sesion_streaming('Paga ', 'con Yape.')):
+			with self.settings(OPENAI_API_KEY='sk-test', CHATBOT_OPENAI_ASINCRONO=True):
+				resp = self.client.post(reverse('chatbot_send'), data={'message': '¿Cómo pago?'}, content_type='application/json')
+		self.assertEqual(resp.status_code, 202)
+		data = resp.json()
+		self.assertTrue(data['pendiente'])
+
+		estado = self.client.get(data['poll_url']).json()
+		self.assertEqual(estado['estado'], 'completada')
+		self.assertEqual(estado['respuesta'], 'Paga con Yape.')
+		self.assertTrue(MensajeChatbot.objects.filter(tipo='bot', contenido='Paga con Yape.').exists())
+
+	def test_fallo_inesperado_de_la_tarea_deja_estado_final(self):
+		from unittest.mock import patch
+		from .services import MENSAJE_ERROR_AI
+		with patch('chatbot.tasks.consultar_openai', side_effect=RuntimeError('sin configurar')), \
+				self.assertLogs('chatbot.tasks', 'ERROR'):
+			with self.settings(OPENAI_API_KEY='sk-test', CHATBOT_OPENAI_ASINCRONO=True):
+				data = self.client.post(reverse('chatbot_send'), data={'message': '¿Cómo pago?'}, content_type='application/json').json()
+		estado = self.client.get(data['poll_url']).json()
+		self.assertEqual((estado['estado'], estado['error']), ('error', 'ai_unavailable'))
+		self.assertTrue(MensajeChatbot.objects.filter(tipo='bot', contenido=MENSAJE_ERROR_AI).exists())
+
+	def test_respuesta_en_base_gana_a_la_cache_pendiente(self):
+		from django.core.cache import cache
+		from .services import clave_respuesta
+		conversacion = ConversacionChatbot.objects.create(cliente=Cliente.objects.get(usuario=self.user))
+		pregunta = MensajeChatbot.objects.create(conversacion=conversacion, tipo='usuario', contenido='¿Cómo pago?')
+		cache.set(clave_respuesta(pregunta.id), {'estado': 'pendiente', 'parcial': ''}, 600)
+		estado = self.client.get(reverse('chatbot_respuesta', args=[pregunta.id])).json()
+		self.assertEqual(estado['estado'], 'pendiente')
+		MensajeChatbot.objects.create(conversacion=conversacion, tipo='bot', contenido='Con Yape.')
+		estado = self.client.get(reverse('chatbot_respuesta', args=[pregunta.id])).json()
+		self.assertEqual((estado['estado'], estado['respuesta']), ('completada', 'Con Yape.'))
+
+	@override_settings(CACHE_COMPARTIDA=False, DEBUG=True)
+	def test_sin_cache_compartida_responde_en_linea(self):
+		from unittest.mock import MagicMock, patch
+		sesion = MagicMock()
+		sesion.post.return_value = MagicMock(status_code=200)
+		sesion.post.return_value.json.return_value = {'choices': [{'message': {'content': 'Paga con Yape.'}}]}
+		with patch('chatbot.views.responder_con_openai') as tarea, patch('chatbot.services._sesion_http', return_value=sesion):
+			with self.settings(OPENAI_API_KEY='sk-test', CHATBOT_OPENAI_ASINCRONO=True):
+				resp = self.client.post(reverse('chatbot_send'), data={'message': '¿Cómo pago?'}, content_type='application/json')
+		self.assertEqual(resp.json()['respuesta'], 'Paga con Yape.')
+		tarea.delay.assert_not_called()
+
+	@override_settings(CACHE_COMPARTIDA=False, DEBUG=False)
+	def test_sin_cupo_configurado_responde_con_preguntas_frecuentes(self):
+		from unittest.mock import patch
+		with patch('chatbot.services._sesion_http') as sesion, self.assertLogs('chatbot.views', 'ERROR'):
+			with self.settings(OPENAI_API_KEY='sk-test', CHATBOT_OPENAI_ASINCRONO=True):
+				resp = self.client.post(reverse('chatbot_send'), data={'message': '¿Tienen planes de fibra óptica?'}, content_type='application/json')
+		self.assertEqual(resp.status_code, 200)
+		self.assertTrue(resp.json()['respuesta'])
+		sesion.return_value.post.assert_not_called()
+
+	def test_cupo_global_rechaza_sin_llamar_a_openai(self):
+		from unittest.mock import patch
+		from django.core.cache import cache
+		from .services import CUPO_KEY
+		with patch('chatbot.services._sesion_http') as sesion:
+			with self.settings(OPENAI_API_KEY='sk-test', CHATBOT_OPENAI_CONCURRENCIA=0):
+				resp = self.client.post(reverse('chatbot_send'), data={'message': 'Hola'}, content_type='application/json')
+		self.assertEqual(resp.status_code, 429)
+		self.assertEqual(resp.json()['error'], 'rate_limited')
+		sesion.return_value.post.assert_not_called()
+		self.assertEqual(cache.get(CUPO_KEY), 0)
+
+	def test_cupo_no_queda_negativo_si_la_clave_expira(self):
+		from django.core.cache import cache
+		from .services import CUPO_KEY, cupo_openai
+		with cupo_openai():
+			self.assertEqual(cache.get(CUPO_KEY), 1)
+			# La clave expiró y otra llamada creó un contador nuevo
+			cache.delete(CUPO_KEY)
+			with cupo_openai():
+				pass
+		self.assertEqual(cache.get(CUPO_KEY), 0)
+
+	@override_settings(OPENAI_API_KEY='sk-test', CACHE_COMPARTIDA=False, DEBUG=False)
+	def test_cupo_sin_cache_compartida_falla(self):
+		from unittest.mock import patch
+		from django.core.exceptions import ImproperlyConfigured
+		from .services import consultar_openai
+		with patch('chatbot.services._sesion_http') as sesion:
+			with self.assertRaises(ImproperlyConfigured):
+				consultar_openai('Hola')
+		sesion.return_value.post.assert_not_called()
+
+
+class CacheRespuestasTests(TestCase):
+	def setUp(self):
+		from django.core.cache import cache
+		from .services import cache_respuestas
+		cache.clear()
+		cache_respuestas.limpiar_local()
+		self.user = User.objects.create_user(username='cli4', password='x', tipo_usuario='cliente')
+		from zonas.models import Zona
+		zona = Zona.objects.create(nombre='Zona Test', codigo='ZT')
+		Cliente.objects.create(
+			usuario=self.user, dni='44444444', telefono_principal='900000000', direccion='Calle Test',
+			zona=zona, fecha_instalacion='2025-01-01',
+		)
+		self.client.force_login(self.user)
+
+	def test_huella_ignora_tildes_signos_y_palabras_vacias(self):
+		from .services import huella_openai
+		self.assertEqual(huella_openai('¿Cómo pago mi deuda?')[0], huella_openai('como pago deuda')[0])
+		self.assertNotEqual(huella_openai('como pago deuda')[0], huella_openai('no pago deuda')[0])
+		huella = huella_openai('como pago deuda')[0]
+		with self.settings(OPENAI_MODEL='otro-modelo'):
+			self.assertNotEqual(huella_openai('como pago deuda')[0], huella)
+
+	def test_pregunta_repetida_no_llama_a_openai(self):
+		from unittest.mock import patch, MagicMock
+		from .models import RespuestaCacheada
+		respuesta = MagicMock(status_code=200)
+		respuesta.json.return_value = {'choices': [{'message': {'content': 'Paga con Yape.'}}]}
+		with patch('chatbot.services._sesion_http') as sesion, self.settings(OPENAI_API_KEY='sk-test'):
+			sesion.return_value.post.return_value = respuesta
+			self.client.post(reverse('chatbot_send'), data={'message': '¿Cómo pago mi deuda?'}, content_type='application/json')
+			resp = self.client.post(reverse('chatbot_send'), data={'message': 'como PAGO la deuda'}, content_type='application/json')
+		self.assertEqual(resp.json()['respuesta'], 'Paga con Yape.')
+		self.assertEqual(sesion.return_value.post.call_count, 1)
+		volcar_contadores()
+		self.assertEqual(RespuestaCacheada.objects.get(origen='openai').aciertos, 1)
+
+	def test_busqueda_local_cacheada(self):
+		from .models import PreguntaFrecuente, RespuestaCacheada
+		from .views import buscar_respuesta_automatica
+		pf = PreguntaFrecuente.objects.create(pregunta='¿Cómo pago?', respuesta='En agencia', categoria='pagos', palabras_clave='pago', creada_por=self.user)
+		primera = buscar_respuesta_automatica('quiero pagar mi factura')
+		segunda = buscar_respuesta_automatica('Quiero pagar mi factura!')
+		self.assertEqual(primera['mensaje'], segunda['mensaje'])
+		self.assertEqual(segunda['pregunta_id'], pf.id)
+		volcar_contadores()
+		self.assertEqual(RespuestaCacheada.objects.get(origen='faq').aciertos, 1)
+		pf.refresh_from_db()
+		self.assertEqual(pf.veces_consultada, 2)
+
+		# Editar la FAQ cambia la versión del índice: la entrada anterior ya no se usa
+		pf.respuesta = 'Por Yape'
+		pf.save()
+		self.assertEqual(buscar_respuesta_automatica('quiero pagar mi factura')['mensaje'], 'Por Yape')
+
+
+	def test_mensajes_sin_palabras_no_comparten_entrada(self):
+		from .models import PreguntaFrecuente, RespuestaCacheada
+		from .services import huella_openai
+		from .views import buscar_respuesta_automatica
+		PreguntaFrecuente.objects.create(pregunta='Hola', respuesta='¡Hola! ¿En qué te ayudo?', categoria='general', palabras_clave='hola,saludo', creada_por=self.user)
+		self.assertIsNone(huella_openai('¿mi?')[0])
+		self.assertNotEqual(buscar_respuesta_automatica('mi')['mensaje'], '¡Hola! ¿En qué te ayudo?')
+		self.assertEqual(buscar_respuesta_automatica('hola')['mensaje'], '¡Hola! ¿En qué te ayudo?')
+		self.assertEqual(list(RespuestaCacheada.objects.values_list('consulta', flat=True)), ['hola'])
+
+	def test_guardar_no_recorta(self):
+		from .models import RespuestaCacheada
+		from django.db import connection
+		from django.test.utils import CaptureQueriesContext
+		from .services import guardar_respuesta_openai
+		from .tasks import recortar_cache_respuestas_task
+		with self.settings(CHATBOT_CACHE_MAX_FILAS=1):
+			with CaptureQueriesContext(connection) as ctx:
+				guardar_respuesta_openai('como pago', 'A')
+			# update_or_create: lectura e INSERT, sin DELETE ni recorrido de la tabla
+			self.assertFalse([q for q in ctx.captured_queries if q['sql'].startswith('DELETE')])
+			guardar_respuesta_openai('otra consulta', 'B')
+			self.assertEqual(RespuestaCacheada.objects.count(), 2)
+			recortar_cache_respuestas_task()
+		self.assertEqual(RespuestaCacheada.objects.count(), 1)
+
+class ContadoresDiferidosTests(TestCase):
+	def setUp(self):
+		from django.core.cache import cache
+		from .models import PreguntaFrecuente
+		cache.clear()
+		user = User.objects.create_user(username='adm5', password='x')
+		crear = lambda n: PreguntaFrecuente.objects.create(pregunta=f'P{n}', respuesta='R', palabras_clave='x', creada_por=user)
+		self.a, self.b, self.c = crear(1), crear(2), crear(3)
+
+	def test_acumula_en_cache_y_vuelca_con_un_update_por_delta(self):
+		from .models import contador_consultas
+		with self.assertNumQueries(0):
+			for _ in range(3):
+				self.a.incrementar_consultas()
+				self.b.incrementar_consultas()
+			self.c.incrementar_consultas()
+		self.assertEqual(contador_consultas.pendientes(), {self.a.id: 3, self.b.id: 3, self.c.id: 1})
+
+		# a y b comparten delta: un UPDATE para ambas y otro para c
+		with self.assertNumQueries(2):
+			self.assertEqual(contador_consultas.volcar(), 3)
+		self.a.refresh_from_db()
+		self.c.refresh_from_db()
+		self.assertEqual((self.a.veces_consultada, self.c.veces_consultada), (3, 1))
+
+		# Lo volcado no se vuelve a aplicar; lo nuevo sí
+		self.a.incrementar_consultas()
+		self.assertEqual(volcar_contadores()['chatbot.consultas_faq'], 1)
+		self.a.refresh_from_db()
+		self.assertEqual(self.a.veces_consultada, 4)
+
+	@override_settings(CACHE_COMPARTIDA=False)
+	def test_sin_cache_compartida_actualiza_directo(self):
+		from .models import contador_consultas
+		with self.assertNumQueries(1):
+			self.a.incrementar_consultas()
+		self.a.refresh_from_db()
+		self.assertEqual(self.a.veces_consultada, 1)
+		self.assertEqual(contador_consultas.pendientes(), {})
+
+	def test_candado_ocupado_no_pierde_el_id(self):
+		from .models import contador_consultas
+		with mock.patch.object(contador_consultas, '_con_candado', return_value=(False, None)):
+			self.a.incrementar_consultas()
+		self.assertEqual(contador_consultas.pendientes(), {})
+		# El siguiente incremento registra el id y se vuelca todo lo acumulado
+		self.a.incrementar_consultas()
+		self.assertEqual(contador_consultas.volcar(), 1)
+		self.a.refresh_from_db()
+		self.assertEqual(self.a.veces_consultada, 2)
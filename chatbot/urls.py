@@ -8,6 +8,7 @@ urlpatterns = [
     path('buscar/', views.buscar_respuesta, name='buscar_respuesta'),
     path('iniciar-conversacion/', views.iniciar_conversacion, name='iniciar_conversacion'),
     path('send/', views.chatbot_send, name='chatbot_send'),
+    path('send/<int:mensaje_id>/respuesta/', views.chatbot_respuesta, name='chatbot_respuesta'),
     path('history/<int:conversacion_id>/', views.chatbot_history, name='chatbot_history'),
     
     # Gestión de preguntas frecuentes
@@ -1,8 +1,141 @@
 # chatbot/utils.py
+import heapq
+import math
 import re
+import threading
+import time
+import unicodedata
+from collections import Counter, defaultdict
 from difflib import SequenceMatcher
+from django.conf import settings
+from django.db.models import Count, Max
 from .models import PreguntaFrecuente, ConversacionChatbot, TicketSoporte
 
+UMBRAL_SIMILITUD = 0.6
+
+
+def normalizar_texto(texto):
+    """Minúsculas, sin tildes y con espacios colapsados"""
+    texto = unicodedata.normalize('NFKD', texto.lower())
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return ' '.join(re.findall(r'\w+', texto))
+
+
+def _trigramas(texto):
+    texto = f' {normalizar_texto(texto)} '
+    return Counter(texto[i:i + 3] for i in range(len(texto) - 2))
+
+
+class IndiceFAQ:
+    """Índice invertido de trigramas (TF-IDF) sobre preguntas y palabras clave.
+
+    Cada pregunta y cada palabra clave es una entrada. `buscar` sólo puntúa
+    con `SequenceMatcher` los `k` mejores candidatos por coseno, así que el
+    costo depende de las entradas que comparten trigramas con el mensaje y no
+    del total de FAQ. Una entrada sin trigramas en común no alcanza el umbral
+    en la práctica, de modo que las coincidencias son las de la búsqueda
+    lineal anterior.
+    """
+
+    def __init__(self, preguntas, version=None):
+        self.version = version
+        self.preguntas = {}
+        self.por_categoria = defaultdict(list)
+        self.entradas = []  # (pregunta_id, texto en minúsculas)
+        self.postings = defaultdict(list)  # trigrama -> [(entrada, peso)]
+        vectores = []
+        for pf in preguntas:
+            self.preguntas[pf.id] = pf
+            self.por_categoria[pf.categoria].append(pf)
+            textos = [pf.pregunta.lower()] + [p.strip().lower() for p in pf.palabras_clave.split(',') if p.strip()]
+            for texto in textos:
+                self.entradas.append((pf.id, texto))
+                vectores.append(_trigramas(texto))
+
+        total = len(vectores) or 1
+        frecuencia = Counter(g for v in vectores for g in v)
+        self.idf = {g: math.log((1 + total) / (1 + df)) + 1 for g, df in frecuencia.items()}
+        for i, vector in enumerate(vectores):
+            pesos = {g: tf * self.idf[g] for g, tf in vector.items()}
+            norma = math.sqrt(sum(p * p for p in pesos.values())) or 1
+            for g, p in pesos.items():
+                self.postings[g].append((i, p / norma))
+
+    def candidatos(self, mensaje, k=10):
+        """Índices de las `k` entradas más cercanas por coseno de trigramas"""
+        puntajes = defaultdict(float)
+        for g, tf in _trigramas(mensaje).items():
+            idf = self.idf.get(g)
+            if idf is None:
+                continue
+            for entrada, peso in self.postings[g]:
+                puntajes[entrada] += tf * idf * peso
+        return heapq.nlargest(k, puntajes, key=puntajes.get)
+
+    def buscar(self, mensaje, umbral=UMBRAL_SIMILITUD, k=10):
+        """Mejor (pregunta, puntaje) sobre el umbral, o (None, 0)
+
+        Ante un empate gana la entrada que va primero, como en el recorrido
+        lineal. Las cotas de `SequenceMatcher` evitan calcular `ratio()` para
+        candidatos que ya no pueden superar al mejor.
+        """
+        mensaje = mensaje.lower()
+        mejor, mejor_entrada, mejor_puntaje = None, None, umbral
+        for entrada in self.candidatos(mensaje, k):
+            pregunta_id, texto = self.entradas[entrada]
+            # Cota por longitudes (real_quick_ratio) antes de construir el matcher
+            total = len(mensaje) + len(texto)
+            if total and 2 * min(len(mensaje), len(texto)) / total < mejor_puntaje:
+                continue
+            matcher = SequenceMatcher(None, mensaje, texto)
+            if matcher.quick_ratio() < mejor_puntaje:
+                continue
+            puntaje = matcher.ratio()
+            if puntaje > mejor_puntaje or (puntaje == mejor_puntaje and mejor is not None and entrada < mejor_entrada):
+                mejor, mejor_entrada, mejor_puntaje = self.preguntas[pregunta_id], entrada, puntaje
+        return mejor, mejor_puntaje if mejor else 0
+
+    def relacionadas(self, pregunta, limite=3):
+        return [pf for pf in self.por_categoria[pregunta.categoria] if pf.id != pregunta.id][:limite]
+
+
+_indice = None
+_indice_revisado = 0.0
+_indice_lock = threading.Lock()
+
+
+def version_indice_faq():
+    """Versión de las FAQ según la base: cambia al crear, editar o borrar una"""
+    datos = PreguntaFrecuente.objects.aggregate(total=Count('id'), ultima=Max('actualizada_en'))
+    return f"{datos['total']}-{datos['ultima'].isoformat() if datos['ultima'] else 0}"
+
+
+def obtener_indice_faq():
+    """Índice del proceso; se construye una vez y se reconstruye tras invalidarse.
+
+    La versión se lee de la base (no de la caché, que puede ser local al
+    proceso) para que un cambio hecho en otro proceso también se note; se
+    revisa cada `CHATBOT_INDICE_REVISION` s.
+    """
+    global _indice, _indice_revisado
+    ahora = time.monotonic()
+    revision = getattr(settings, 'CHATBOT_INDICE_REVISION', 5)
+    if _indice is not None and ahora - _indice_revisado < revision:
+        return _indice
+    version = version_indice_faq()
+    with _indice_lock:
+        if _indice is None or version != _indice.version:
+            _indice = IndiceFAQ(PreguntaFrecuente.objects.filter(activa=True), version)
+        _indice_revisado = ahora
+        return _indice
+
+
+def invalidar_indice_faq():
+    """Descarta el índice local; los demás procesos lo notan por la versión"""
+    global _indice
+    with _indice_lock:
+        _indice = None
+
 class ChatbotEngine:
     def __init__(self):
         self.saludos = ['hola', 'buenos días', 'buenas tardes', 'buenas noches', 'hi', 'hello']
@@ -34,32 +167,16 @@ class ChatbotEngine:
     
     def _buscar_en_preguntas_frecuentes(self, mensaje):
         """Buscar la mejor coincidencia en preguntas frecuentes"""
-        preguntas = PreguntaFrecuente.objects.filter(activa=True)
-        mejor_coincidencia = None
-        mejor_puntaje = 0
-        
-        for pf in preguntas:
-            # Buscar en pregunta
-            puntaje_pregunta = self._calcular_similitud(mensaje, pf.pregunta.lower())
-            
-            # Buscar en palabras clave
-            palabras_clave = [p.strip().lower() for p in pf.palabras_clave.split(',')]
-            puntaje_palabras = max([self._calcular_similitud(mensaje, palabra) for palabra in palabras_clave] or [0])
-            
-            puntaje_total = max(puntaje_pregunta, puntaje_palabras)
-            
-            if puntaje_total > mejor_puntaje and puntaje_total > 0.6:  # Umbral de similitud
-                mejor_puntaje = puntaje_total
-                mejor_coincidencia = pf
+        indice = obtener_indice_faq()
+        mejor_coincidencia, _ = indice.buscar(mensaje)
         
         if mejor_coincidencia:
-            # Incrementar contador
-            mejor_coincidencia.veces_preguntada += 1
-            mejor_coincidencia.save()
+            # Contador diferido (sin save() para no invalidar el índice)
+            mejor_coincidencia.incrementar_consultas()
             
             return {
                 'respuesta': mejor_coincidencia.respuesta,
-                'opciones': self._generar_opciones_relacionadas(mejor_coincidencia)
+                'opciones': self._generar_opciones_relacionadas(mejor_coincidencia, indice)
             }
         
         return None
@@ -213,11 +330,8 @@ class ChatbotEngine:
         """Calcular similitud entre dos textos"""
         return SequenceMatcher(None, texto1, texto2).ratio()
     
-    def _generar_opciones_relacionadas(self, pregunta_frecuente):
+    def _generar_opciones_relacionadas(self, pregunta_frecuente, indice=None):
         """Generar opciones relacionadas con la pregunta frecuente"""
-        opciones_relacionadas = PreguntaFrecuente.objects.filter(
-            categoria=pregunta_frecuente.categoria,
-            activa=True
-        ).exclude(id=pregunta_frecuente.id)[:3]
+        opciones_relacionadas = (indice or obtener_indice_faq()).relacionadas(pregunta_frecuente)
         
         return [{'texto': pf.pregunta, 'accion': f'pregunta_{pf.id}'} for pf in opciones_relacionadas]
\ No newline at end of file
@@ -1,22 +1,29 @@
 # chatbot/views.py
 import json
 import re
-import urllib.request
-import urllib.error
 import logging
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
 from django.views.decorators.http import require_POST
 from django.contrib import messages
-from django.db.models import Q, Sum
 from django.utils import timezone
-from .models import PreguntaFrecuente, ConversacionChatbot, MensajeChatbot, TicketSoporte, HistorialTicket
+from .models import PreguntaFrecuente, ConversacionChatbot, MensajeChatbot, TicketSoporte, HistorialTicket, contador_consultas
 from .forms import PreguntaFrecuenteForm, TicketSoporteForm, BusquedaChatbotForm
+from .services import (
+    buscar_preguntas, consultar_openai, crear_ticket_fallo_ai, clave_respuesta,
+    respuesta_openai_cacheada, guardar_respuesta_openai, cache_respuestas, huella_faq,
+    OpenAIError, OpenAISaturado, MENSAJE_SATURADO, MENSAJE_ERROR_AI,
+)
+from .tasks import responder_con_openai
 from clientes.models import Cliente
 from usuarios.decorators import require_roles
+from cobramax_core.caches import cache_compartida
+from cobramax_core.estadisticas import estadisticas, contar, sumar, ttl_dashboard
 from django.conf import settings
 from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
 from django.http import HttpResponse
 
 logger = logging.getLogger(__name__)
@@ -47,27 +54,11 @@ def buscar_respuesta(request):
         form = BusquedaChatbotForm(request.POST)
         if form.is_valid():
             consulta = form.cleaned_data['consulta'].lower().strip()
-            preguntas = PreguntaFrecuente.objects.filter(activa=True)
-            
-            # Búsqueda por palabras clave
-            palabras = consulta.split()
-            queries = []
-
-            for palabra in palabras:
-                queries.append(Q(pregunta__icontains=palabra))
-                queries.append(Q(respuesta__icontains=palabra))
-                queries.append(Q(palabras_clave__icontains=palabra))
-
-            if queries:
-                query = queries.pop()
-                for item in queries:
-                    query |= item
-                preguntas = preguntas.filter(query)
-
-            preguntas = preguntas.distinct().order_by('-veces_consultada')
+            # Mejor respuesta y sugerencias en una sola consulta ordenada
+            resultados = buscar_preguntas(consulta)
 
-            if preguntas.exists():
-                pregunta = preguntas.first()
+            if resultados:
+                pregunta = resultados[0]
                 pregunta.incrementar_consultas()
                 
                 return JsonResponse({
@@ -75,7 +66,7 @@ def buscar_respuesta(request):
                     'respuesta': pregunta.respuesta,
                     'pregunta_relacionada': pregunta.pregunta,
                     'categoria': pregunta.get_categoria_display(),
-                    'sugerencias': list(preguntas[1:5].values('pregunta', 'id'))
+                    'sugerencias': [{'pregunta': p.pregunta, 'id': p.id} for p in resultados[1:]]
                 })
             else:
                 return JsonResponse({
@@ -115,7 +106,7 @@ def iniciar_conversacion(request):
                 conversacion=conversacion,
                 tipo='bot',
                 contenido=respuesta['mensaje'],
-                pregunta_relacionada=respuesta.get('pregunta')
+                pregunta_relacionada_id=respuesta.get('pregunta_id')
             )
 
             return JsonResponse({
@@ -132,6 +123,27 @@ def iniciar_conversacion(request):
 
 
 def buscar_respuesta_automatica(mensaje):
+    """Respuesta automática por palabras clave, reutilizando la caché de respuestas"""
+    huella, consulta, prompt_hash = huella_faq(mensaje)
+    cacheada = cache_respuestas.obtener(huella)
+    if cacheada is not None:
+        if cacheada['pregunta_id']:
+            contador_consultas.incrementar(cacheada['pregunta_id'])
+        return {
+            'mensaje': cacheada['respuesta'],
+            'pregunta_id': cacheada['pregunta_id'],
+            'sugerir_ticket': cacheada['sugerir_ticket'],
+        }
+
+    resultado = _buscar_respuesta_automatica(mensaje)
+    cache_respuestas.guardar(
+        huella, 'faq', 'faq', prompt_hash, consulta, resultado['mensaje'],
+        sugerir_ticket=resultado.get('sugerir_ticket', False), pregunta_id=resultado.get('pregunta_id'),
+    )
+    return resultado
+
+
+def _buscar_respuesta_automatica(mensaje):
     """Lógica para buscar respuestas automáticas"""
     mensaje_lower = mensaje.lower()
 
@@ -158,7 +170,7 @@ def buscar_respuesta_automatica(mensaje):
             pregunta.incrementar_consultas()
             return {
                 'mensaje': pregunta.respuesta,
-                'pregunta': pregunta
+                'pregunta_id': pregunta.id
             }
 
     return {
@@ -217,7 +229,7 @@ def chatbot_send(request):
             cache.set(rl_key, cache.get(rl_key, 0) + 1, timeout=window)
 
     # Guardar mensaje de usuario
-    MensajeChatbot.objects.create(
+    mensaje_usuario = MensajeChatbot.objects.create(
         conversacion=conversacion,
         tipo='usuario',
         contenido=message
@@ -229,88 +241,54 @@ def chatbot_send(request):
     # Si hay clave de OpenAI en settings, intentar llamar al servicio
     api_key = getattr(settings, 'OPENAI_API_KEY', None)
     if api_key:
-        # Intentar llamar a la API con reintentos y manejo de errores más fino
-        api_url = 'https://api.openai.com/v1/chat/completions'
-        system_prompt = (
-            "Eres un asistente técnico especializado EXCLUSIVAMENTE en el proyecto de "
-            "telecomunicaciones COBRA-MAX. Responde solo a preguntas relacionadas con este proyecto: "
-            "pagos, facturación, fechas de vencimiento, cortes y reconexiones, problemas técnicos de conexión, "
-            "configuración de clientes, asignación de zonas, notificaciones (email/Twilio), despliegue (Docker, Celery, Redis), "
-            "integraciones y administración del sistema. Si la consulta NO está relacionada con COBRA-MAX o es temática general "
-            "(recetas, política, medicina, etc.), responde exactamente: 'Lo siento, solo puedo responder preguntas relacionadas con el proyecto COBRA-MAX.' "
-            "No inventes información fuera del repositorio ni supongas credenciales. Si no conoces la respuesta, di 'No sé' y sugiere crear un ticket. "
-            "Responde en español de forma concisa y con pasos accionables cuando aplique."
-        )
-
-        body = {
-            'model': getattr(settings, 'OPENAI_MODEL', 'gpt-3.5-turbo'),
-            'messages': [
-                {'role': 'system', 'content': system_prompt},
-                {'role': 'user', 'content': message}
-            ],
-            'max_tokens': 256,
-            'temperature': 0.2,
-        }
-
-        req_data = json.dumps(body).encode('utf-8')
-        req_headers = {
-            'Authorization': f'Bearer {api_key}',
-            'Content-Type': 'application/json'
-        }
-
-        retry_count = getattr(settings, 'CHATBOT_RETRY_COUNT', 2)
-        backoff = getattr(settings, 'CHATBOT_RETRY_BACKOFF', 1)
-        last_exc = None
-        for attempt in range(retry_count + 1):
+        # Preguntas equivalentes ya respondidas se sirven desde la caché
+        respuesta_text = respuesta_openai_cacheada(message)
+    if api_key and respuesta_text is None:
+        # Modo asíncrono: la respuesta la genera Celery y el navegador la consulta
+        # (con el texto parcial mientras llegan los tokens) en chatbot_respuesta
+        # Sólo con caché compartida: el estado lo escribe el worker y lo lee la web
+        if getattr(settings, 'CHATBOT_OPENAI_ASINCRONO', True) and cache_compartida():
             try:
-                req = urllib.request.Request(api_url, data=req_data, headers=req_headers)
-                with urllib.request.urlopen(req, timeout=10) as resp:
-                    resp_data = json.loads(resp.read().decode('utf-8'))
-                respuesta_text = resp_data['choices'][0]['message']['content'].strip()
-                break
-            except urllib.error.HTTPError as e:
-                # Errores HTTP (posible 429 o 5xx)
-                last_exc = e
-                status = getattr(e, 'code', None)
-                logger.error('OpenAI HTTPError (attempt %s): %s', attempt, e)
-                if status == 429:
-                    # Rate limited by OpenAI
-                    respuesta_text = 'Lo siento, el servicio de respuestas está temporalmente sobrecargado. Intenta de nuevo en unos segundos.'
-                    sugerir_ticket = False
-                    # Exponer código de error para frontend
-                    return JsonResponse({'success': False, 'error': 'rate_limited', 'mensaje': respuesta_text}, status=429)
-                # en 5xx intentaremos reintentar
+                cache.set(clave_respuesta(mensaje_usuario.id), {'estado': 'pendiente', 'parcial': ''}, 600)
+                responder_con_openai.delay(mensaje_usuario.id)
+                return JsonResponse({
+                    'success': True,
+                    'pendiente': True,
+                    'mensaje_id': mensaje_usuario.id,
+                    'conversacion_id': conversacion.id,
+                    'poll_url': reverse('chatbot_respuesta', args=[mensaje_usuario.id]),
+                }, status=202)
             except Exception as e:
-                last_exc = e
-                logger.exception('Error llamando a OpenAI (attempt %s): %s', attempt, e)
-            # Esperar antes de reintentar
-            if attempt < retry_count:
-                import time
-                time.sleep(backoff * (attempt + 1))
-
-        else:
-            # Si todos los reintentos fallaron
-            respuesta_text = 'Lo siento, hubo un error al procesar tu consulta. Puedes intentar de nuevo o solicitar atención personalizada.'
+                logger.exception('No se pudo encolar la respuesta OpenAI, se responde en línea: %s', e)
+
+        # Modo en línea: una sola llamada sin reintentos ni esperas, acotada por el cupo global
+        try:
+            respuesta_text = consultar_openai(message)
+            guardar_respuesta_openai(message, respuesta_text)
+        except ImproperlyConfigured as e:
+            # Sin caché compartida no hay cupo global: responder con las preguntas frecuentes
+            logger.error('OpenAI deshabilitado: %s', e)
+            resultado = buscar_respuesta_automatica(message)
+            respuesta_text = resultado.get('mensaje')
+            sugerir_ticket = resultado.get('sugerir_ticket', False)
+        except OpenAISaturado as e:
+            logger.warning('OpenAI saturado: %s', e)
+            # Exponer código de error para frontend
+            return JsonResponse({'success': False, 'error': 'rate_limited', 'mensaje': MENSAJE_SATURADO}, status=429)
+        except OpenAIError as e:
+            respuesta_text = MENSAJE_ERROR_AI
             sugerir_ticket = True
             # Registrar un log con detalle para auditoría
-            logger.error('OpenAI llamadas fallaron completamente. Última excepción: %s', repr(last_exc))
+            logger.error('Llamada a OpenAI falló: %r', e)
             # Si está activada la creación automática de ticket al fallar, crear uno
             if getattr(settings, 'AUTO_TICKET_ON_AI_ERROR', False):
                 try:
-                    ticket = TicketSoporte.objects.create(
-                        conversacion=conversacion,
-                        titulo=f'Falló asistente AI para cliente {cliente.id}',
-                        descripcion=f'Fallo al intentar usar OpenAI: {str(last_exc)}\nMensaje del usuario: {message}',
-                        prioridad='media',
-                        categoria='tecnico',
-                        creado_por=request.user if request.user.is_authenticated else None
-                    )
-                    HistorialTicket.objects.create(ticket=ticket, usuario=request.user if request.user.is_authenticated else None, accion='Ticket generado por fallo AI')
+                    ticket = crear_ticket_fallo_ai(conversacion, request.user, message, e)
                     # Informar al frontend que se creó ticket
                     return JsonResponse({'success': False, 'error': 'ai_unavailable', 'mensaje': respuesta_text, 'ticket_id': ticket.id})
                 except Exception:
                     logger.exception('Error creando ticket automático tras fallo AI')
-    else:
+    elif not api_key:
         # Fallback local: buscar en preguntas frecuentes
         resultado = buscar_respuesta_automatica(message)
         respuesta_text = resultado.get('mensaje')
@@ -331,6 +309,27 @@ def chatbot_send(request):
     })
 
 
+@login_required
+@require_roles(['cliente'])
+def chatbot_respuesta(request, mensaje_id):
+    """Estado de la respuesta asíncrona a un mensaje (texto parcial o final)"""
+    mensaje = get_object_or_404(
+        MensajeChatbot, id=mensaje_id, tipo='usuario', conversacion__cliente__usuario=request.user
+    )
+    estado = cache.get(clave_respuesta(mensaje.id))
+    if estado is None or estado.get('estado') not in ('completada', 'error'):
+        # La base manda: si el mensaje siguiente de la conversación es del bot,
+        # ésa es la respuesta aunque la caché diga otra cosa o haya expirado
+        siguiente = MensajeChatbot.objects.filter(
+            conversacion_id=mensaje.conversacion_id, id__gt=mensaje.id
+        ).order_by('id').first()
+        if siguiente and siguiente.tipo == 'bot':
+            estado = {'estado': 'completada', 'success': True, 'respuesta': siguiente.contenido, 'sugerir_ticket': False}
+        elif estado is None:
+            estado = {'estado': 'pendiente', 'parcial': ''}
+    return JsonResponse({'conversacion_id': mensaje.conversacion_id, **estado})
+
+
 @login_required
 @require_roles(['cliente'])
 @require_POST
@@ -396,9 +395,10 @@ def gestion_preguntas_frecuentes(request):
     preguntas = PreguntaFrecuente.objects.all().order_by('categoria', '-veces_consultada')
 
     # Calcular estadísticas
-    total_preguntas = preguntas.count()
-    preguntas_activas = preguntas.filter(activa=True).count()
-    total_consultas = preguntas.aggregate(total=Sum('veces_consultada'))['total'] or 0
+    stats = estadisticas(preguntas, total=contar(), activas=contar(activa=True), consultas=sumar('veces_consultada'))
+    total_preguntas = stats['total']
+    preguntas_activas = stats['activas']
+    total_consultas = stats['consultas']
 
     context = {
         'preguntas': preguntas,
@@ -465,10 +465,15 @@ def dashboard_tickets(request):
     """Dashboard de tickets de soporte"""
     tickets = TicketSoporte.objects.all().select_related('agente_asignado', 'creado_por')
     
-    total_tickets = tickets.count()
-    tickets_abiertos = tickets.filter(estado='abierto').count()
-    tickets_en_progreso = tickets.filter(estado='en_progreso').count()
-    tickets_resueltos = tickets.filter(estado='resuelto').count()
+    stats = estadisticas(
+        tickets, ttl=ttl_dashboard(),
+        total=contar(), abiertos=contar(estado='abierto'),
+        en_progreso=contar(estado='en_progreso'), resueltos=contar(estado='resuelto'),
+    )
+    total_tickets = stats['total']
+    tickets_abiertos = stats['abiertos']
+    tickets_en_progreso = stats['en_progreso']
+    tickets_resueltos = stats['resueltos']
     
     context = {
         'tickets': tickets,
@@ -4,9 +4,10 @@ from .models import Cliente
 
 @admin.register(Cliente)
 class ClienteAdmin(admin.ModelAdmin):
-    list_display = ('dni', 'nombre_completo', 'zona', 'estado', 'deuda_actual', 'cobrador_asignado', 'fecha_instalacion')
+    list_display = ('dni', 'nombre_completo', 'zona', 'estado', 'deuda_actual', 'cobrador_nombre', 'fecha_instalacion')
+    list_select_related = ('zona',)
     list_filter = ('estado', 'zona', 'fecha_instalacion')
-    search_fields = ('dni', 'usuario__first_name', 'usuario__last_name', 'direccion')
+    search_fields = ('dni', 'nombre_mostrado', 'direccion')
     list_editable = ('estado',)
     readonly_fields = ('fecha_creacion', 'fecha_actualizacion')
     
@@ -32,4 +33,16 @@ class ClienteAdmin(admin.ModelAdmin):
     def save_model(self, request, obj, form, change):
         if not obj.creado_por:
             obj.creado_por = request.user
+        # Un cambio manual de deuda se asienta en el libro como ajuste
+        if change and 'deuda_actual' in form.changed_data:
+            from cobranza.services import registrar_movimiento
+
+            # save() no escribe deuda_actual; la diferencia se toma del saldo en la base
+            super().save_model(request, obj, form, change)
+            actual = Cliente.objects.values_list('deuda_actual', flat=True).get(pk=obj.pk)
+            movimiento = registrar_movimiento(
+                obj.pk, 'ajuste', obj.deuda_actual - actual, 'Ajuste manual desde el administrador', usuario=request.user,
+            )
+            obj.deuda_actual = movimiento.saldo_posterior
+            return
         super().save_model(request, obj, form, change)
\ No newline at end of file
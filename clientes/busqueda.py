@@ -0,0 +1,187 @@
+# clientes/busqueda.py
+import bisect
+import re
+import threading
+import time
+import unicodedata
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+INDICE_VERSION_KEY = 'clientes:indice_busqueda:version'
+
+# Campos de Cliente (y de su usuario) que forman el texto de búsqueda
+CAMPOS_BUSQUEDA = (
+    'nombre', 'apellido', 'dni', 'ruc', 'telefono_principal', 'telefono_secundario', 'telefono', 'email',
+)
+CAMPOS_USUARIO = ('first_name', 'last_name', 'email')
+
+
+def normalizar(texto):
+    """Minúsculas y sin tildes; conserva @ . _ + - para que un email siga siendo una palabra"""
+    texto = unicodedata.normalize('NFKD', (texto or '').lower())
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return ' '.join(re.findall(r'[\w@.+-]+', texto))
+
+
+def palabras(*valores):
+    """Palabras indexables de `valores`, sin repetir.
+
+    Un email o un teléfono con separadores se indexan completos y también
+    por partes ("ana.rios@mail.com" → ana.rios@mail.com, ana, rios, mail, com;
+    "987 654 321" → 987, 654, 321, 987654321).
+    """
+    vistas = {}
+    for valor in valores:
+        texto = normalizar(valor)
+        for palabra in texto.split():
+            vistas.setdefault(palabra)
+            for parte in re.split(r'[@._+-]+', palabra):
+                if parte:
+                    vistas.setdefault(parte)
+        digitos = re.sub(r'\D', '', texto)
+        if len(digitos) >= 6 and digitos not in vistas:
+            vistas.setdefault(digitos)
+    return list(vistas)
+
+
+def texto_busqueda(valores):
+    """Contenido de la columna `Cliente.busqueda` a partir de un dict campo→valor.
+
+    Las palabras van separadas y rodeadas por espacios, así que " <prefijo>"
+    busca palabras que empiezan por el prefijo con un simple LIKE.
+    """
+    lista = palabras(*(valores.get(campo) for campo in CAMPOS_BUSQUEDA + tuple(f'usuario__{c}' for c in CAMPOS_USUARIO)))
+    return f" {' '.join(lista)} " if lista else ''
+
+
+def valores_cliente(cliente):
+    valores = {campo: getattr(cliente, campo) for campo in CAMPOS_BUSQUEDA}
+    usuario = cliente.usuario if cliente.usuario_id else None
+    for campo in CAMPOS_USUARIO:
+        valores[f'usuario__{campo}'] = getattr(usuario, campo, '')
+    return valores
+
+
+class IndicePrefijos:
+    """Índice en memoria de prefijos de palabra → ids de cliente.
+
+    Es un trie aplanado: las palabras ordenadas en una lista, de modo que
+    todas las que empiezan por un prefijo forman un tramo contiguo que se
+    ubica con dos búsquedas binarias. Ocupa bastante menos que un trie de
+    nodos para 100k clientes y admite altas y bajas incrementales.
+    """
+
+    def __init__(self, filas=()):
+        pares = sorted(
+            (palabra, pk) for pk, texto in filas for palabra in set(texto.split())
+        )
+        self.palabras = [palabra for palabra, _ in pares]
+        self.ids = [pk for _, pk in pares]
+        self.por_cliente = {}
+        for palabra, pk in pares:
+            self.por_cliente.setdefault(pk, []).append(palabra)
+
+    def _tramo(self, prefijo):
+        inicio = bisect.bisect_left(self.palabras, prefijo)
+        fin = bisect.bisect_left(self.palabras, prefijo + '\uffff', inicio)
+        return inicio, fin
+
+    def quitar(self, pk):
+        for palabra in self.por_cliente.pop(pk, ()):
+            inicio = bisect.bisect_left(self.palabras, palabra)
+            fin = bisect.bisect_right(self.palabras, palabra, inicio)
+            for i in range(inicio, fin):
+                if self.ids[i] == pk and self.palabras[i] == palabra:
+                    del self.palabras[i], self.ids[i]
+                    break
+
+    def poner(self, pk, texto):
+        self.quitar(pk)
+        unicas = sorted(set(texto.split()))
+        for palabra in unicas:
+            i = bisect.bisect_right(self.palabras, palabra)
+            self.palabras.insert(i, palabra)
+            self.ids.insert(i, pk)
+        if unicas:
+            self.por_cliente[pk] = unicas
+
+    def buscar(self, prefijos, limite):
+        """Los `limite` ids más bajos cuyas palabras cubren todos los prefijos"""
+        tramos = sorted((self._tramo(p) for p in prefijos), key=lambda t: t[1] - t[0])
+        candidatos = None
+        for inicio, fin in tramos:
+            ids = set(self.ids[inicio:fin])
+            candidatos = ids if candidatos is None else candidatos & ids
+            if not candidatos:
+                return []
+        return sorted(candidatos)[:limite]
+
+
+_indice = None
+_indice_version = None
+_indice_revisado = 0.0
+_indice_lock = threading.Lock()
+
+
+def usar_indice_memoria():
+    """True si la búsqueda con límite usa el índice en memoria (por defecto, fuera de PostgreSQL)"""
+    valor = getattr(settings, 'CLIENTES_BUSQUEDA_MEMORIA', None)
+    return connection.vendor != 'postgresql' if valor is None else valor
+
+
+def obtener_indice():
+    """Índice del proceso; se reconstruye si otro proceso cambió la versión.
+
+    La versión vive en la caché compartida y se revisa cada
+    `CLIENTES_INDICE_REVISION` segundos, como el índice de FAQ del chatbot.
+    """
+    global _indice, _indice_version, _indice_revisado
+    ahora = time.monotonic()
+    revision = getattr(settings, 'CLIENTES_INDICE_REVISION', 5)
+    if _indice is not None and ahora - _indice_revisado < revision:
+        return _indice
+    version = cache.get(INDICE_VERSION_KEY, 0)
+    with _indice_lock:
+        if _indice is None or version != _indice_version:
+            from .models import Cliente
+
+            filas = Cliente.objects.exclude(busqueda='').values_list('pk', 'busqueda').order_by().iterator(chunk_size=5000)
+            _indice = IndicePrefijos(filas)
+            _indice_version = version
+        _indice_revisado = ahora
+        return _indice
+
+
+def actualizar_indice(pk, texto=''):
+    """Aplica el cambio de un cliente al índice local y avisa a los demás procesos.
+
+    El proceso que hizo el cambio no reconstruye su índice salvo que otro
+    proceso haya cambiado la versión entre medio.
+    """
+    global _indice_version
+    try:
+        version = cache.incr(INDICE_VERSION_KEY)
+    except ValueError:
+        cache.set(INDICE_VERSION_KEY, 1, None)
+        version = 1
+    with _indice_lock:
+        if _indice is None:
+            return
+        if texto:
+            _indice.poner(pk, texto)
+        else:
+            _indice.quitar(pk)
+        if _indice_version is not None and version == _indice_version + 1:
+            _indice_version = version
+
+
+def invalidar_indice():
+    """Descarta el índice local y avisa a los demás procesos (p.ej. tras un bulk_create)"""
+    global _indice
+    with _indice_lock:
+        _indice = None
+    try:
+        cache.incr(INDICE_VERSION_KEY)
+    except ValueError:
+        cache.set(INDICE_VERSION_KEY, 1, None)
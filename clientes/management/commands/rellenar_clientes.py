@@ -0,0 +1,25 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from clientes.models import Cliente
+from clientes.services import rellenar_denormalizados
+from zonas.models import Zona
+
+
+class Command(BaseCommand):
+    help = 'Recalcula en bloque nombre_mostrado, cobrador y cobrador_nombre de todos los clientes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help='Clientes actualizados por UPDATE')
+
+    def handle(self, *args, **options):
+        def progreso(hasta_id, actualizados):
+            self.stdout.write(f'  hasta id {hasta_id}: {actualizados} clientes')
+
+        resultado = rellenar_denormalizados(
+            Cliente, get_user_model(), Zona, chunk_size=options['chunk_size'], on_chunk=progreso,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"{resultado['actualizados']} clientes actualizados en {resultado['chunks']} bloques "
+            f"({resultado['segundos']} s)"
+        ))
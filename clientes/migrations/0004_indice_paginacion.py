@@ -0,0 +1,20 @@
+# Generated by Django 5.0.2 on 2026-10-18 00:53
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientes', '0003_add_caserio'),
+        ('zonas', '0005_create_hierarchy'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(fields=['-fecha_creacion', '-id'], name='clientes_cl_fecha_c_1a9e1d_idx'),
+        ),
+    ]
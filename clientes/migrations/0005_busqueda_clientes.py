@@ -0,0 +1,61 @@
+# Generated by Django 5.0.2 on 2026-10-18 01:10
+
+import django.contrib.postgres.indexes
+from django.conf import settings
+from django.db import migrations, models
+
+
+class AddIndexPostgres(migrations.AddIndex):
+    """AddIndex que sólo toca la base de datos en PostgreSQL (GIN no existe en SQLite)"""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+def crear_extension_trigramas(apps, schema_editor):
+    # pg_trgm da soporte de índice a LIKE '%...%'; sin efecto fuera de PostgreSQL
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+
+def llenar_busqueda(apps, schema_editor):
+    from clientes.busqueda import CAMPOS_BUSQUEDA, CAMPOS_USUARIO, texto_busqueda
+
+    Cliente = apps.get_model('clientes', 'Cliente')
+    campos = ['pk', *CAMPOS_BUSQUEDA, *(f'usuario__{c}' for c in CAMPOS_USUARIO)]
+    lote = []
+    for valores in Cliente.objects.values(*campos).order_by().iterator(chunk_size=2000):
+        lote.append(Cliente(pk=valores['pk'], busqueda=texto_busqueda(valores)))
+        if len(lote) >= 2000:
+            Cliente.objects.bulk_update(lote, ['busqueda'])
+            lote = []
+    if lote:
+        Cliente.objects.bulk_update(lote, ['busqueda'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientes', '0004_indice_paginacion'),
+        ('zonas', '0005_create_hierarchy'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_extension_trigramas, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='cliente',
+            name='busqueda',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(llenar_busqueda, migrations.RunPython.noop),
+        AddIndexPostgres(
+            model_name='cliente',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['busqueda'], name='clientes_busqueda_trgm', opclasses=['gin_trgm_ops']),
+        ),
+    ]
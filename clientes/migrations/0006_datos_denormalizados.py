@@ -0,0 +1,51 @@
+# Generated by Django 5.0.2 on 2026-10-18 01:15
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def rellenar(apps, schema_editor):
+    from clientes.services import rellenar_denormalizados
+
+    rellenar_denormalizados(
+        apps.get_model('clientes', 'Cliente'),
+        apps.get_model(*settings.AUTH_USER_MODEL.split('.')),
+        apps.get_model('zonas', 'Zona'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientes', '0005_busqueda_clientes'),
+        ('zonas', '0005_create_hierarchy'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='cliente',
+            options={'ordering': ['nombre_mostrado'], 'verbose_name': 'Cliente', 'verbose_name_plural': 'Clientes'},
+        ),
+        migrations.AddField(
+            model_name='cliente',
+            name='cobrador',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='clientes_asignados', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='cliente',
+            name='cobrador_nombre',
+            field=models.CharField(blank=True, default='', editable=False, max_length=301),
+        ),
+        migrations.AddField(
+            model_name='cliente',
+            name='nombre_mostrado',
+            field=models.CharField(blank=True, default='', editable=False, max_length=301),
+        ),
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(fields=['nombre_mostrado'], name='clientes_cl_nombre__f582ed_idx'),
+        ),
+        migrations.RunPython(rellenar, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,38 @@
 from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.postgres.indexes import GinIndex
 from django.db import models
+from .services import nombre_de_cobrador, nombre_de_usuario
+from .busqueda import (
+    CAMPOS_BUSQUEDA, actualizar_indice, normalizar, obtener_indice, texto_busqueda, usar_indice_memoria, valores_cliente,
+)
+
+
+class ClienteQuerySet(models.QuerySet):
+    def visible_to(self, user):
+        """Clientes que `user` puede ver según su alcance (ver zonas.services)"""
+        from zonas.services import alcance_de
+
+        return self.filter(alcance_de(user).filtro_clientes(None))
+
+    def search(self, q, limit=None):
+        """Clientes cuyo nombre, DNI/RUC, teléfono o email empiezan por las palabras de `q`.
+
+        Cada palabra de la consulta debe ser prefijo de alguna palabra de la
+        columna `busqueda`. Con `limit` devuelve los `limit` primeros por id:
+        fuera de PostgreSQL se resuelve con el índice en memoria
+        (clientes.busqueda) y en PostgreSQL con un LIKE sobre el índice de
+        trigramas. Sin `limit` devuelve un queryset filtrable y paginable.
+        """
+        prefijos = normalizar(q).split()
+        if not prefijos:
+            return self.none()
+        if limit and usar_indice_memoria():
+            return self.filter(pk__in=obtener_indice().buscar(prefijos, limit)).order_by('pk')
+        clientes = self
+        for prefijo in prefijos:
+            clientes = clientes.filter(busqueda__contains=f' {prefijo}')
+        return clientes.order_by('pk')[:limit] if limit else clientes
 
 
 class Cliente(models.Model):
@@ -59,6 +92,24 @@ class Cliente(models.Model):
         limit_choices_to={'tipo_usuario__in': ['admin', 'oficina']},
     )
 
+    # Copias denormalizadas para listados (se mantienen con señales sobre
+    # Usuario y Zona; ver clientes.services): nombre del usuario y cobrador
+    # actual de la zona, para no consultar usuario y zona.cobrador por fila
+    nombre_mostrado = models.CharField(max_length=301, blank=True, default='', editable=False)
+    cobrador = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name='clientes_asignados',
+        editable=False,
+    )
+    cobrador_nombre = models.CharField(max_length=301, blank=True, default='', editable=False)
+
+    # Texto normalizado de nombre, DNI/RUC, teléfonos y emails (ver clientes.busqueda);
+    # se recalcula al guardar y no se edita a mano
+    busqueda = models.TextField(blank=True, default='', editable=False)
+
     zona = models.ForeignKey(
         'zonas.Zona',
         on_delete=models.PROTECT,
@@ -74,21 +125,64 @@ class Cliente(models.Model):
         verbose_name='Caserío asignado'
     )
 
+    objects = ClienteQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Cliente'
         verbose_name_plural = 'Clientes'
-        ordering = ['usuario__first_name', 'usuario__last_name']
+        ordering = ['nombre_mostrado']
         indexes = [
             models.Index(fields=['dni'], name='clientes_cl_dni_5e5da9_idx'),
             models.Index(fields=['estado'], name='clientes_cl_estado_54796b_idx'),
             models.Index(fields=['zona'], name='clientes_cl_zona_id_5f7775_idx'),
+            # Paginación por cursor (fecha_creacion, id)
+            models.Index(fields=['-fecha_creacion', '-id']),
+            models.Index(fields=['nombre_mostrado']),
+            # Búsqueda por prefijo/subcadena (LIKE) en PostgreSQL
+            GinIndex(fields=['busqueda'], opclasses=['gin_trgm_ops'], name='clientes_busqueda_trgm'),
         ]
 
     def __str__(self):
         return self.nombre_completo()
 
+    def save(self, *args, **kwargs):
+        # deuda_actual sólo cambia con UPDATE atómicos desde el libro: un
+        # guardado completo de una instancia leída antes no debe pisarla
+        if kwargs.get('update_fields') is None and not self._state.adding and not kwargs.get('force_insert'):
+            diferidos = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name != 'deuda_actual' and f.attname not in diferidos
+            ]
+        update_fields = kwargs.get('update_fields')
+        extra = set()
+        # Copias del nombre del usuario y del cobrador de la zona
+        if update_fields is None or 'usuario' in update_fields:
+            self.nombre_mostrado = nombre_de_usuario(self.usuario if self.usuario_id else None)
+            extra.add('nombre_mostrado')
+        if update_fields is None or 'zona' in update_fields:
+            cobrador = None
+            if self.zona_id:
+                cobrador = get_user_model().objects.filter(zona__pk=self.zona_id).only('first_name', 'last_name', 'username').first()
+            self.cobrador = cobrador
+            self.cobrador_nombre = nombre_de_cobrador(cobrador)
+            extra.update(('cobrador', 'cobrador_nombre'))
+        if update_fields is not None and extra:
+            kwargs['update_fields'] = update_fields = {*update_fields, *extra}
+
+        # Recalcular la columna de búsqueda si cambió alguno de sus campos
+        if update_fields is None or set(update_fields) & {*CAMPOS_BUSQUEDA, 'usuario', 'busqueda'}:
+            texto = texto_busqueda(valores_cliente(self))
+            self._busqueda_cambio = self._state.adding or texto != self.busqueda
+            self.busqueda = texto
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'busqueda'}
+        super().save(*args, **kwargs)
+
     def nombre_completo(self):
-        # Intentar usar get_full_name del user model, si existe y devuelve algo
+        # Copia denormalizada; solo un cliente aún sin guardar consulta al usuario
+        if self.pk is not None:
+            return self.nombre_mostrado
         try:
             full = getattr(self.usuario, 'get_full_name', None)
             if callable(full):
@@ -103,11 +197,54 @@ class Cliente(models.Model):
         return f"{first} {last}".strip()
 
     def cobrador_asignado(self):
-        # Dejar una referencia segura a cobrador si existe en la zona
-        try:
-            return getattr(self.zona, 'cobrador', None)
-        except Exception:
-            return None
+        # Cobrador de la zona (copia en `cobrador`; usar `cobrador_nombre` para mostrarlo)
+        return self.cobrador
 
     # Nota: Ya no usamos propiedades Python para compatibilidad; los
     # campos están presentes en la BD como columnas reales.
+
+
+# Mantener el índice de búsqueda (columna y copia en memoria) al día
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+
+@receiver(post_save, sender=Cliente)
+def cliente_post_save_busqueda(sender, instance, **kwargs):
+    if getattr(instance, '_busqueda_cambio', False) and usar_indice_memoria():
+        pk, texto = instance.pk, instance.busqueda
+        transaction.on_commit(lambda: actualizar_indice(pk, texto))
+    instance._busqueda_cambio = False
+
+
+@receiver(post_delete, sender=Cliente)
+def cliente_post_delete_busqueda(sender, instance, **kwargs):
+    if usar_indice_memoria():
+        pk = instance.pk
+        transaction.on_commit(lambda: actualizar_indice(pk))
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def usuario_post_save_cliente(sender, instance, created, update_fields=None, **kwargs):
+    # El nombre y el email del usuario se copian en nombre_mostrado,
+    # cobrador_nombre y la columna de búsqueda de sus clientes
+    if created or (update_fields is not None and not set(update_fields) & {'first_name', 'last_name', 'email', 'username'}):
+        return
+    cliente = Cliente.objects.filter(usuario_id=instance.pk).first()
+    if cliente is not None:
+        cliente.usuario = instance
+        if (nombre_de_usuario(instance) != cliente.nombre_mostrado
+                or texto_busqueda(valores_cliente(cliente)) != cliente.busqueda):
+            cliente.save(update_fields=['usuario'])
+    nombre = nombre_de_cobrador(instance)
+    Cliente.objects.filter(cobrador_id=instance.pk).exclude(cobrador_nombre=nombre).update(cobrador_nombre=nombre)
+
+
+@receiver(post_save, sender='zonas.Zona')
+def zona_post_save_cobrador(sender, instance, **kwargs):
+    # Un cambio de cobrador se propaga a los clientes de la zona en un solo UPDATE
+    nombre = nombre_de_cobrador(instance.cobrador)
+    Cliente.objects.filter(zona_id=instance.pk).exclude(
+        models.Q(cobrador_id=instance.cobrador_id) & models.Q(cobrador_nombre=nombre)
+    ).update(cobrador_id=instance.cobrador_id, cobrador_nombre=nombre)
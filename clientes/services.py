@@ -0,0 +1,65 @@
+# clientes/services.py
+import time
+from django.db.models import CharField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Concat, NullIf, Trim
+
+
+def nombre_de_usuario(usuario):
+    """Nombre completo tal como lo guarda `Cliente.nombre_mostrado` ('' sin nombre)"""
+    if usuario is None:
+        return ''
+    return f"{usuario.first_name or ''} {usuario.last_name or ''}".strip()
+
+
+def nombre_de_cobrador(usuario):
+    """Nombre del cobrador como lo muestran las plantillas (nombre completo o username)"""
+    if usuario is None:
+        return ''
+    return nombre_de_usuario(usuario) or usuario.username
+
+
+def _nombre_sql(prefijo=''):
+    return Trim(Concat(f'{prefijo}first_name', Value(' '), f'{prefijo}last_name', output_field=CharField()))
+
+
+def expresiones_denormalizadas(Usuario, Zona):
+    """Expresiones de UPDATE que recalculan nombre_mostrado, cobrador y cobrador_nombre.
+
+    Reciben los modelos para poder usarse también desde migraciones con
+    los modelos históricos.
+    """
+    usuario = Usuario.objects.filter(pk=OuterRef('usuario_id'))
+    zona = Zona.objects.filter(pk=OuterRef('zona_id'))
+    return {
+        'nombre_mostrado': Coalesce(Subquery(usuario.values(n=_nombre_sql())[:1]), Value('')),
+        'cobrador_id': Subquery(zona.values('cobrador_id')[:1]),
+        'cobrador_nombre': Coalesce(
+            Subquery(zona.values(n=Coalesce(NullIf(_nombre_sql('cobrador__'), Value('')), 'cobrador__username'))[:1]),
+            Value(''),
+        ),
+    }
+
+
+def rellenar_denormalizados(Cliente, Usuario, Zona, chunk_size=5000, on_chunk=None):
+    """Recalcula las columnas denormalizadas de todos los clientes por bloques de ids.
+
+    Cada bloque es un único UPDATE con subconsultas (sin cargar filas en
+    Python). `on_chunk(hasta_id, actualizados)` se llama tras cada bloque.
+    Devuelve {'actualizados', 'chunks', 'segundos'}.
+    """
+    inicio = time.monotonic()
+    expresiones = expresiones_denormalizadas(Usuario, Zona)
+    ids = Cliente.objects.order_by('pk').values_list('pk', flat=True)
+    actualizados = chunks = 0
+    desde = 0
+    while True:
+        bloque = list(ids.filter(pk__gt=desde)[:chunk_size])
+        if not bloque:
+            break
+        n = Cliente.objects.filter(pk__gt=desde, pk__lte=bloque[-1]).update(**expresiones)
+        actualizados += n
+        chunks += 1
+        desde = bloque[-1]
+        if on_chunk:
+            on_chunk(desde, n)
+    return {'actualizados': actualizados, 'chunks': chunks, 'segundos': round(time.monotonic() - inicio, 2)}
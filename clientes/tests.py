@@ -1,3 +1,164 @@
-from django.test import TestCase
+from io import StringIO
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from zonas.models import Zona
+from . import busqueda
+from .models import Cliente
 
-# Create your tests here.
+
+class BusquedaClientesTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		busqueda._indice = None
+		User = get_user_model()
+		self.admin = User.objects.create_user(username='adm', password='x', tipo_usuario='admin')
+		self.zona = Zona.objects.create(nombre='Norte', codigo='N')
+		self.ana = self._crear('ana', 'Ana María', 'Ríos', '40123456', '987 654 321', 'ana.rios@correo.pe')
+		self.jose = self._crear('jose', 'José', 'Anaya', '40999888', '912345678', 'jose@correo.pe')
+
+	def tearDown(self):
+		busqueda._indice = None
+		cache.clear()
+
+	def _crear(self, username, nombre, apellido, dni, telefono, email):
+		user = get_user_model().objects.create_user(
+			username=username, password='x', first_name=nombre, last_name=apellido, email=email,
+		)
+		return Cliente.objects.create(
+			usuario=user, dni=dni, telefono_principal=telefono, direccion='Calle', zona=self.zona,
+			fecha_instalacion='2025-01-01',
+		)
+
+	def _buscar(self, q, limit=None):
+		return [c.dni for c in Cliente.objects.search(q, limit)]
+
+	def test_columna_normalizada(self):
+		self.assertIn(' maria ', self.ana.busqueda)
+		self.assertIn(' ana.rios@correo.pe ', self.ana.busqueda)
+		self.assertIn(' 987654321 ', self.ana.busqueda)
+
+	def test_busqueda_por_prefijos(self):
+		for limite in (None, 10):
+			self.assertEqual(self._buscar('ANA', limite), ['40123456', '40999888'])
+			self.assertEqual(self._buscar('ana rio', limite), ['40123456'])
+			self.assertEqual(self._buscar('josé', limite), ['40999888'])
+			self.assertEqual(self._buscar('4099', limite), ['40999888'])
+			self.assertEqual(self._buscar('987654', limite), ['40123456'])
+			self.assertEqual(self._buscar('jose@corr', limite), ['40999888'])
+			self.assertEqual(self._buscar('xyz', limite), [])
+		self.assertEqual(self._buscar('  '), [])
+
+	@override_settings(CLIENTES_BUSQUEDA_MEMORIA=True, CLIENTES_INDICE_REVISION=0)
+	def test_indice_en_memoria_incremental(self):
+		with self.assertNumQueries(2):
+			# Construcción del índice + lectura de los clientes encontrados
+			self.assertEqual(self._buscar('ana', 10), ['40123456', '40999888'])
+		with self.assertNumQueries(1):
+			self.assertEqual(self._buscar('ana', 1), ['40123456'])
+
+		user = self.jose.usuario
+		user.first_name = 'Pepe'
+		user.email = 'pepe@correo.pe'
+		with self.captureOnCommitCallbacks(execute=True):
+			user.save()
+		self.assertEqual(self._buscar('pepe anaya', 10), ['40999888'])
+		self.assertEqual(self._buscar('jose', 10), [])
+
+		with self.captureOnCommitCallbacks(execute=True):
+			self.ana.delete()
+		self.assertEqual(self._buscar('ana', 10), ['40999888'])
+
+	def test_guardado_parcial_no_recalcula(self):
+		Cliente.objects.filter(pk=self.ana.pk).update(busqueda=' marcada ')
+		cliente = Cliente.objects.get(pk=self.ana.pk)
+		cliente.estado = 'moroso'
+		cliente.save(update_fields=['estado'])
+		self.assertEqual(Cliente.objects.get(pk=self.ana.pk).busqueda, ' marcada ')
+		cliente.telefono_principal = '955000111'
+		cliente.save(update_fields=['telefono_principal'])
+		self.assertIn(' 955000111 ', Cliente.objects.get(pk=self.ana.pk).busqueda)
+
+	def test_autocomplete_y_lista(self):
+		self.client.force_login(self.admin)
+		resp = self.client.get(reverse('api_clientes_autocomplete'), {'q': 'rios'})
+		resultados = resp.json()['results']
+		self.assertEqual([r['id'] for r in resultados], [self.ana.pk])
+		self.assertEqual(resultados[0]['nombre'], 'Ana María Ríos')
+		resp = self.client.get(reverse('lista_clientes'), {'busqueda': '40999'})
+		self.assertEqual(list(resp.context['clientes']), [self.jose])
+
+
+class DatosDenormalizadosTests(TestCase):
+	def setUp(self):
+		User = get_user_model()
+		self.admin = User.objects.create_user(username='adm', password='x', tipo_usuario='admin', is_staff=True, is_superuser=True)
+		self.cobrador = User.objects.create_user(username='cob', password='x', tipo_usuario='cobrador', first_name='Luis', last_name='Paz')
+		self.zona = Zona.objects.create(nombre='Norte', codigo='N', cobrador=self.cobrador)
+		self.otra = Zona.objects.create(nombre='Sur', codigo='S')
+
+	def _crear(self, i, zona=None):
+		user = get_user_model().objects.create_user(username=f'cli{i}', password='x', first_name='Cliente', last_name=str(i))
+		return Cliente.objects.create(
+			usuario=user, dni=f'3{i:07d}', telefono_principal='900000000', direccion='Calle',
+			zona=zona or self.zona, fecha_instalacion='2025-01-01',
+		)
+
+	def _recargar(self, cliente):
+		return Cliente.objects.get(pk=cliente.pk)
+
+	def test_copias_al_crear_y_propagacion(self):
+		cliente = self._crear(1)
+		self.assertEqual((cliente.nombre_mostrado, cliente.cobrador_id, cliente.cobrador_nombre), ('Cliente 1', self.cobrador.pk, 'Luis Paz'))
+
+		cliente.usuario.first_name = 'Ana'
+		cliente.usuario.save()
+		self.assertEqual(self._recargar(cliente).nombre_completo(), 'Ana 1')
+
+		self.cobrador.first_name = 'Lucho'
+		self.cobrador.save()
+		self.assertEqual(self._recargar(cliente).cobrador_nombre, 'Lucho Paz')
+
+		self.zona.cobrador = None
+		self.zona.save()
+		self.assertEqual((self._recargar(cliente).cobrador_id, self._recargar(cliente).cobrador_nombre), (None, ''))
+
+		cliente = self._recargar(cliente)
+		self.otra.cobrador = self.cobrador
+		self.otra.save()
+		cliente.zona = self.otra
+		cliente.save(update_fields=['zona'])
+		self.assertEqual(self._recargar(cliente).cobrador_asignado(), self.cobrador)
+
+	def test_comando_rellena_en_bloque(self):
+		clientes = [self._crear(i) for i in range(5)]
+		Cliente.objects.update(nombre_mostrado='', cobrador=None, cobrador_nombre='')
+		salida = StringIO()
+		with self.assertNumQueries(7):
+			# 3 bloques (lectura de ids + UPDATE) y la lectura final vacía
+			call_command('rellenar_clientes', '--chunk-size', '2', stdout=salida)
+		self.assertIn('5 clientes actualizados en 3 bloques', salida.getvalue())
+		self.assertEqual(
+			sorted(Cliente.objects.values_list('nombre_mostrado', 'cobrador_nombre')),
+			[(f'Cliente {i}', 'Luis Paz') for i in range(len(clientes))],
+		)
+
+	@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+	def test_listados_sin_consultas_por_fila(self):
+		self.client.force_login(self.admin)
+		urls = [reverse('lista_clientes'), reverse('admin:clientes_cliente_changelist')]
+
+		def consultas(url):
+			with CaptureQueriesContext(connection) as ctx:
+				self.assertEqual(self.client.get(url).status_code, 200)
+			return len(ctx.captured_queries)
+
+		self._crear(0)
+		base = [consultas(url) for url in urls]
+		for i in range(1, 15):
+			self._crear(i)
+		self.assertEqual([consultas(url) for url in urls], base)
@@ -2,17 +2,18 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Q
+from django.http import JsonResponse
 from .models import Cliente
 from .forms import ClienteForm
 from zonas.models import Zona
 from usuarios.decorators import require_roles
+from cobramax_core.paginacion import paginar_por_cursor
 
 
 @login_required
 @require_roles(['admin', 'oficina'])
 def lista_clientes(request):
-    clientes = Cliente.objects.select_related('zona', 'usuario').order_by('-fecha_creacion')
+    clientes = Cliente.objects.select_related('zona')
     
     # Filtros
     busqueda = request.GET.get('busqueda')
@@ -20,12 +21,8 @@ def lista_clientes(request):
     estado = request.GET.get('estado')
     
     if busqueda:
-        clientes = clientes.filter(
-            Q(usuario__first_name__icontains=busqueda) |
-            Q(usuario__last_name__icontains=busqueda) |
-            Q(dni__icontains=busqueda) |
-            Q(telefono_principal__icontains=busqueda)
-        )
+        # Columna de búsqueda normalizada: sin JOIN a usuario ni OR de icontains
+        clientes = clientes.search(busqueda)
     
     if zona_id:
         clientes = clientes.filter(zona_id=zona_id)
@@ -33,10 +30,24 @@ def lista_clientes(request):
     if estado:
         clientes = clientes.filter(estado=estado)
     
+    # Página actual por cursor (fecha_creacion, id); ?formato=json para scroll infinito
+    pagina = paginar_por_cursor(request, clientes, ('-fecha_creacion', '-id'))
+    if request.GET.get('formato') == 'json':
+        return JsonResponse(pagina.como_json(lambda cliente: {
+            'id': cliente.id,
+            'nombre': cliente.nombre_completo(),
+            'dni': cliente.dni,
+            'telefono': cliente.telefono_principal,
+            'zona': cliente.zona.nombre if cliente.zona else None,
+            'estado': cliente.estado,
+            'monto_mensual': float(cliente.monto_mensual),
+        }))
+    
     zonas = Zona.objects.all()
     
     context = {
-        'clientes': clientes,
+        'clientes': pagina.objetos,
+        'pagina': pagina,
         'zonas': zonas,
         'busqueda': busqueda,
         'zona_filtro': zona_id,
@@ -0,0 +1,209 @@
+# cobramax_core/benchmarks.py
+import time
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test import RequestFactory, override_settings
+from django.urls import resolve, reverse
+from django.utils import timezone
+from .instrumentacion import medir, percentil
+
+BENCHMARKS = {}
+
+
+def benchmark(nombre, **ajustes):
+    """Registra un benchmark.
+
+    La función recibe el admin temporal del benchmark, prepara lo que haga
+    falta (sin medir) y retorna el callable que se cronometra, o None si no
+    hay datos para ejecutarlo. `ajustes` son settings que se aplican durante
+    la preparación y la medición.
+    """
+    def registrar(funcion):
+        BENCHMARKS[nombre] = (funcion, ajustes)
+        return funcion
+    return registrar
+
+
+def _vista(nombre_url, usuario, **params):
+    """Callable que ejecuta la vista directamente, sin middleware ni servidor de pruebas"""
+    request = RequestFactory().get(reverse(nombre_url), params)
+    request.user = usuario
+    vista = resolve(request.path_info).func
+
+    def ejecutar():
+        respuesta = vista(request)
+        if respuesta.status_code != 200:
+            raise RuntimeError(f'{nombre_url} respondió {respuesta.status_code}')
+    return ejecutar
+
+
+# Las vistas se miden con las estadísticas sin caché y sin el manifiesto de
+# estáticos (que solo existe tras collectstatic)
+VISTAS = {'ESTADISTICAS_CACHE_TTL': 0, 'STATICFILES_STORAGE': 'django.contrib.staticfiles.storage.StaticFilesStorage'}
+
+
+@benchmark('ciclo_cobranza')
+def _ciclo_cobranza(admin):
+    from cobranza.services import ejecutar_ciclo_cobranza
+
+    return lambda: ejecutar_ciclo_cobranza(11)
+
+
+@benchmark('dashboard_reportes', **VISTAS)
+def _dashboard_reportes(admin):
+    return _vista('dashboard_reportes', admin)
+
+
+@benchmark('reporte_ingresos', **VISTAS)
+def _reporte_ingresos(admin):
+    hoy = timezone.localdate()
+    return _vista('reporte_ingresos', admin, fecha_desde=(hoy - timedelta(days=365)).isoformat(), fecha_hasta=hoy.isoformat())
+
+
+@benchmark('lista_pagos', **VISTAS)
+def _lista_pagos(admin):
+    return _vista('lista_pagos', admin)
+
+
+@benchmark('lista_pagos_cobrador', **VISTAS)
+def _lista_pagos_cobrador(admin):
+    from zonas.models import Zona
+
+    zona = Zona.objects.filter(cobrador__isnull=False, activa=True).select_related('cobrador').order_by('pk').first()
+    return _vista('lista_pagos', zona.cobrador) if zona else None
+
+
+@benchmark(
+    'enviar_notificaciones', NOTIFICACIONES_TRANSPORTE='fake', NOTIFICACIONES_FAKE_LATENCIA=0,
+    NOTIFICACIONES_FAKE_TASA_ERROR=0, NOTIFICACIONES_LIMITES={}, NOTIFICACIONES_LIMITES_REMITENTE={},
+)
+def _enviar_notificaciones(admin, cantidad=500):
+    from clientes.models import Cliente
+    from notificaciones.models import Notificacion
+    from notificaciones.tasks import enviar_notificaciones_pendientes
+
+    clientes = Cliente.objects.order_by('pk').values_list('pk', 'zona_id', 'telefono_principal')[:cantidad]
+    Notificacion.objects.bulk_create([
+        Notificacion(
+            cliente_id=pk, zona_id=zona_id, tipo='pago', canal='whatsapp', destinatario_telefono=telefono,
+            mensaje='Hola {nombre}, tu cuota vence pronto.', enviado_por=admin,
+        )
+        for pk, zona_id, telefono in clientes
+    ])
+    return enviar_notificaciones_pendientes if clientes else None
+
+
+@benchmark('chatbot_procesar_mensaje')
+def _chatbot(admin):
+    from chatbot.models import ConversacionChatbot, PreguntaFrecuente
+    from chatbot.utils import ChatbotEngine
+    from clientes.models import Cliente
+
+    cliente = Cliente.objects.order_by('pk').first()
+    # Sin preguntas frecuentes el motor no busca nada y no hay qué medir
+    if cliente is None or not PreguntaFrecuente.objects.filter(activa=True).exists():
+        return None
+    conversacion = ConversacionChatbot.objects.create(cliente=cliente)
+    motor = ChatbotEngine()
+    mensajes = ('Hola', '¿Cuánto debo este mes?', 'Mi internet está lento', '¿Cómo cambio mi plan?', 'Quiero ver mi estado de cuenta')
+
+    def ejecutar():
+        for mensaje in mensajes:
+            motor.procesar_mensaje(mensaje, conversacion)
+    return ejecutar
+
+
+def volumen():
+    """Filas de las tablas principales, para saber contra qué datos se midió"""
+    from chatbot.models import MensajeChatbot, PreguntaFrecuente
+    from clientes.models import Cliente
+    from cobranza.models import Pago
+    from notificaciones.models import Notificacion
+    from zonas.models import Zona
+
+    return {
+        'zonas': Zona.objects.count(), 'clientes': Cliente.objects.count(), 'pagos': Pago.objects.count(),
+        'notificaciones': Notificacion.objects.count(), 'mensajes_chatbot': MensajeChatbot.objects.count(),
+        'preguntas_frecuentes': PreguntaFrecuente.objects.count(),
+    }
+
+
+def _una_vez(funcion):
+    """Prepara y mide una ejecución; todo lo escrito se deshace al terminar"""
+    with transaction.atomic():
+        admin = get_user_model().objects.create(username='benchmark_admin', password='!', tipo_usuario='admin', is_staff=True)
+        objetivo = funcion(admin)
+        if objetivo is None:
+            transaction.set_rollback(True)
+            return None
+        with medir() as medicion:
+            inicio = time.perf_counter()
+            objetivo()
+            ms = (time.perf_counter() - inicio) * 1000
+        transaction.set_rollback(True)
+    return ms, medicion
+
+
+def ejecutar_benchmarks(nombres=None, repeticiones=5, on_resultado=None):
+    """Corre los benchmarks (todos o `nombres`) `repeticiones` veces cada uno.
+
+    Cada repetición corre en una transacción que se revierte al final, así
+    que los datos quedan igual que antes. La primera repetición encuentra
+    los índices y cachés de proceso fríos; se reportan mínimo, p50 y máximo.
+    `on_resultado(nombre, resultado)` se llama al terminar cada benchmark.
+    """
+    resultados = {}
+    for nombre in nombres or BENCHMARKS:
+        funcion, ajustes = BENCHMARKS[nombre]
+        with override_settings(MEDICION_VISTAS=False, **ajustes):
+            corridas = [_una_vez(funcion) for _ in range(repeticiones)]
+        if None in corridas:
+            resultado = {'omitido': 'sin datos'}
+        else:
+            tiempos = sorted(ms for ms, _ in corridas)
+            ultima = corridas[-1][1]
+            resultado = {
+                'ms': {'min': round(tiempos[0], 2), 'p50': round(percentil(tiempos, 50), 2), 'max': round(tiempos[-1], 2)},
+                'consultas': ultima.consultas,
+                'db_ms': round(ultima.db_ms, 2),
+            }
+        resultados[nombre] = resultado
+        if on_resultado:
+            on_resultado(nombre, resultado)
+    return {
+        'fecha': timezone.now().isoformat(timespec='seconds'),
+        'base_datos': connection.vendor,
+        'repeticiones': repeticiones,
+        'volumen': volumen(),
+        'resultados': resultados,
+    }
+
+
+def comparar(actual, base, tolerancia=0.2):
+    """Regresiones de `actual` frente a una corrida guardada `base`.
+
+    Es regresión un p50 más de `tolerancia` (fracción) por encima del de la
+    base, o cualquier consulta de más. Retorna (regresiones, advertencias);
+    las advertencias señalan comparaciones poco fiables (otro volumen de
+    datos u otra base de datos) y benchmarks sin contraparte.
+    """
+    regresiones, advertencias = [], []
+    if actual.get('volumen') != base.get('volumen'):
+        advertencias.append(f"El volumen de datos difiere de la base: {base.get('volumen')} → {actual.get('volumen')}")
+    if actual.get('base_datos') != base.get('base_datos'):
+        advertencias.append(f"La base se midió en {base.get('base_datos')} y esta corrida en {actual.get('base_datos')}")
+    for nombre, resultado in actual['resultados'].items():
+        previo = base.get('resultados', {}).get(nombre)
+        if not previo or 'ms' not in previo or 'ms' not in resultado:
+            advertencias.append(f'{nombre}: sin medición comparable en la base')
+            continue
+        if resultado['ms']['p50'] > previo['ms']['p50'] * (1 + tolerancia):
+            regresiones.append({
+                'benchmark': nombre, 'metrica': 'p50_ms', 'base': previo['ms']['p50'], 'actual': resultado['ms']['p50'],
+            })
+        if resultado['consultas'] > previo['consultas']:
+            regresiones.append({
+                'benchmark': nombre, 'metrica': 'consultas', 'base': previo['consultas'], 'actual': resultado['consultas'],
+            })
+    return regresiones, advertencias
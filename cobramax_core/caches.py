@@ -0,0 +1,74 @@
+# cobramax_core/caches.py
+import logging
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+
+logger = logging.getLogger(__name__)
+
+# Backends cuyo contenido vive en la memoria de cada proceso
+BACKENDS_LOCALES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def cache_compartida(alias='default'):
+    """True si la caché `alias` la ven todos los procesos (web y workers de Celery).
+
+    Con locmem cada proceso tiene su propia copia, así que lo que se
+    coordine ahí (contadores, límites, versiones de índices) no llega a los
+    demás. `CACHE_COMPARTIDA` fuerza el resultado, p.ej. en las pruebas,
+    que corren en un único proceso.
+    """
+    forzado = getattr(settings, 'CACHE_COMPARTIDA', None)
+    if forzado is not None:
+        return forzado
+    return settings.CACHES[alias]['BACKEND'] not in BACKENDS_LOCALES
+
+
+_advertidos = set()
+
+
+def exigir_cache_compartida(uso, alias='default'):
+    """Falla si `uso` (un límite que debe coordinarse entre procesos) no tiene caché compartida.
+
+    Lanza `ImproperlyConfigured` en vez de aplicar el límite por proceso en
+    silencio. Con DEBUG solo se advierte una vez en el log, para poder
+    desarrollar con un único proceso sin Redis.
+    """
+    if cache_compartida(alias):
+        return
+    mensaje = f'{uso} necesita una caché compartida entre procesos; configura CACHE_URL (Redis)'
+    if not settings.DEBUG:
+        raise ImproperlyConfigured(mensaje)
+    if uso not in _advertidos:
+        _advertidos.add(uso)
+        logger.warning('%s; con la caché local el límite es por proceso', mensaje)
+
+
+@contextmanager
+def contador_en_curso(clave, timeout):
+    """Cuenta en la caché las operaciones en curso bajo `clave`; produce cuántas hay, contando ésta.
+
+    La clave expira sola (un proceso caído no retiene su lugar) y cada
+    entrada renueva su vigencia. Si aun así expiró con operaciones en curso,
+    al salir éstas no dejan el contador nuevo por debajo de cero.
+    """
+    cache.add(clave, 0, timeout=timeout)
+    try:
+        en_curso = cache.incr(clave)
+    except ValueError:
+        cache.set(clave, 1, timeout=timeout)
+        en_curso = 1
+    cache.touch(clave, timeout)
+    try:
+        yield en_curso
+    finally:
+        try:
+            if cache.decr(clave) < 0:
+                # Cada salida deshace sólo su propio decremento
+                cache.incr(clave)
+        except ValueError:
+            pass
@@ -27,6 +27,21 @@ app.conf.beat_schedule = {
         'task': 'notificaciones.tasks.reporte_estado_notificaciones',
         'schedule': 86400.0,  # Diario
     },
+    # Volcar contadores de popularidad acumulados en caché (FAQ, caché del chatbot)
+    'volcar-contadores': {
+        'task': 'cobramax_core.tasks.volcar_contadores_task',
+        'schedule': 60.0,  # Cada minuto
+    },
+    # Caducar y recortar la caché de respuestas del chatbot (fuera del camino de cada respuesta)
+    'recortar-cache-respuestas': {
+        'task': 'chatbot.tasks.recortar_cache_respuestas_task',
+        'schedule': 3600.0,  # Cada hora
+    },
+    # Facturación mensual: cargos de los clientes que vencen hasta hoy (idempotente por periodo)
+    'facturacion-mensual': {
+        'task': 'cobranza.tasks.facturacion_mensual_task',
+        'schedule': crontab(hour=0, minute=1),
+    },
     # Ejecutar ciclo de cobranza diariamente a las 00:05 para marcar en riesgo/corte según el día
     'mark-cobranza-cycle': {
         'task': 'cobranza.tasks.mark_cobranza_cycle_task',
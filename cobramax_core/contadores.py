@@ -0,0 +1,135 @@
+# cobramax_core/contadores.py
+import logging
+import time
+from collections import defaultdict
+from django.apps import apps
+from django.core.cache import cache
+from django.db.models import F
+from django.utils import timezone
+from .caches import cache_compartida
+
+logger = logging.getLogger(__name__)
+
+_contadores = {}
+
+
+class ContadorDiferido:
+    """Contador de popularidad con escritura diferida (write-behind).
+
+    `incrementar` sólo acumula en la caché compartida (un `incr` por llamada);
+    la tarea periódica `volcar_contadores` aplica lo acumulado con un
+    `UPDATE ... SET campo = campo + delta` por fila (agrupando las filas con
+    el mismo delta). Así los aciertos sobre filas muy consultadas no
+    serializan escrituras en la base de datos.
+
+    Sólo difiere si la caché es compartida (Redis vía CACHE_URL): con locmem
+    lo acumulado en gunicorn nunca llegaría al worker de Celery que vuelca,
+    así que cada incremento se aplica directo con un UPDATE.
+    """
+
+    def __init__(self, nombre, modelo, campo, campo_fecha=None):
+        self.nombre = nombre
+        self.modelo = modelo  # 'app_label.Modelo'
+        self.campo = campo
+        self.campo_fecha = campo_fecha  # se actualiza con la hora del volcado
+        self.prefijo = f'contador:{nombre}'
+        _contadores[nombre] = self
+
+    def _clave(self, pk):
+        return f'{self.prefijo}:{pk}'
+
+    def _con_candado(self, funcion):
+        """Ejecuta `funcion` con el candado del contador: (True, resultado).
+
+        Si el candado no se libera a tiempo retorna (False, None) sin
+        ejecutarla; quien llama decide cómo reintentar.
+        """
+        candado = f'{self.prefijo}:lock'
+        for _ in range(200):
+            if cache.add(candado, 1, timeout=5):
+                break
+            time.sleep(0.005)
+        else:
+            logger.warning('Candado del contador %s ocupado; se reintentará', self.nombre)
+            return False, None
+        try:
+            return True, funcion()
+        finally:
+            cache.delete(candado)
+
+    def _actualizar(self, pks, delta):
+        extra = {self.campo_fecha: timezone.now()} if self.campo_fecha else {}
+        return apps.get_model(self.modelo).objects.filter(pk__in=pks).update(
+            **{self.campo: F(self.campo) + delta}, **extra
+        )
+
+    def incrementar(self, pk, delta=1):
+        if not cache_compartida():
+            self._actualizar([pk], delta)
+            return
+        clave = self._clave(pk)
+        cache.add(clave, 0, timeout=None)
+        try:
+            cache.incr(clave, delta)
+        except ValueError:
+            cache.set(clave, delta, timeout=None)
+        # Sólo el primer incremento desde el último volcado registra el id
+        marcado = f'{clave}:marcado'
+        if cache.add(marcado, 1, timeout=None):
+            def registrar():
+                ids = cache.get(f'{self.prefijo}:ids') or []
+                ids.append(pk)
+                cache.set(f'{self.prefijo}:ids', ids, timeout=None)
+            registrado = False
+            try:
+                registrado, _ = self._con_candado(registrar)
+            finally:
+                # Sin registrar, el próximo incremento debe volver a intentarlo;
+                # el delta acumulado se conserva en la clave
+                if not registrado:
+                    cache.delete(marcado)
+
+    def pendientes(self):
+        """{pk: delta} acumulado y aún no volcado"""
+        ids = cache.get(f'{self.prefijo}:ids') or []
+        valores = cache.get_many([self._clave(pk) for pk in ids])
+        return {pk: valores.get(self._clave(pk), 0) for pk in ids if valores.get(self._clave(pk))}
+
+    def volcar(self):
+        """Aplica los deltas pendientes. Retorna el número de filas actualizadas."""
+        def tomar_ids():
+            ids = cache.get(f'{self.prefijo}:ids') or []
+            cache.set(f'{self.prefijo}:ids', [], timeout=None)
+            return ids
+        tomados, ids = self._con_candado(tomar_ids)
+        if not tomados:
+            return 0
+
+        por_delta = defaultdict(list)
+        for pk in set(ids):
+            clave = self._clave(pk)
+            # Desmarcar antes de leer: un incremento posterior vuelve a registrar el id
+            cache.delete(f'{clave}:marcado')
+            delta = cache.get(clave) or 0
+            if delta:
+                # Restar exactamente lo leído conserva los incrementos concurrentes
+                try:
+                    cache.decr(clave, delta)
+                except ValueError:
+                    pass
+                por_delta[delta].append(pk)
+
+        actualizadas = 0
+        for delta, pks in por_delta.items():
+            try:
+                actualizadas += self._actualizar(pks, delta)
+            except Exception:
+                logger.exception('Error volcando el contador %s; se conserva para el próximo volcado', self.nombre)
+                for pk in pks:
+                    self.incrementar(pk, delta)
+        return actualizadas
+
+
+def volcar_contadores():
+    """Vuelca todos los contadores registrados. Retorna {nombre: filas}."""
+    return {nombre: contador.volcar() for nombre, contador in _contadores.items()}
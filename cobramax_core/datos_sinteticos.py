@@ -0,0 +1,270 @@
+# cobramax_core/datos_sinteticos.py
+import random
+import re
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+NOMBRES = (
+    'José', 'Luis', 'Carlos', 'Juan', 'Jorge', 'Miguel', 'Pedro', 'César', 'Víctor', 'Raúl',
+    'María', 'Rosa', 'Ana', 'Carmen', 'Julia', 'Elena', 'Lucía', 'Gladys', 'Flor', 'Norma',
+)
+APELLIDOS = (
+    'Quispe', 'Flores', 'Sánchez', 'Rodríguez', 'García', 'Huamán', 'Mamani', 'Chávez', 'Ramírez',
+    'Torres', 'Vásquez', 'Castillo', 'Mendoza', 'Díaz', 'Rojas', 'Cruz', 'Gutiérrez', 'Paredes',
+)
+CALLES = ('Jr. Lima', 'Av. Grau', 'Jr. Bolognesi', 'Calle Real', 'Av. Los Incas', 'Jr. Amazonas', 'Pje. San Martín')
+# (plan, velocidad, monto mensual)
+PLANES = (
+    ('Plan Básico', '10 Mbps', Decimal('50.00')),
+    ('Plan Hogar', '30 Mbps', Decimal('70.00')),
+    ('Plan Plus', '60 Mbps', Decimal('90.00')),
+    ('Plan Full', '100 Mbps', Decimal('120.00')),
+)
+# estado del cliente: (peso, probabilidad de pagar cada mes, meses de deuda posibles)
+ESTADOS = {
+    'activo': (78, 0.92, (0, 0, 0, 1)),
+    'moroso': (12, 0.60, (1, 2, 3)),
+    'suspendido': (6, 0.40, (2, 3, 4, 5)),
+    'inactivo': (4, 0.30, (0,)),
+}
+METODOS = (('efectivo', 40), ('yape', 25), ('transferencia', 15), ('plin', 10), ('deposito', 7), ('tarjeta', 3))
+ESTADOS_PAGO = (('completado', 95), ('pendiente', 3), ('rechazado', 2))
+CANALES = (('whatsapp', 80), ('sms', 10), ('email', 10))
+ESTADOS_NOTIFICACION = (('enviado', 85), ('leido', 10), ('fallido', 5))
+MENSAJES_NOTIFICACION = {
+    'pago': 'Hola {nombre}, te recordamos que tu cuota de S/ {monto} vence pronto.',
+    'vencimiento': 'Hola {nombre}, tu cuota de S/ {monto} está vencida. Evita el corte del servicio.',
+    'confirmacion': 'Hola {nombre}, recibimos tu pago de S/ {monto}. ¡Gracias!',
+    'general': 'Hola {nombre}, habrá mantenimiento de red esta semana en tu zona.',
+}
+CONVERSACION = (
+    ('usuario', 'Hola'),
+    ('bot', '¡Hola! ¿En qué puedo ayudarte?'),
+    ('usuario', '¿Cuánto debo este mes?'),
+    ('bot', 'Puedes revisar tu estado de cuenta en el panel de cliente.'),
+    ('usuario', 'Mi internet está lento'),
+    ('bot', 'Prueba reiniciar tu router. Si sigue igual, te derivo con un agente.'),
+)
+
+
+def _elegir(rnd, opciones):
+    valores, pesos = zip(*opciones)
+    return rnd.choices(valores, weights=pesos)[0]
+
+
+def _meses(desde, hasta):
+    """Primer día de cada mes entre `desde` y `hasta` (fechas), ambos incluidos"""
+    anio, mes = desde.year, desde.month
+    while (anio, mes) <= (hasta.year, hasta.month):
+        yield anio, mes
+        anio, mes = (anio + 1, 1) if mes == 12 else (anio, mes + 1)
+
+
+def _inicio_dni(Cliente):
+    """Primer DNI libre: después del mayor DNI numérico existente"""
+    mayor = Cliente.objects.aggregate(m=Max('dni'))['m'] or ''
+    return max(int(mayor) + 1 if mayor.isdigit() else 0, 10_000_000)
+
+
+def generar_datos(clientes=10_000, zonas=20, caserios=100, anios=2, notificaciones=2.0,
+                  conversaciones=0.05, semilla=1, etiqueta='sint', lote=2000, on_progreso=None):
+    """Crea un volumen realista de datos de prueba con `bulk_create` por bloques.
+
+    - `zonas` zonas con su cobrador y un distrito cada una, repartiendo
+      entre ellos `caserios` caseríos.
+    - `clientes` clientes (con su usuario) en estados y planes variados;
+      `anios` años de pagos mensuales (más irregulares en morosos y
+      suspendidos); `notificaciones` notificaciones ya enviadas por cliente
+      en promedio y conversaciones del chatbot en una fracción
+      `conversaciones` de los clientes.
+    - Las preguntas frecuentes iniciales del chatbot, si faltan.
+
+    Como `bulk_create` no llama a `save()` ni a las señales, aquí se rellenan
+    las columnas que éstas mantienen (búsqueda, nombre y cobrador
+    denormalizados, código de transacción) y al final se reconstruye
+    `IngresoDiario`. La deuda de cada cliente se asienta en el libro como un
+    'ajuste' de saldo inicial, así `reconciliar_deuda` no encuentra
+    diferencias.
+
+    Con la misma `semilla` los datos son los mismos. `etiqueta` prefija
+    usuarios, zonas y códigos para no chocar con datos reales ni con otra
+    generación. `on_progreso(creados, total)` se llama tras cada bloque de
+    `lote` clientes. Retorna los conteos creados y los segundos empleados.
+
+    En SQLite rinde unos 120 clientes por segundo (cada uno con ~17 pagos de
+    dos años); casi todo el tiempo se va en la preparación de campos que
+    hace `bulk_create` por fila, no en generar los datos.
+    """
+    from chatbot.models import ConversacionChatbot, MensajeChatbot
+    from chatbot.services import sembrar_preguntas_frecuentes
+    from clientes import busqueda
+    from clientes.models import Cliente
+    from cobranza.models import Pago, Transaccion
+    from notificaciones.models import Notificacion
+    from reportes.models import IngresoDiario
+    from zonas.models import Caserio, Departamento, Distrito, Provincia, Zona
+
+    if not re.fullmatch(r'[a-z0-9]{1,6}', etiqueta):
+        raise ValueError('La etiqueta debe tener de 1 a 6 letras minúsculas o dígitos')
+    Usuario = get_user_model()
+    if Usuario.objects.filter(username__startswith=f'{etiqueta}_').exists():
+        raise ValueError(f"Ya existen datos con la etiqueta '{etiqueta}'; usa otra")
+    if zonas < 1 or caserios < zonas:
+        raise ValueError('Se necesita al menos una zona y un caserío por zona')
+
+    inicio = time.monotonic()
+    rnd = random.Random(semilla)
+    ahora = timezone.now()
+    hoy = timezone.localdate()
+    desde = hoy.replace(year=hoy.year - anios, day=1) if anios else hoy.replace(day=1)
+    conteos = dict.fromkeys(
+        ('zonas', 'caserios', 'preguntas', 'clientes', 'pagos', 'transacciones', 'notificaciones', 'conversaciones', 'mensajes'), 0,
+    )
+
+    # Zonas, cobradores y geografía
+    with transaction.atomic():
+        cobradores = Usuario.objects.bulk_create([
+            Usuario(
+                username=f'{etiqueta}_cobrador{i}', password='!', tipo_usuario='cobrador',
+                first_name=rnd.choice(NOMBRES), last_name=rnd.choice(APELLIDOS),
+            )
+            for i in range(zonas)
+        ])
+        lista_zonas = Zona.objects.bulk_create([
+            Zona(
+                nombre=f'Zona {etiqueta.upper()} {i + 1}', codigo=f'{etiqueta.upper()}{i + 1}', cobrador=cobrador,
+                latitud=Decimal(f'{rnd.uniform(-7.5, -5.0):.6f}'), longitud=Decimal(f'{rnd.uniform(-80.5, -78.0):.6f}'),
+            )
+            for i, cobrador in enumerate(cobradores)
+        ])
+        departamento = Departamento.objects.create(nombre=f'Departamento {etiqueta.upper()}')
+        provincia = Provincia.objects.create(departamento=departamento, nombre=f'Provincia {etiqueta.upper()}')
+        distritos = Distrito.objects.bulk_create([
+            Distrito(provincia=provincia, nombre=zona.nombre.replace('Zona', 'Distrito')) for zona in lista_zonas
+        ])
+        lista_caserios = Caserio.objects.bulk_create([
+            Caserio(distrito=distritos[i % zonas], nombre=f'Caserío {i + 1}', codigo=f'{etiqueta.upper()}-C{i + 1}')
+            for i in range(caserios)
+        ])
+        conteos['preguntas'] = sembrar_preguntas_frecuentes(cobradores[0])
+    conteos['zonas'], conteos['caserios'] = zonas, caserios
+    caserios_por_zona = [lista_caserios[i::zonas] for i in range(zonas)]
+    nombres_cobrador = [f'{c.first_name} {c.last_name}' for c in cobradores]
+
+    dni = _inicio_dni(Cliente)
+    num_pago = 0
+    estados = [(estado, datos[0]) for estado, datos in ESTADOS.items()]
+    for desde_i in range(0, clientes, lote):
+        with transaction.atomic():
+            fichas = []
+            for _ in range(min(lote, clientes - desde_i)):
+                z = rnd.randrange(zonas)
+                plan, velocidad, monto = rnd.choice(PLANES)
+                estado = _elegir(rnd, estados)
+                fichas.append({
+                    'dni': f'{dni:08d}', 'zona': z, 'plan': plan, 'velocidad': velocidad, 'monto': monto,
+                    'estado': estado, 'nombre': rnd.choice(NOMBRES),
+                    'apellido': f'{rnd.choice(APELLIDOS)} {rnd.choice(APELLIDOS)}',
+                    'telefono': f'9{rnd.randrange(10**8):08d}',
+                    'instalacion': hoy - timedelta(days=rnd.randrange(30, (anios + 3) * 365)),
+                })
+                dni += 1
+
+            usuarios = Usuario.objects.bulk_create([
+                Usuario(
+                    username=f"{etiqueta}_{f['dni']}", password='!', tipo_usuario='cliente',
+                    first_name=f['nombre'], last_name=f['apellido'],
+                    email=f"{busqueda.normalizar(f['nombre'])}.{f['dni']}@correo.pe",
+                    telefono=f['telefono'],
+                )
+                for f in fichas
+            ])
+            nuevos = []
+            for f, usuario in zip(fichas, usuarios):
+                meses_deuda = rnd.choice(ESTADOS[f['estado']][2])
+                valores = {
+                    'dni': f['dni'], 'telefono_principal': f['telefono'], 'usuario__first_name': usuario.first_name,
+                    'usuario__last_name': usuario.last_name, 'usuario__email': usuario.email,
+                }
+                nuevos.append(Cliente(
+                    usuario=usuario, dni=f['dni'], telefono_principal=f['telefono'],
+                    direccion=f"{rnd.choice(CALLES)} {rnd.randrange(100, 1500)}", estado=f['estado'],
+                    zona=lista_zonas[f['zona']], caserio=rnd.choice(caserios_por_zona[f['zona']]),
+                    fecha_instalacion=f['instalacion'], plan_contratado=f['plan'], plan=f['plan'],
+                    velocidad=f['velocidad'], monto_mensual=f['monto'], deuda_actual=f['monto'] * meses_deuda,
+                    dia_vencimiento=rnd.choice((None, 5, 10, 15, 20, 25)),
+                    nombre_mostrado=f"{usuario.first_name} {usuario.last_name}",
+                    cobrador=cobradores[f['zona']], cobrador_nombre=nombres_cobrador[f['zona']],
+                    busqueda=busqueda.texto_busqueda(valores),
+                ))
+            nuevos = Cliente.objects.bulk_create(nuevos)
+
+            # Saldo inicial en el libro, igual a la deuda generada
+            transacciones = [
+                Transaccion(
+                    cliente=c, tipo='ajuste', monto=c.deuda_actual, saldo_anterior=0,
+                    saldo_posterior=c.deuda_actual, descripcion='Saldo inicial (datos sintéticos)',
+                )
+                for c in nuevos if c.deuda_actual
+            ]
+            Transaccion.objects.bulk_create(transacciones)
+
+            pagos = []
+            notifs = []
+            for f, c in zip(fichas, nuevos):
+                prob = ESTADOS[f['estado']][1]
+                for anio, mes in _meses(max(desde, f['instalacion']), hoy):
+                    if rnd.random() > prob:
+                        continue
+                    fecha = timezone.make_aware(datetime(anio, mes, rnd.randint(1, 28), rnd.randint(8, 19), rnd.randrange(60)))
+                    if fecha > ahora:
+                        continue
+                    num_pago += 1
+                    pagos.append(Pago(
+                        cliente=c, monto=c.monto_mensual, metodo_pago=_elegir(rnd, METODOS),
+                        estado=_elegir(rnd, ESTADOS_PAGO), codigo_transaccion=f'{etiqueta.upper()}-{num_pago:09d}',
+                        fecha_pago=fecha, registrado_por=c.cobrador,
+                    ))
+                cantidad = int(notificaciones) + (rnd.random() < notificaciones % 1)
+                for _ in range(cantidad):
+                    tipo = rnd.choice(tuple(MENSAJES_NOTIFICACION))
+                    canal = _elegir(rnd, CANALES)
+                    notifs.append(Notificacion(
+                        cliente=c, zona=c.zona, tipo=tipo, canal=canal, estado=_elegir(rnd, ESTADOS_NOTIFICACION),
+                        mensaje=MENSAJES_NOTIFICACION[tipo].format(nombre=f['nombre'], monto=c.monto_mensual),
+                        fecha_envio=ahora - timedelta(days=rnd.randrange(1, max(2, anios * 365)), minutes=rnd.randrange(1440)),
+                        destinatario_telefono=c.telefono_principal if canal != 'email' else None,
+                        destinatario_email=c.usuario.email if canal == 'email' else None, intentos_envio=1,
+                    ))
+            Pago.objects.bulk_create(pagos, batch_size=lote)
+            Notificacion.objects.bulk_create(notifs, batch_size=lote)
+
+            con_chat = [c for c in nuevos if rnd.random() < conversaciones]
+            convs = ConversacionChatbot.objects.bulk_create([
+                ConversacionChatbot(cliente=c, estado=rnd.choice(('resuelta', 'resuelta', 'activa', 'derivada')))
+                for c in con_chat
+            ])
+            mensajes = MensajeChatbot.objects.bulk_create([
+                MensajeChatbot(conversacion=conv, tipo=tipo, contenido=contenido)
+                for conv in convs
+                for tipo, contenido in CONVERSACION[:2 * rnd.randint(1, len(CONVERSACION) // 2)]
+            ], batch_size=lote)
+
+        conteos['clientes'] += len(nuevos)
+        conteos['transacciones'] += len(transacciones)
+        conteos['pagos'] += len(pagos)
+        conteos['notificaciones'] += len(notifs)
+        conteos['conversaciones'] += len(convs)
+        conteos['mensajes'] += len(mensajes)
+        if on_progreso:
+            on_progreso(conteos['clientes'], clientes)
+
+    IngresoDiario.reconstruir(batch_size=lote)
+    busqueda.invalidar_indice()
+    conteos['segundos'] = round(time.monotonic() - inicio, 2)
+    return conteos
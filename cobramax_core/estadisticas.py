@@ -0,0 +1,55 @@
+# cobramax_core/estadisticas.py
+import hashlib
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db.models import Count, Q, Sum
+
+
+def contar(**filtro):
+    """COUNT condicional: contar(estado='activo') ~ .filter(estado='activo').count()"""
+    return Count('pk', filter=Q(**filtro) if filtro else None)
+
+
+def sumar(campo, **filtro):
+    """SUM condicional de `campo`; None se convierte en 0 en `estadisticas`"""
+    return Sum(campo, filter=Q(**filtro) if filtro else None)
+
+
+def _clave_cache(queryset, metricas):
+    try:
+        sql, params = queryset.query.sql_with_params()
+    except EmptyResultSet:
+        return None
+    firma = repr((sql, params, sorted((nombre, repr(expr)) for nombre, expr in metricas.items())))
+    return 'estadisticas:' + hashlib.md5(firma.encode()).hexdigest()
+
+
+def estadisticas(queryset, ttl=0, **metricas):
+    """Calcula todas las métricas de un listado en un único `aggregate()`.
+
+    Ejemplo::
+
+        estadisticas(pagos, total=contar(), completados=contar(estado='completado'),
+                     monto=sumar('monto'))
+
+    Con `ttl` (segundos) el resultado se guarda en caché con una clave
+    derivada del SQL del queryset, así que cada combinación de filtros
+    tiene su propia entrada.
+    """
+    queryset = queryset.order_by()
+    clave = _clave_cache(queryset, metricas) if ttl else None
+    if clave:
+        datos = cache.get(clave)
+        if datos is not None:
+            return datos
+
+    datos = {nombre: valor or 0 for nombre, valor in queryset.aggregate(**metricas).items()}
+    if clave:
+        cache.set(clave, datos, ttl)
+    return datos
+
+
+def ttl_dashboard():
+    """TTL de la caché de estadísticas de los dashboards (0 la desactiva)"""
+    return getattr(settings, 'ESTADISTICAS_CACHE_TTL', 30)
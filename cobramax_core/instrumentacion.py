@@ -0,0 +1,212 @@
+# cobramax_core/instrumentacion.py
+import contextvars
+import logging
+import math
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import ExitStack, contextmanager
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import BaseCache
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_medicion = contextvars.ContextVar('medicion_vista', default=None)
+_SIN_VALOR = object()
+
+
+class Medicion:
+    """Contadores de una petición: consultas, tiempo en BD y aciertos/fallos de caché"""
+
+    __slots__ = ('consultas', 'db_ms', 'cache_aciertos', 'cache_fallos')
+
+    def __init__(self):
+        self.consultas = 0
+        self.db_ms = 0.0
+        self.cache_aciertos = 0
+        self.cache_fallos = 0
+
+
+def _medir_consulta(execute, sql, params, many, context):
+    medicion = _medicion.get()
+    if medicion is None:
+        return execute(sql, params, many, context)
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        medicion.consultas += 1
+        medicion.db_ms += (time.perf_counter() - inicio) * 1000
+
+
+def _contar_cache(aciertos, fallos):
+    medicion = _medicion.get()
+    if medicion is not None:
+        medicion.cache_aciertos += aciertos
+        medicion.cache_fallos += fallos
+
+
+def instrumentar_cache():
+    """Envuelve get/get_many de los backends de caché configurados (una vez por clase).
+
+    Fuera de una petición medida el costo es leer una ContextVar. Si el
+    backend no redefine get_many (usa el de BaseCache, que llama a get)
+    solo se cuenta en get para no contar dos veces.
+    """
+    for alias in settings.CACHES:
+        clase = type(caches[alias])
+        if clase.__dict__.get('_instrumentada'):
+            continue
+        get_original = clase.get
+
+        def get(self, key, default=None, version=None, _get=get_original):
+            valor = _get(self, key, _SIN_VALOR, version=version)
+            if valor is _SIN_VALOR:
+                _contar_cache(0, 1)
+                return default
+            _contar_cache(1, 0)
+            return valor
+
+        clase.get = get
+        if clase.get_many is not BaseCache.get_many:
+            get_many_original = clase.get_many
+
+            def get_many(self, keys, version=None, _get_many=get_many_original):
+                keys = list(keys)
+                valores = _get_many(self, keys, version=version)
+                _contar_cache(len(valores), len(keys) - len(valores))
+                return valores
+
+            clase.get_many = get_many
+        clase._instrumentada = True
+
+
+@contextmanager
+def medir():
+    """Cuenta en una `Medicion` las consultas y accesos a caché hechos dentro del bloque.
+
+    Solo se cuenta lo ejecutado en el hilo (contexto) actual. Un `medir()`
+    anidado toma el control hasta salir y el exterior no ve sus consultas.
+    """
+    instrumentar_cache()
+    medicion = Medicion()
+    token = _medicion.set(medicion)
+    try:
+        with ExitStack() as pila:
+            for conexion in connections.all():
+                pila.enter_context(conexion.execute_wrapper(_medir_consulta))
+            yield medicion
+    finally:
+        _medicion.reset(token)
+
+
+def percentil(valores, p):
+    """Percentil `p` (0-100) por rango más cercano de una lista ya ordenada"""
+    if not valores:
+        return 0
+    return valores[max(0, math.ceil(p / 100 * len(valores)) - 1)]
+
+
+class RegistroVistas:
+    """Últimas mediciones por vista (ventana móvil) y excesos de presupuesto.
+
+    Vive en memoria del proceso: cada worker reporta sus propias peticiones.
+    """
+
+    def __init__(self, muestras):
+        self._lock = threading.Lock()
+        self._muestras = muestras
+        self._datos = defaultdict(lambda: deque(maxlen=self._muestras))
+        self._excesos = defaultdict(int)
+
+    def agregar(self, vista, latencia_ms, medicion, excedido):
+        with self._lock:
+            self._datos[vista].append(
+                (latencia_ms, medicion.consultas, medicion.db_ms, medicion.cache_aciertos, medicion.cache_fallos)
+            )
+            if excedido:
+                self._excesos[vista] += 1
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+            self._excesos.clear()
+
+    def resumen(self):
+        """Percentiles p50/p90/p99 de latencia, consultas y tiempo en BD por vista"""
+        with self._lock:
+            datos = {vista: list(filas) for vista, filas in self._datos.items()}
+            excesos = dict(self._excesos)
+        resultado = {}
+        for vista, filas in sorted(datos.items()):
+            columnas = list(zip(*filas))
+            metricas = {}
+            for nombre, valores in zip(('latencia_ms', 'consultas', 'db_ms'), columnas[:3]):
+                ordenados = sorted(valores)
+                metricas[nombre] = {
+                    f'p{p}': round(percentil(ordenados, p), 2) for p in (50, 90, 99)
+                } | {'max': round(ordenados[-1], 2)}
+            aciertos, fallos = sum(columnas[3]), sum(columnas[4])
+            resultado[vista] = {
+                'muestras': len(filas),
+                **metricas,
+                'cache': {
+                    'aciertos': aciertos,
+                    'fallos': fallos,
+                    'tasa_aciertos': round(aciertos / (aciertos + fallos), 3) if aciertos + fallos else None,
+                },
+                'presupuesto': presupuesto_de(vista),
+                'excesos': excesos.get(vista, 0),
+            }
+        return resultado
+
+
+registro = RegistroVistas(getattr(settings, 'MEDICION_MUESTRAS', 500))
+
+
+def presupuesto_de(vista):
+    """Presupuesto {'consultas', 'ms'} de una vista: `PRESUPUESTOS_VISTAS` o el por defecto"""
+    defecto = getattr(settings, 'PRESUPUESTO_VISTA_DEFECTO', {'consultas': 50, 'ms': 2000})
+    return {**defecto, **getattr(settings, 'PRESUPUESTOS_VISTAS', {}).get(vista, {})}
+
+
+class MedicionMiddleware:
+    """Mide cada petición por vista resuelta: consultas y tiempo en BD,
+    aciertos y fallos de caché y latencia total.
+
+    Las peticiones que superan el presupuesto de su vista se registran con
+    un warning en el logger `cobramax_core.instrumentacion`; los percentiles
+    se consultan en `metricas_vistas` (solo admin). En las respuestas en
+    streaming solo cuenta lo hecho antes de empezar a enviar el cuerpo.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        instrumentar_cache()
+
+    def __call__(self, request):
+        if not getattr(settings, 'MEDICION_VISTAS', True):
+            return self.get_response(request)
+
+        inicio = time.perf_counter()
+        with medir() as medicion:
+            response = self.get_response(request)
+        latencia_ms = (time.perf_counter() - inicio) * 1000
+
+        match = getattr(request, 'resolver_match', None)
+        if match is not None:
+            self._registrar(match.view_name, latencia_ms, medicion, request)
+        return response
+
+    def _registrar(self, vista, latencia_ms, medicion, request):
+        presupuesto = presupuesto_de(vista)
+        excedido = medicion.consultas > presupuesto['consultas'] or latencia_ms > presupuesto['ms']
+        if excedido:
+            logger.warning(
+                'Vista %s fuera de presupuesto (%s %s): %d consultas (máx %d), %.0f ms (máx %d), BD %.0f ms',
+                vista, request.method, request.path, medicion.consultas, presupuesto['consultas'],
+                latencia_ms, presupuesto['ms'], medicion.db_ms,
+            )
+        registro.agregar(vista, latencia_ms, medicion, excedido)
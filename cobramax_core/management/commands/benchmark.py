@@ -0,0 +1,50 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from cobramax_core.benchmarks import BENCHMARKS, comparar, ejecutar_benchmarks
+
+
+class Command(BaseCommand):
+    help = 'Mide los flujos críticos sobre los datos actuales y compara contra una corrida base'
+
+    def add_arguments(self, parser):
+        parser.add_argument('nombres', nargs='*', help=f"Benchmarks a correr (por defecto todos: {', '.join(BENCHMARKS)})")
+        parser.add_argument('--repeticiones', type=int, default=5, help='Ejecuciones por benchmark')
+        parser.add_argument('--salida', help='Archivo JSON donde guardar los resultados (sirve como base futura)')
+        parser.add_argument('--base', help='Archivo JSON de una corrida anterior con la que comparar')
+        parser.add_argument('--tolerancia', type=float, default=0.2,
+                            help='Aumento relativo del p50 tolerado antes de considerar regresión')
+
+    def handle(self, *args, **options):
+        desconocidos = set(options['nombres']) - set(BENCHMARKS)
+        if desconocidos:
+            raise CommandError(f"Benchmarks desconocidos: {', '.join(sorted(desconocidos))}")
+        base = None
+        if options['base']:
+            with open(options['base'], encoding='utf-8') as f:
+                base = json.load(f)
+
+        def mostrar(nombre, r):
+            if 'omitido' in r:
+                self.stdout.write(self.style.WARNING(f"  {nombre}: omitido ({r['omitido']})"))
+            else:
+                ms = r['ms']
+                self.stdout.write(
+                    f"  {nombre}: p50 {ms['p50']:.1f} ms (min {ms['min']:.1f}, max {ms['max']:.1f}), "
+                    f"{r['consultas']} consultas, BD {r['db_ms']:.1f} ms"
+                )
+
+        resultados = ejecutar_benchmarks(options['nombres'], options['repeticiones'], on_resultado=mostrar)
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as f:
+                json.dump(resultados, f, indent=2, ensure_ascii=False)
+            self.stdout.write(f"Resultados guardados en {options['salida']}")
+
+        if base is None:
+            return
+        regresiones, advertencias = comparar(resultados, base, options['tolerancia'])
+        for advertencia in advertencias:
+            self.stdout.write(self.style.WARNING(advertencia))
+        if regresiones:
+            detalle = '; '.join(f"{r['benchmark']} {r['metrica']}: {r['base']} → {r['actual']}" for r in regresiones)
+            raise CommandError(f'Regresiones frente a la base: {detalle}')
+        self.stdout.write(self.style.SUCCESS('Sin regresiones frente a la base'))
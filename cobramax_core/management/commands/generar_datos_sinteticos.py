@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from cobramax_core.datos_sinteticos import generar_datos
+
+
+class Command(BaseCommand):
+    help = 'Genera datos sintéticos realistas (zonas, caseríos, clientes, pagos, notificaciones y chats) para pruebas de carga'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clientes', type=int, default=10_000, help='Clientes a crear (p.ej. 10000 a 100000; ~120 por segundo en SQLite)')
+        parser.add_argument('--zonas', type=int, default=20, help='Zonas, cada una con su cobrador')
+        parser.add_argument('--caserios', type=int, default=100, help='Caseríos repartidos entre las zonas')
+        parser.add_argument('--anios', type=int, default=2, help='Años de historial de pagos')
+        parser.add_argument('--notificaciones', type=float, default=2.0,
+                            help='Notificaciones enviadas por cliente (promedio)')
+        parser.add_argument('--conversaciones', type=float, default=0.05,
+                            help='Fracción de clientes con una conversación del chatbot')
+        parser.add_argument('--semilla', type=int, default=1, help='Semilla aleatoria (mismos datos con la misma semilla)')
+        parser.add_argument('--etiqueta', default='sint', help='Prefijo de usuarios, zonas y códigos generados')
+        parser.add_argument('--lote', type=int, default=2000, help='Clientes por bloque/transacción')
+
+    def handle(self, *args, **options):
+        def progreso(creados, total):
+            self.stdout.write(f'  {creados}/{total} clientes')
+
+        try:
+            conteos = generar_datos(
+                clientes=options['clientes'], zonas=options['zonas'], caserios=options['caserios'],
+                anios=options['anios'], notificaciones=options['notificaciones'],
+                conversaciones=options['conversaciones'], semilla=options['semilla'],
+                etiqueta=options['etiqueta'], lote=options['lote'], on_progreso=progreso,
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        segundos = conteos.pop('segundos')
+        resumen = ', '.join(f'{n} {nombre}' for nombre, n in conteos.items())
+        self.stdout.write(self.style.SUCCESS(f'Creados {resumen} en {segundos:.2f}s'))
@@ -0,0 +1,121 @@
+# cobramax_core/paginacion.py
+import base64
+import json
+from django.conf import settings
+from django.db.models import Q
+
+TAMANIO_PAGINA = 25
+
+
+def _campo(nombre):
+    return nombre.lstrip('-'), nombre.startswith('-')
+
+
+class PaginaCursor:
+    """Una página de resultados paginados por cursor (keyset).
+
+    `objetos` es la lista de filas de la página y `siguiente` el cursor
+    opaco para pedir la próxima (None en la última).
+    """
+
+    def __init__(self, objetos, siguiente, tamanio, parametros):
+        self.objetos = objetos
+        self.siguiente = siguiente
+        self.tamanio = tamanio
+        self._parametros = parametros
+
+    @property
+    def hay_mas(self):
+        return self.siguiente is not None
+
+    @property
+    def es_primera(self):
+        return not self._parametros.get('cursor')
+
+    def querystring_siguiente(self):
+        """Querystring de la página siguiente conservando los filtros actuales"""
+        parametros = self._parametros.copy()
+        parametros['cursor'] = self.siguiente
+        return parametros.urlencode()
+
+    def querystring_primera(self):
+        parametros = self._parametros.copy()
+        parametros.pop('cursor', None)
+        return parametros.urlencode()
+
+    def como_json(self, serializar):
+        """Respuesta para scroll infinito: filas serializadas y cursor siguiente"""
+        return {
+            'resultados': [serializar(obj) for obj in self.objetos],
+            'siguiente': self.siguiente,
+            'hay_mas': self.hay_mas,
+        }
+
+
+class PaginadorCursor:
+    """Paginación por cursor sobre un orden estable, p.ej. ('-fecha_pago', '-id').
+
+    La página siguiente se pide filtrando "después de la última fila vista"
+    en vez de usar OFFSET, así que con un índice sobre los mismos campos
+    la página N cuesta lo mismo que la primera. El último campo debe ser
+    único (normalmente el id) para que el orden no tenga empates.
+    """
+
+    def __init__(self, queryset, orden, tamanio_defecto=TAMANIO_PAGINA):
+        self.queryset = queryset.order_by(*orden)
+        self.orden = orden
+        self.tamanio_defecto = tamanio_defecto
+
+    def _codificar(self, obj):
+        valores = []
+        for nombre in self.orden:
+            valor = getattr(obj, _campo(nombre)[0])
+            valores.append(valor.isoformat() if hasattr(valor, 'isoformat') else valor)
+        return base64.urlsafe_b64encode(json.dumps(valores).encode()).decode()
+
+    def _decodificar(self, cursor):
+        valores = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if len(valores) != len(self.orden):
+            raise ValueError('Cursor incompatible con el orden')
+        modelo = self.queryset.model
+        return [
+            modelo._meta.get_field(_campo(nombre)[0]).to_python(valor)
+            for nombre, valor in zip(self.orden, valores)
+        ]
+
+    def _despues_de(self, valores):
+        """Q de las filas posteriores a `valores` en el orden del paginador"""
+        condicion = Q()
+        iguales = Q()
+        for nombre, valor in zip(self.orden, valores):
+            campo, descendente = _campo(nombre)
+            lookup = 'lt' if descendente else 'gt'
+            condicion |= iguales & Q(**{f'{campo}__{lookup}': valor})
+            iguales &= Q(**{campo: valor})
+        return condicion
+
+    def pagina(self, request):
+        maximo = getattr(settings, 'PAGINACION_TAMANIO_MAXIMO', 100)
+        try:
+            tamanio = int(request.GET.get('tamanio', self.tamanio_defecto))
+        except ValueError:
+            tamanio = self.tamanio_defecto
+        tamanio = max(1, min(tamanio, maximo))
+
+        queryset = self.queryset
+        cursor = request.GET.get('cursor')
+        if cursor:
+            try:
+                queryset = queryset.filter(self._despues_de(self._decodificar(cursor)))
+            except Exception:
+                # Cursor inválido o de otro listado: empezar desde el principio
+                pass
+
+        # Una fila extra indica si hay página siguiente sin hacer COUNT
+        filas = list(queryset[:tamanio + 1])
+        siguiente = self._codificar(filas[tamanio - 1]) if len(filas) > tamanio else None
+        return PaginaCursor(filas[:tamanio], siguiente, tamanio, request.GET)
+
+
+def paginar_por_cursor(request, queryset, orden, tamanio_defecto=TAMANIO_PAGINA):
+    return PaginadorCursor(queryset, orden, tamanio_defecto).pagina(request)
@@ -0,0 +1,29 @@
+# cobramax_core/pruebas.py
+from contextlib import contextmanager
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+
+class ConsultasMixin:
+    """Ayudas de tests para vigilar el número de consultas.
+
+    A diferencia de `assertNumQueries` no fija un número exacto: sirve para
+    detectar N+1 sin que el test se rompa al quitar una consulta.
+    """
+
+    @contextmanager
+    def assertMaxQueries(self, maximo, using='default'):
+        with CaptureQueriesContext(connections[using]) as contexto:
+            yield contexto
+        ejecutadas = len(contexto.captured_queries)
+        if ejecutadas > maximo:
+            detalle = '\n'.join(f"{i}. {q['sql']}" for i, q in enumerate(contexto.captured_queries, start=1))
+            self.fail(f'{ejecutadas} consultas ejecutadas, máximo {maximo}:\n{detalle}')
+
+    def assertQueriesNoCrecen(self, peticion, agregar_filas, filas=10):
+        """Falla si `peticion()` hace más consultas después de `agregar_filas(filas)` (N+1)"""
+        with CaptureQueriesContext(connections['default']) as antes:
+            peticion()
+        agregar_filas(filas)
+        with self.assertMaxQueries(len(antes.captured_queries)):
+            peticion()
@@ -45,6 +45,8 @@ MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     # WhiteNoise: servir archivos estáticos eficientemente en producción
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    # Consultas, caché y latencia por vista (presupuestos más abajo)
+    'cobramax_core.instrumentacion.MedicionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',  # ← Este debe estar presente
@@ -126,6 +128,10 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 # Uso de WhiteNoise para servir archivos estáticos en producción
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
+# ARCHIVOS SUBIDOS (comprobantes, reportes exportados)
+MEDIA_URL = 'media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
 # Si la aplicación está detrás de un proxy (Render), permitir detectar HTTPS
 SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 
@@ -157,6 +163,84 @@ EMAIL_USE_SSL = os.environ.get('EMAIL_USE_SSL', 'False').lower() in ('true', '1'
 TWILIO_ACCOUNT_SID = os.environ.get('TWILIO_ACCOUNT_SID', '')
 TWILIO_AUTH_TOKEN = os.environ.get('TWILIO_AUTH_TOKEN', '')
 TWILIO_WHATSAPP_NUMBER = os.environ.get('TWILIO_WHATSAPP_NUMBER', '')
+TWILIO_SMS_NUMBER = os.environ.get('TWILIO_SMS_NUMBER', '')
+
+# Transporte de notificaciones: 'auto' (Twilio/SMTP si están configurados, si no simulación)
+# o 'fake' (proveedor en proceso para pruebas de carga, sin red)
+NOTIFICACIONES_TRANSPORTE = os.environ.get('NOTIFICACIONES_TRANSPORTE', 'auto')
+
+# Límites de envío de notificaciones (token bucket compartido vía caché; sin
+# CACHE_URL el despacho falla fuera de DEBUG)
+# {'canal': {'capacidad': ráfaga máxima, 'por_segundo': tasa sostenida}}
+NOTIFICACIONES_LIMITES = {
+    'whatsapp': {'capacidad': 20, 'por_segundo': 10},
+    'sms': {'capacidad': 10, 'por_segundo': 5},
+    'email': {'capacidad': 50, 'por_segundo': 14},
+}
+# Presupuesto por número/remitente de origen: {'+14155238886': {'capacidad': 1, 'por_segundo': 1}}
+NOTIFICACIONES_LIMITES_REMITENTE = {}
+
+# Caché compartida (Redis) para coordinar límites, contadores e índices entre
+# gunicorn y los workers de Celery; locmem (local a cada proceso) si no está
+# configurada. Ver cobramax_core.caches.cache_compartida
+cache_url = os.environ.get('CACHE_URL')
+if cache_url:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': cache_url,
+        }
+    }
+
+# Día de facturación de los clientes sin dia_vencimiento
+FACTURACION_DIA_DEFECTO = 1
+
+# Caché corta (segundos) de las estadísticas de los dashboards; 0 la desactiva
+ESTADISTICAS_CACHE_TTL = int(os.environ.get('ESTADISTICAS_CACHE_TTL', 30))
+
+# Alcance de cobradores/clientes (zonas.services): vigencia en caché (segundos,
+# 0 la desactiva; sin caché compartida no se cachea) y máximo de ids de cliente
+# en un filtro antes de filtrar por zona
+ALCANCE_CACHE_TTL = int(os.environ.get('ALCANCE_CACHE_TTL', 300))
+ALCANCE_MAX_IDS = 2000
+
+# Búsqueda de clientes (clientes.busqueda): None usa el índice en memoria fuera de
+# PostgreSQL; cada cuántos segundos un proceso revisa si otro cambió el índice
+CLIENTES_BUSQUEDA_MEMORIA = None
+CLIENTES_INDICE_REVISION = 5
+
+# Instrumentación por vista (cobramax_core.instrumentacion): mediciones que se
+# conservan por vista y presupuesto de consultas/latencia (ms). Las vistas se
+# identifican por su nombre de URL resuelto ("app:nombre" si hay namespace)
+MEDICION_VISTAS = True
+MEDICION_MUESTRAS = 500
+PRESUPUESTO_VISTA_DEFECTO = {'consultas': 50, 'ms': 2000}
+PRESUPUESTOS_VISTAS = {
+    'lista_pagos': {'consultas': 12, 'ms': 800},
+    'detalle_pago': {'consultas': 8, 'ms': 500},
+    'registrar_pago': {'consultas': 10, 'ms': 800},
+    'dashboard_reportes': {'consultas': 15, 'ms': 1500},
+    'exportar_reporte': {'consultas': 12, 'ms': 1500},
+    'estado_reporte': {'consultas': 6, 'ms': 300},
+    'lista_notificaciones': {'consultas': 12, 'ms': 800},
+    'dashboard_notificaciones': {'consultas': 15, 'ms': 1000},
+    'api_clientes_autocomplete': {'consultas': 5, 'ms': 200},
+    'chatbot_interface': {'consultas': 15, 'ms': 1000},
+    'chatbot_send': {'consultas': 20, 'ms': 3000},
+}
+
+# Exportación de reportes: filas leídas por bloque y vigencia (segundos) de un
+# archivo para reutilizarlo ante la misma petición; 0 desactiva la reutilización
+REPORTES_EXPORTACION_CHUNK = 2000
+REPORTES_EXPORTACION_TTL = int(os.environ.get('REPORTES_EXPORTACION_TTL', 3600))
+
+# Cola de reportes en segundo plano: ejecuciones simultáneas por tipo de reporte,
+# espera (segundos) antes de reintentar sin cupo y duración máxima de un cupo
+REPORTES_ASINCRONO = True
+REPORTES_CONCURRENCIA = {'zonas': 2, 'ingresos': 2, 'pagos': 1}
+REPORTES_CONCURRENCIA_DEFECTO = 2
+REPORTES_ESPERA_CUPO = 15
+REPORTES_TIEMPO_MAXIMO = 600
 
 # Celery (broker/result backend)
 CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0')
@@ -14,3 +14,18 @@ EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
 PASSWORD_HASHERS = [
     'django.contrib.auth.hashers.MD5PasswordHasher',
 ]
+
+# Los tests del chatbot ejercitan la llamada en línea a OpenAI; el modo Celery se prueba explícitamente
+CHATBOT_OPENAI_ASINCRONO = False
+
+# Las estadísticas se prueban sin caché salvo en los tests que la activan
+ESTADISTICAS_CACHE_TTL = 0
+
+# El alcance de los cobradores se cachea solo en los tests que lo activan
+ALCANCE_CACHE_TTL = 0
+
+# Los trabajos de reportes se ejecutan en la misma petición
+REPORTES_ASINCRONO = False
+
+# Las pruebas corren en un único proceso: la caché locmem cumple el papel de la compartida
+CACHE_COMPARTIDA = True
@@ -0,0 +1,15 @@
+# cobramax_core/tasks.py
+from celery import shared_task
+import logging
+from .contadores import volcar_contadores
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def volcar_contadores_task():
+    """Aplica en la base de datos los incrementos acumulados de los contadores diferidos"""
+    resultado = volcar_contadores()
+    if any(resultado.values()):
+        logger.info('Contadores volcados: %s', resultado)
+    return resultado
@@ -0,0 +1,189 @@
+import json
+import os
+import tempfile
+from io import StringIO
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db.models import F, Sum
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from chatbot.models import PreguntaFrecuente
+from clientes.models import Cliente
+from clientes.services import rellenar_denormalizados
+from cobranza.models import CorteRegistro, Pago
+from cobranza.services import reconciliar_deuda
+from notificaciones.models import Notificacion
+from reportes.models import IngresoDiario
+from zonas.models import Zona
+from .benchmarks import BENCHMARKS, comparar
+from .datos_sinteticos import generar_datos
+from .instrumentacion import registro
+
+User = get_user_model()
+
+
+def generar(etiqueta='t', semilla=7):
+	return generar_datos(
+		clientes=40, zonas=2, caserios=4, anios=1, notificaciones=1.5, conversaciones=0.5,
+		semilla=semilla, etiqueta=etiqueta, lote=15,
+	)
+
+
+class DatosSinteticosTests(TestCase):
+	def test_datos_consistentes(self):
+		conteos = generar()
+		self.assertEqual(Cliente.objects.count(), 40)
+		self.assertEqual(Pago.objects.count(), conteos['pagos'])
+		self.assertGreater(conteos['pagos'], 40)
+		self.assertEqual(Notificacion.objects.count(), conteos['notificaciones'])
+		self.assertEqual(PreguntaFrecuente.objects.count(), conteos['preguntas'])
+		self.assertGreater(conteos['preguntas'], 0)
+
+		# Las columnas que mantiene save() quedan como si se hubieran guardado uno a uno
+		self.assertFalse(Cliente.objects.exclude(cobrador=F('zona__cobrador')).exists())
+		antes = sorted(Cliente.objects.values_list('pk', 'nombre_mostrado', 'cobrador_nombre'))
+		rellenar_denormalizados(Cliente, get_user_model(), Zona)
+		self.assertEqual(sorted(Cliente.objects.values_list('pk', 'nombre_mostrado', 'cobrador_nombre')), antes)
+		cliente = Cliente.objects.order_by('pk').first()
+		self.assertEqual(list(Cliente.objects.search(cliente.dni)), [cliente])
+
+		# El libro cuadra con la deuda y el acumulado con los pagos
+		self.assertEqual(reconciliar_deuda()['diferencias'], 0)
+		self.assertEqual(
+			IngresoDiario.objects.aggregate(s=Sum('suma_monto'))['s'],
+			Pago.objects.filter(estado='completado').aggregate(s=Sum('monto'))['s'],
+		)
+
+		with self.assertRaises(ValueError):
+			generar()
+
+	def test_misma_semilla_mismos_datos(self):
+		generar('a')
+		generar('b')
+		por_etiqueta = [
+			list(Cliente.objects.filter(usuario__username__startswith=f'{e}_').order_by('pk').values_list(
+				'nombre_mostrado', 'estado', 'deuda_actual', 'plan'))
+			for e in 'ab'
+		]
+		self.assertEqual(por_etiqueta[0], por_etiqueta[1])
+		self.assertNotEqual(*(
+			list(Cliente.objects.filter(usuario__username__startswith=f'{e}_').values_list('dni', flat=True)) for e in 'ab'
+		))
+
+	def test_comando(self):
+		with self.assertRaises(CommandError):
+			call_command('generar_datos_sinteticos', '--etiqueta', 'Con Espacios', stdout=StringIO())
+
+
+class BenchmarkTests(TestCase):
+	def setUp(self):
+		generar()
+		self.dir = tempfile.TemporaryDirectory()
+		self.addCleanup(self.dir.cleanup)
+
+	def _correr(self, *args):
+		salida = os.path.join(self.dir.name, 'resultado.json')
+		call_command('benchmark', '--repeticiones', '1', '--salida', salida, *args, stdout=StringIO())
+		with open(salida, encoding='utf-8') as f:
+			return json.load(f)
+
+	def test_corre_todo_sin_dejar_cambios(self):
+		estados = sorted(Cliente.objects.values_list('pk', 'estado'))
+		notificaciones = Notificacion.objects.count()
+		resultado = self._correr()
+		self.assertEqual(set(resultado['resultados']), set(BENCHMARKS))
+		for nombre, medicion in resultado['resultados'].items():
+			self.assertIn('ms', medicion, nombre)
+		self.assertGreater(resultado['resultados']['lista_pagos']['consultas'], 0)
+		self.assertEqual(resultado['volumen']['clientes'], 40)
+		self.assertEqual(sorted(Cliente.objects.values_list('pk', 'estado')), estados)
+		self.assertEqual(Notificacion.objects.count(), notificaciones)
+		self.assertFalse(CorteRegistro.objects.exists())
+
+	def test_chatbot_sin_preguntas_se_omite(self):
+		PreguntaFrecuente.objects.all().delete()
+		resultado = self._correr('chatbot_procesar_mensaje')
+		self.assertEqual(resultado['resultados']['chatbot_procesar_mensaje'], {'omitido': 'sin datos'})
+
+	def test_regresion_frente_a_la_base(self):
+		base = self._correr('lista_pagos')
+		base['resultados']['lista_pagos']['consultas'] -= 1
+		ruta = os.path.join(self.dir.name, 'base.json')
+		with open(ruta, 'w', encoding='utf-8') as f:
+			json.dump(base, f)
+		with self.assertRaisesMessage(CommandError, 'lista_pagos consultas'):
+			self._correr('lista_pagos', '--base', ruta)
+
+	def test_comparar(self):
+		base = {'volumen': {'clientes': 10}, 'base_datos': 'sqlite', 'resultados': {
+			'a': {'ms': {'p50': 100}, 'consultas': 5},
+			'b': {'ms': {'p50': 100}, 'consultas': 5},
+		}}
+		actual = {'volumen': {'clientes': 20}, 'base_datos': 'sqlite', 'resultados': {
+			'a': {'ms': {'p50': 115}, 'consultas': 5},
+			'b': {'ms': {'p50': 130}, 'consultas': 5},
+			'c': {'omitido': 'sin datos'},
+		}}
+		regresiones, advertencias = comparar(actual, base, tolerancia=0.2)
+		self.assertEqual(regresiones, [{'benchmark': 'b', 'metrica': 'p50_ms', 'base': 100, 'actual': 130}])
+		self.assertEqual(len(advertencias), 2)
+
+class InstrumentacionVistasTests(TestCase):
+	def setUp(self):
+		registro.limpiar()
+		self.zona = Zona.objects.create(nombre='Zona Medida', codigo='ZM')
+		self.admin = User.objects.create_user(username='admin_metricas', password='x', tipo_usuario='admin')
+		usuario = User.objects.create_user(username='cli42000000', password='x')
+		cliente = Cliente.objects.create(
+			usuario=usuario, dni='42000000', telefono_principal='900000000', direccion='Calle Test',
+			zona=self.zona, fecha_instalacion='2025-01-01',
+		)
+		Pago.objects.create(cliente=cliente, monto=10, metodo_pago='yape', fecha_pago=timezone.now(), registrado_por=self.admin)
+		self.client.force_login(self.admin)
+
+	def tearDown(self):
+		registro.limpiar()
+
+	def test_percentiles_por_vista(self):
+		for _ in range(3):
+			self.client.get(reverse('lista_pagos'))
+		datos = self.client.get(reverse('metricas_vistas')).json()
+		lista = datos['vistas']['lista_pagos']
+		self.assertEqual(lista['muestras'], 3)
+		self.assertGreater(lista['consultas']['p50'], 0)
+		self.assertLessEqual(lista['latencia_ms']['p50'], lista['latencia_ms']['p99'])
+		self.assertEqual(lista['presupuesto']['consultas'], 12)
+		self.assertEqual(lista['excesos'], 0)
+
+	@override_settings(PRESUPUESTOS_VISTAS={'lista_pagos': {'consultas': 1}})
+	def test_exceso_de_presupuesto_se_registra(self):
+		with self.assertLogs('cobramax_core.instrumentacion', 'WARNING') as logs:
+			self.client.get(reverse('lista_pagos'))
+		self.assertIn('lista_pagos fuera de presupuesto', logs.output[0])
+		self.assertEqual(registro.resumen()['lista_pagos']['excesos'], 1)
+
+	@override_settings(ESTADISTICAS_CACHE_TTL=30)
+	def test_aciertos_y_fallos_de_cache(self):
+		from django.core.cache import cache
+		cache.clear()
+		self.client.get(reverse('dashboard_reportes'))
+		self.client.get(reverse('dashboard_reportes'))
+		tablero = registro.resumen()['dashboard_reportes']['cache']
+		self.assertGreater(tablero['fallos'], 0)
+		self.assertGreater(tablero['aciertos'], 0)
+		cache.clear()
+
+	def test_limpiar_solo_por_post(self):
+		self.client.get(reverse('lista_pagos'))
+		self.client.get(reverse('metricas_vistas'), {'limpiar': 1})
+		self.assertIn('lista_pagos', registro.resumen())
+		datos = self.client.post(reverse('metricas_vistas')).json()
+		self.assertEqual(datos['vistas']['lista_pagos']['muestras'], 1)
+		self.assertNotIn('lista_pagos', registro.resumen())
+
+	def test_solo_admin(self):
+		cobrador = User.objects.create_user(username='cob_metricas', password='x', tipo_usuario='cobrador')
+		self.client.force_login(cobrador)
+		self.assertEqual(self.client.get(reverse('metricas_vistas')).status_code, 302)
@@ -17,8 +17,10 @@ Including another URLconf
 # cobramax_core/urls.py
 from django.contrib import admin
 from django.urls import path, include
+from . import views
 
 urlpatterns = [
+    path('admin/metricas/vistas/', views.metricas_vistas, name='metricas_vistas'),
     path('admin/', admin.site.urls),
     path('', include('usuarios.urls')),
     path('zonas/', include('zonas.urls')),
@@ -0,0 +1,21 @@
+# cobramax_core/views.py
+import os
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
+from django.views.decorators.http import require_http_methods
+from usuarios.decorators import require_roles
+from .instrumentacion import registro
+
+
+@login_required
+@require_roles(['admin'])
+@require_http_methods(['GET', 'POST'])
+def metricas_vistas(request):
+    """Percentiles de latencia, consultas y caché por vista (proceso actual).
+
+    Un POST además reinicia la ventana después de leerla; un GET no cambia nada.
+    """
+    datos = {'proceso': os.getpid(), 'vistas': registro.resumen()}
+    if request.method == 'POST':
+        registro.limpiar()
+    return JsonResponse(datos)
@@ -1,6 +1,6 @@
 # cobranza/admin.py
 from django.contrib import admin
-from .models import Pago, Transaccion
+from .models import Pago, Transaccion, EjecucionCiclo
 
 @admin.register(Pago)
 class PagoAdmin(admin.ModelAdmin):
@@ -50,4 +50,14 @@ class TransaccionAdmin(admin.ModelAdmin):
     
     def has_change_permission(self, request, obj=None):
         # Las transacciones no se pueden editar (son de auditoría)
-        return False
\ No newline at end of file
+        return False
+
+@admin.register(EjecucionCiclo)
+class EjecucionCicloAdmin(admin.ModelAdmin):
+    list_display = ('fecha', 'dia', 'accion', 'particiones', 'marcados', 'fecha_registro')
+    list_filter = ('accion', 'fecha')
+    readonly_fields = ('fecha', 'dia', 'accion', 'particiones', 'marcados', 'detalle', 'fecha_registro')
+
+    def has_add_permission(self, request):
+        # Las ejecuciones las registra el ciclo automáticamente
+        return False
@@ -0,0 +1,39 @@
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from clientes.models import Cliente
+from cobranza.services import ejecutar_facturacion, CHUNK_SIZE_DEFAULT
+
+
+class Command(BaseCommand):
+    help = 'Genera los cargos mensuales de los clientes que vencen hasta la fecha (idempotente por periodo)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fecha', default=None,
+                            help='Fecha de facturación AAAA-MM-DD (por defecto, hoy)')
+        parser.add_argument('--zona', type=int, default=None,
+                            help='Facturar sólo los clientes de esta zona')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE_DEFAULT,
+                            help='Clientes procesados por bloque/transacción')
+
+    def handle(self, *args, **options):
+        try:
+            fecha = date.fromisoformat(options['fecha']) if options['fecha'] else timezone.localdate()
+        except ValueError:
+            raise CommandError('La fecha debe tener el formato AAAA-MM-DD')
+        clientes = Cliente.objects.filter(zona_id=options['zona']) if options['zona'] else None
+        self.stdout.write(f"Facturando periodo {fecha:%Y-%m} al {fecha:%d/%m/%Y}")
+
+        def reportar_chunk(numero, filas, segundos, monto):
+            self.stdout.write(f'  bloque {numero}: {filas} clientes (S/ {monto}) en {segundos * 1000:.1f} ms')
+
+        resultado = ejecutar_facturacion(
+            fecha, clientes=clientes, chunk_size=options['chunk_size'] or CHUNK_SIZE_DEFAULT, on_chunk=reportar_chunk,
+        )
+
+        segundos = resultado['segundos']
+        velocidad = resultado['facturados'] / segundos if segundos > 0 else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Facturados {resultado['facturados']} clientes por S/ {resultado['monto']}"
+        ))
+        self.stdout.write(f"{resultado['chunks']} bloques en {segundos:.2f}s ({velocidad:.0f} filas/s)")
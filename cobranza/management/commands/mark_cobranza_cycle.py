@@ -1,47 +1,40 @@
 from django.core.management.base import BaseCommand
 from django.utils import timezone
-from clientes.models import Cliente
-from cobranza.models import CorteRegistro
+from cobranza.services import ejecutar_ciclo_cobranza, CHUNK_SIZE_DEFAULT
 
 class Command(BaseCommand):
     help = 'Marca clientes en riesgo o cortados según el día del mes y su deuda'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE_DEFAULT,
+                            help='Clientes procesados por bloque/transacción')
+        parser.add_argument('--dia', type=int, default=None,
+                            help='Forzar el día del mes (por defecto, hoy)')
+
     def handle(self, *args, **options):
-        today = timezone.localdate()
-        day = today.day
+        day = options.get('dia') or timezone.localdate().day
+        chunk_size = options.get('chunk_size') or CHUNK_SIZE_DEFAULT
         self.stdout.write(f"Ejecutando ciclo de cobranza para día {day}")
 
-        # Periodo 8-10: marcar en riesgo (usamos estado 'moroso' para señalizar)
-        if 8 <= day <= 10:
-            clientes = Cliente.objects.filter(estado='activo', deuda_actual__gt=0)
-            for c in clientes:
-                c.estado = 'moroso'
-                c.save()
-                CorteRegistro.objects.create(
-                    cliente=c,
-                    tipo='alerta',
-                    detalle=f'Marcado en riesgo por fecha del mes ({day})',
-                    creado_por=None
-                )
-            self.stdout.write(self.style.SUCCESS(f'Marcados {clientes.count()} clientes como en riesgo'))
+        if day < 8:
+            self.stdout.write('No hay acciones programadas antes del día 8')
+            return
+
+        def reportar_chunk(numero, filas, segundos):
+            self.stdout.write(f'  bloque {numero}: {filas} clientes en {segundos * 1000:.1f} ms')
 
+        resultado = ejecutar_ciclo_cobranza(day, chunk_size=chunk_size, on_chunk=reportar_chunk)
+
+        marcados = resultado['marcados']
+        segundos = resultado['segundos']
+        # Periodo 8-10: marcar en riesgo (usamos estado 'moroso' para señalizar)
+        if resultado['accion'] == 'alerta':
+            self.stdout.write(self.style.SUCCESS(f'Marcados {marcados} clientes como en riesgo'))
         # Después del día 10: marcar cortados (suspendido)
-        if day > 10:
-            clientes = Cliente.objects.filter(deuda_actual__gt=0).exclude(estado='suspendido')
-            count = 0
-            for c in clientes:
-                if c.estado != 'suspendido':
-                    c.estado = 'suspendido'
-                    c.save()
-                    CorteRegistro.objects.create(
-                        cliente=c,
-                        tipo='corte',
-                        detalle=f'Servicio cortado por falta de pago (día {day})',
-                        creado_por=None
-                    )
-                    count += 1
-            self.stdout.write(self.style.SUCCESS(f'Cortados {count} clientes'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Cortados {marcados} clientes'))
 
-        if day < 8:
-            self.stdout.write('No hay acciones programadas antes del día 8')
-*** End Patch
\ No newline at end of file
+        velocidad = marcados / segundos if segundos > 0 else 0
+        self.stdout.write(
+            f"{resultado['chunks']} bloques en {segundos:.2f}s ({velocidad:.0f} filas/s)"
+        )
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from cobranza.services import reconciliar_deuda, CHUNK_SIZE_DEFAULT
+
+
+class Command(BaseCommand):
+    help = 'Recalcula la deuda de cada cliente desde el libro de transacciones e informa las diferencias'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE_DEFAULT,
+                            help='Clientes revisados por bloque')
+        parser.add_argument('--corregir', action='store_true',
+                            help='Igualar deuda_actual al saldo del libro')
+        parser.add_argument('--limite', type=int, default=50,
+                            help='Máximo de diferencias a listar')
+
+    def handle(self, *args, **options):
+        limite = options['limite']
+        listadas = []
+
+        def reportar(cliente_id, dni, deuda, libro):
+            if len(listadas) < limite:
+                listadas.append(cliente_id)
+                self.stdout.write(f'  cliente {cliente_id} (DNI {dni}): deuda {deuda}, libro {libro}, diferencia {deuda - libro}')
+
+        resultado = reconciliar_deuda(
+            chunk_size=options['chunk_size'], corregir=options['corregir'], on_diferencia=reportar,
+        )
+
+        if not resultado['diferencias']:
+            self.stdout.write(self.style.SUCCESS(f"{resultado['clientes']} clientes revisados: sin diferencias"))
+            return
+        self.stdout.write(self.style.WARNING(
+            f"{resultado['diferencias']} de {resultado['clientes']} clientes con diferencia "
+            f"(desfase total S/ {resultado['desfase']})"
+        ))
+        if options['corregir']:
+            self.stdout.write(self.style.SUCCESS(f"Corregidos {resultado['corregidos']} clientes según el libro"))
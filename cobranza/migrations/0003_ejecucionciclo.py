@@ -0,0 +1,31 @@
+# Generated by Django 5.0.2 on 2026-10-18 00:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cobranza', '0002_corteregistro'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EjecucionCiclo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('dia', models.PositiveSmallIntegerField()),
+                ('accion', models.CharField(blank=True, max_length=20)),
+                ('particiones', models.PositiveIntegerField(default=0)),
+                ('marcados', models.PositiveIntegerField(default=0)),
+                ('detalle', models.JSONField(default=dict)),
+                ('fecha_registro', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Ejecución de ciclo',
+                'verbose_name_plural': 'Ejecuciones de ciclo',
+                'ordering': ['-fecha_registro'],
+            },
+        ),
+    ]
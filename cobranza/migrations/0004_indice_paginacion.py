@@ -0,0 +1,20 @@
+# Generated by Django 5.0.2 on 2026-10-18 00:53
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientes', '0004_indice_paginacion'),
+        ('cobranza', '0003_ejecucionciclo'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pago',
+            index=models.Index(fields=['-fecha_pago', '-id'], name='cobranza_pa_fecha_p_6e496e_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.0.2 on 2026-10-18 01:03
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def abrir_libro(apps, schema_editor):
+    # La deuda actual de cada cliente sin movimientos pasa a ser su saldo inicial
+    Cliente = apps.get_model('clientes', 'Cliente')
+    Transaccion = apps.get_model('cobranza', 'Transaccion')
+    clientes = (
+        Cliente.objects.exclude(deuda_actual=0)
+        .exclude(id__in=Transaccion.objects.values('cliente_id'))
+        .values_list('id', 'deuda_actual')
+    )
+    Transaccion.objects.bulk_create(
+        (
+            Transaccion(cliente_id=cliente_id, tipo='ajuste', monto=deuda, saldo_anterior=0,
+                        saldo_posterior=deuda, descripcion='Saldo inicial')
+            for cliente_id, deuda in clientes.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientes', '0004_indice_paginacion'),
+        ('cobranza', '0004_indice_paginacion'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='transaccion',
+            name='usuario',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(abrir_libro, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.0.2 on 2026-10-18 01:04
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientes', '0004_indice_paginacion'),
+        ('cobranza', '0005_libro_deuda'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaccion',
+            name='periodo',
+            field=models.CharField(blank=True, default='', max_length=7),
+        ),
+        migrations.AddConstraint(
+            model_name='transaccion',
+            constraint=models.UniqueConstraint(condition=models.Q(('tipo', 'cargo')), fields=('cliente', 'periodo'), name='cobranza_cargo_unico_por_periodo'),
+        ),
+    ]
@@ -1,10 +1,19 @@
 # cobranza/models.py
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth import get_user_model
 from clientes.models import Cliente
 
 Usuario = get_user_model()
 
+
+class PagoQuerySet(models.QuerySet):
+    def visible_to(self, user):
+        """Pagos que `user` puede ver según su alcance (ver zonas.services)"""
+        from zonas.services import alcance_de
+
+        return self.filter(alcance_de(user).filtro_clientes('cliente'))
+
+
 class Pago(models.Model):
     ESTADO_CHOICES = [
         ('pendiente', 'Pendiente'),
@@ -53,6 +62,8 @@ class Pago(models.Model):
         on_delete=models.PROTECT,
         related_name='pagos_registrados'
     )
+
+    objects = PagoQuerySet.as_manager()
     
     class Meta:
         verbose_name = "Pago"
@@ -62,6 +73,8 @@ class Pago(models.Model):
             models.Index(fields=['cliente', 'fecha_pago']),
             models.Index(fields=['estado']),
             models.Index(fields=['codigo_transaccion']),
+            # Paginación por cursor (fecha_pago, id)
+            models.Index(fields=['-fecha_pago', '-id']),
         ]
     
     def __str__(self):
@@ -73,14 +86,10 @@ class Pago(models.Model):
             import uuid
             self.codigo_transaccion = f"PAGO-{uuid.uuid4().hex[:8].upper()}"
         
-        # Si el pago se marca como completado, actualizar la deuda del cliente
-        if self.estado == 'completado' and self.pk:
-            original = Pago.objects.get(pk=self.pk)
-            if original.estado != 'completado':
-                self.cliente.deuda_actual -= self.monto
-                self.cliente.save()
-        
-        super().save(*args, **kwargs)
+        # La deuda del cliente la ajustan las señales del libro (ver abajo) en
+        # la misma transacción que el pago
+        with transaction.atomic():
+            super().save(*args, **kwargs)
     
     def puede_editar(self):
         """Determina si el pago puede ser editado"""
@@ -98,20 +107,32 @@ class Transaccion(models.Model):
         ('cargo', 'Cargo'),
     ]
     
-    pago = models.ForeignKey(Pago, on_delete=models.CASCADE, null=True, blank=True)
+    # SET_NULL: borrar un pago no borra sus asientos (la reversión se asienta aparte)
+    pago = models.ForeignKey(Pago, on_delete=models.SET_NULL, null=True, blank=True)
     cliente = models.ForeignKey(Cliente, on_delete=models.PROTECT)
     tipo = models.CharField(max_length=10, choices=TIPO_CHOICES)
+    # Variación de la deuda: positiva para cargos, negativa para pagos
     monto = models.DecimalField(max_digits=10, decimal_places=2)
     saldo_anterior = models.DecimalField(max_digits=10, decimal_places=2)
     saldo_posterior = models.DecimalField(max_digits=10, decimal_places=2)
     descripcion = models.TextField()
     fecha_transaccion = models.DateTimeField(auto_now_add=True)
-    usuario = models.ForeignKey(Usuario, on_delete=models.PROTECT)
+    # Vacío en movimientos del sistema (saldo inicial, facturación automática)
+    usuario = models.ForeignKey(Usuario, on_delete=models.PROTECT, null=True, blank=True)
+    # Mes facturado ('AAAA-MM') de los cargos mensuales
+    periodo = models.CharField(max_length=7, blank=True, default='')
     
     class Meta:
         verbose_name = "Transacción"
         verbose_name_plural = "Transacciones"
         ordering = ['-fecha_transaccion']
+        constraints = [
+            # Un solo cargo mensual por cliente y periodo: la facturación es idempotente
+            models.UniqueConstraint(
+                fields=['cliente', 'periodo'], condition=models.Q(tipo='cargo'),
+                name='cobranza_cargo_unico_por_periodo',
+            ),
+        ]
     
     def __str__(self):
         return f"{self.get_tipo_display()} - {self.cliente} - S/ {self.monto}"
@@ -139,21 +160,89 @@ class CorteRegistro(models.Model):
         return f"{self.get_tipo_display()} - {self.cliente} - {self.fecha}"
 
 
-# Señales: reconectar cliente si el pago se completa y la deuda queda en 0
-from django.db.models.signals import post_save
+
+class EjecucionCiclo(models.Model):
+    """Resumen de una ejecución del ciclo de cobranza (una fila por corrida)."""
+    fecha = models.DateField()
+    dia = models.PositiveSmallIntegerField()
+    accion = models.CharField(max_length=20, blank=True)
+    particiones = models.PositiveIntegerField(default=0)
+    marcados = models.PositiveIntegerField(default=0)
+    detalle = models.JSONField(default=dict)  # conteos por partición
+    fecha_registro = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Ejecución de ciclo'
+        verbose_name_plural = 'Ejecuciones de ciclo'
+        ordering = ['-fecha_registro']
+
+    def __str__(self):
+        return f"Ciclo {self.fecha} ({self.accion or 'sin acción'}) - {self.marcados} clientes"
+
+# Señales del libro de deuda: cada pago que entra o sale del estado
+# 'completado' se asienta como Transaccion y ajusta la deuda del cliente
+from django.db.models.signals import pre_delete, pre_save, post_save
 from django.dispatch import receiver
 
 
+@receiver(pre_save, sender=Pago)
+def pago_pre_save_libro(sender, instance, **kwargs):
+    # Bloquea la fila del pago hasta el final de Pago.save(): dos validaciones
+    # simultáneas del mismo pago no pueden descontarlo dos veces
+    instance._estado_libro_anterior = None
+    if instance.pk:
+        instance._estado_libro_anterior = (
+            Pago.objects.select_for_update().filter(pk=instance.pk).values_list('estado', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Pago)
+def pago_post_save_libro(sender, instance, **kwargs):
+    from .services import aplicar_pago, revertir_pago
+
+    anterior = getattr(instance, '_estado_libro_anterior', None)
+    if instance.estado == 'completado' and anterior != 'completado':
+        movimiento = aplicar_pago(instance)
+    elif anterior == 'completado' and instance.estado != 'completado':
+        movimiento = revertir_pago(instance)
+    else:
+        return
+    # Mantener la instancia en memoria al día para los receptores siguientes
+    instance.cliente.deuda_actual = movimiento.saldo_posterior
+
+
+@receiver(pre_delete, sender=Pago)
+def pago_pre_delete_libro(sender, instance, **kwargs):
+    # Un pago completado que se borra vuelve a la deuda; sus asientos quedan
+    # en el libro con pago=NULL
+    from .services import revertir_pago
+
+    estado = Pago.objects.select_for_update().filter(pk=instance.pk).values_list('estado', flat=True).first()
+    if estado == 'completado':
+        revertir_pago(instance, motivo='eliminado')
+
+
+@receiver(post_save, sender=Cliente)
+def cliente_post_save_saldo_inicial(sender, instance, created, **kwargs):
+    # Un cliente creado con deuda abre el libro con ese saldo
+    if created and instance.deuda_actual:
+        Transaccion.objects.create(
+            cliente=instance, tipo='ajuste', monto=instance.deuda_actual,
+            saldo_anterior=0, saldo_posterior=instance.deuda_actual, descripcion='Saldo inicial',
+        )
+
+
+# Reconectar cliente si el pago se completa y la deuda queda en 0
 @receiver(post_save, sender=Pago)
 def pago_post_save_update_cliente(sender, instance, created, **kwargs):
     try:
         # Si el pago está completado, actualizar estado del cliente si procede
         if instance.estado == 'completado':
             cliente = instance.cliente
-            # actualizar deuda ya ocurre en save(), pero verificamos estado
+            # la deuda ya la actualizó pago_post_save_libro
             if cliente.deuda_actual <= 0 and cliente.estado in ['suspendido', 'moroso']:
                 cliente.estado = 'activo'
-                cliente.save()
+                cliente.save(update_fields=['estado', 'fecha_actualizacion'])
                 CorteRegistro.objects.create(
                     cliente=cliente,
                     tipo='reconexion',
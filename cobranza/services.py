@@ -0,0 +1,317 @@
+# cobranza/services.py
+import calendar
+import time
+import logging
+from decimal import Decimal
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Q, Sum
+from django.utils import timezone
+from clientes.models import Cliente
+from .models import CorteRegistro, Transaccion
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE_DEFAULT = 1000
+
+
+def accion_ciclo_para_dia(day):
+    """Devuelve la acción del ciclo de cobranza que corresponde al día del mes.
+
+    - 8 a 10: marcar en riesgo (estado 'moroso') a los clientes activos con deuda.
+    - después del 10: cortar (estado 'suspendido') a todo cliente con deuda.
+    - antes del 8: no hay acción (None).
+    """
+    if 8 <= day <= 10:
+        return {
+            'accion': 'alerta',
+            'estado_nuevo': 'moroso',
+            'detalle': f'Marcado en riesgo por fecha del mes ({day})',
+        }
+    if day > 10:
+        return {
+            'accion': 'corte',
+            'estado_nuevo': 'suspendido',
+            'detalle': f'Servicio cortado por falta de pago (día {day})',
+        }
+    return None
+
+
+def _candidatos(clientes, accion):
+    """Filtra el queryset base con la condición de la acción del ciclo."""
+    if accion == 'alerta':
+        return clientes.filter(estado='activo', deuda_actual__gt=0)
+    return clientes.filter(deuda_actual__gt=0).exclude(estado='suspendido')
+
+
+def ejecutar_ciclo_cobranza(day, clientes=None, chunk_size=CHUNK_SIZE_DEFAULT, on_chunk=None):
+    """Motor set-based del ciclo de cobranza.
+
+    Recorre los candidatos en bloques paginados por id (keyset), y por cada
+    bloque, dentro de su propia transacción:
+      1. bloquea los ids del bloque (`select_for_update`),
+      2. cambia `estado` con un único `UPDATE ... WHERE id IN (...)`,
+      3. inserta los `CorteRegistro` correspondientes con `bulk_create`.
+
+    `clientes` permite restringir el universo (p.ej. una zona) y por defecto
+    es `Cliente.objects.all()`. `on_chunk(numero, filas, segundos)` se invoca
+    tras confirmar cada bloque.
+
+    Retorna un dict con la acción, filas marcadas, bloques y tiempo total.
+    """
+    regla = accion_ciclo_para_dia(day)
+    if regla is None:
+        return {'accion': None, 'marcados': 0, 'chunks': 0, 'segundos': 0.0}
+
+    if clientes is None:
+        clientes = Cliente.objects.all()
+    candidatos = _candidatos(clientes, regla['accion'])
+
+    inicio = time.monotonic()
+    ultimo_id = 0
+    total = 0
+    numero = 0
+
+    while True:
+        t0 = time.monotonic()
+        with transaction.atomic():
+            ids = list(
+                candidatos.select_for_update()
+                .filter(id__gt=ultimo_id)
+                .order_by('id')
+                .values_list('id', flat=True)[:chunk_size]
+            )
+            if not ids:
+                break
+
+            Cliente.objects.filter(id__in=ids).update(
+                estado=regla['estado_nuevo'],
+                fecha_actualizacion=timezone.now(),
+            )
+            CorteRegistro.objects.bulk_create([
+                CorteRegistro(
+                    cliente_id=cliente_id,
+                    tipo=regla['accion'],
+                    detalle=regla['detalle'],
+                    creado_por=None,
+                )
+                for cliente_id in ids
+            ])
+
+        ultimo_id = ids[-1]
+        total += len(ids)
+        numero += 1
+        if on_chunk:
+            on_chunk(numero, len(ids), time.monotonic() - t0)
+
+    segundos = time.monotonic() - inicio
+    logger.info('Ciclo cobranza día %s (%s): %s clientes en %s bloques, %.2fs',
+                day, regla['accion'], total, numero, segundos)
+    return {'accion': regla['accion'], 'marcados': total, 'chunks': numero, 'segundos': segundos}
+
+
+# =======================
+# Libro de deuda
+# =======================
+
+def registrar_movimiento(cliente_id, tipo, variacion, descripcion, usuario=None, pago=None):
+    """Aplica `variacion` a la deuda del cliente y la asienta en el libro.
+
+    `variacion` > 0 aumenta la deuda (cargo) y < 0 la reduce (pago). La fila
+    del cliente se bloquea para leer el saldo anterior y la deuda cambia con
+    un único `UPDATE ... SET deuda_actual = deuda_actual + variacion`, así
+    dos movimientos simultáneos nunca pierden uno de los dos. Las
+    `Transaccion` sólo se insertan: corregir un error es otro movimiento.
+    """
+    variacion = Decimal(str(variacion))
+    with transaction.atomic():
+        saldo_anterior = (
+            Cliente.objects.select_for_update().filter(pk=cliente_id)
+            .values_list('deuda_actual', flat=True).get()
+        )
+        Cliente.objects.filter(pk=cliente_id).update(deuda_actual=F('deuda_actual') + variacion)
+        return Transaccion.objects.create(
+            cliente_id=cliente_id,
+            pago=pago,
+            tipo=tipo,
+            monto=variacion,
+            saldo_anterior=saldo_anterior,
+            saldo_posterior=saldo_anterior + variacion,
+            descripcion=descripcion,
+            usuario=usuario,
+        )
+
+
+def aplicar_pago(pago):
+    """Descuenta de la deuda un pago que acaba de quedar completado"""
+    return registrar_movimiento(
+        pago.cliente_id, 'pago', -Decimal(str(pago.monto)),
+        f'Pago {pago.codigo_transaccion}', usuario=pago.validado_por or pago.registrado_por, pago=pago,
+    )
+
+
+def revertir_pago(pago, motivo=None):
+    """Devuelve a la deuda un pago que deja de estar completado (o se elimina)"""
+    return registrar_movimiento(
+        pago.cliente_id, 'ajuste', Decimal(str(pago.monto)),
+        f'Reversión del pago {pago.codigo_transaccion} ({motivo or pago.estado})', usuario=pago.validado_por, pago=pago,
+    )
+
+
+def _saldos_libro(cliente_ids):
+    """{cliente_id: saldo según el libro} con una sola agregación"""
+    return dict(
+        Transaccion.objects.filter(cliente_id__in=cliente_ids).order_by()
+        .values('cliente_id').annotate(saldo=Sum('monto')).values_list('cliente_id', 'saldo')
+    )
+
+
+def reconciliar_deuda(chunk_size=CHUNK_SIZE_DEFAULT, corregir=False, on_diferencia=None):
+    """Compara `deuda_actual` con el saldo que resulta del libro de transacciones.
+
+    Recorre los clientes por bloques de id; por bloque hace una sola
+    agregación del libro (`SUM(monto)` agrupado por cliente). Con
+    `corregir=True` las deudas con diferencia se igualan al libro con un
+    `bulk_update` por bloque. `on_diferencia(cliente_id, dni, deuda, libro)`
+    se invoca por cada diferencia encontrada.
+
+    Retorna {'clientes': revisados, 'diferencias': n, 'desfase': suma de diferencias, 'corregidos': n}.
+    """
+    ultimo_id = 0
+    revisados = diferencias = corregidos = 0
+    desfase = Decimal('0')
+
+    while True:
+        filas = list(
+            Cliente.objects.filter(id__gt=ultimo_id).order_by('id')
+            .values_list('id', 'dni', 'deuda_actual')[:chunk_size]
+        )
+        if not filas:
+            break
+        ultimo_id = filas[-1][0]
+        revisados += len(filas)
+
+        libro = _saldos_libro([f[0] for f in filas])
+        con_diferencia = []
+        for cliente_id, dni, deuda in filas:
+            saldo = libro.get(cliente_id, Decimal('0'))
+            if saldo != deuda:
+                diferencias += 1
+                desfase += deuda - saldo
+                if on_diferencia:
+                    on_diferencia(cliente_id, dni, deuda, saldo)
+                con_diferencia.append(cliente_id)
+
+        if corregir and con_diferencia:
+            with transaction.atomic():
+                # Bloquear y releer el libro: un movimiento concurrente no se pisa
+                ids = list(Cliente.objects.select_for_update().filter(id__in=con_diferencia).values_list('id', flat=True))
+                libro = _saldos_libro(ids)
+                Cliente.objects.bulk_update(
+                    [Cliente(pk=cliente_id, deuda_actual=libro.get(cliente_id, Decimal('0'))) for cliente_id in ids],
+                    ['deuda_actual'], batch_size=chunk_size,
+                )
+            corregidos += len(ids)
+
+    return {'clientes': revisados, 'diferencias': diferencias, 'desfase': desfase, 'corregidos': corregidos}
+
+
+# =======================
+# Facturación mensual
+# =======================
+
+def periodo_de(fecha):
+    return fecha.strftime('%Y-%m')
+
+
+def clientes_a_facturar(fecha, clientes=None):
+    """Clientes con cargo mensual vencido a `fecha` y aún sin cargo del periodo.
+
+    Vence quien tiene `dia_vencimiento` <= día de `fecha` (sin día, el de
+    `FACTURACION_DIA_DEFECTO`); el último día del mes vencen también los
+    días que ese mes no tiene (p.ej. 30 y 31 en febrero). Así una corrida
+    perdida se recupera en la siguiente. No se factura a clientes
+    inactivos o suspendidos ni antes de su instalación.
+    """
+    if clientes is None:
+        clientes = Cliente.objects.all()
+    dia = fecha.day
+    if dia == calendar.monthrange(fecha.year, fecha.month)[1]:
+        dia = 31
+    vence = Q(dia_vencimiento__lte=dia)
+    if getattr(settings, 'FACTURACION_DIA_DEFECTO', 1) <= dia:
+        vence |= Q(dia_vencimiento__isnull=True)
+    ya_facturado = Transaccion.objects.filter(cliente=OuterRef('pk'), tipo='cargo', periodo=periodo_de(fecha))
+    return (
+        clientes.filter(vence, monto_mensual__gt=0, fecha_instalacion__lte=fecha)
+        .exclude(estado__in=['inactivo', 'suspendido'])
+        .exclude(Exists(ya_facturado))
+    )
+
+
+def ejecutar_facturacion(fecha, clientes=None, chunk_size=CHUNK_SIZE_DEFAULT, on_chunk=None):
+    """Genera los cargos mensuales del periodo de `fecha` por bloques.
+
+    Igual que el ciclo de cobranza, por cada bloque de ids y en su propia
+    transacción: bloquea las filas, suma `monto_mensual` a la deuda de todo
+    el bloque con un único `UPDATE` e inserta sus `Transaccion` de cargo con
+    `bulk_create`. Un cliente ya facturado en el periodo deja de ser
+    candidato (y la restricción única lo garantiza), así que repetir la
+    corrida o ejecutar zonas en paralelo no duplica cargos.
+    `on_chunk(numero, filas, segundos, monto)` se invoca tras confirmar cada
+    bloque.
+
+    Retorna un dict con el periodo, clientes facturados, monto total, bloques y tiempo.
+    """
+    periodo = periodo_de(fecha)
+    candidatos = clientes_a_facturar(fecha, clientes)
+    descripcion = f'Cargo mensual {periodo}'
+
+    inicio = time.monotonic()
+    ultimo_id = 0
+    total = 0
+    monto_total = Decimal('0')
+    numero = 0
+
+    while True:
+        t0 = time.monotonic()
+        with transaction.atomic():
+            filas = list(
+                candidatos.select_for_update()
+                .filter(id__gt=ultimo_id)
+                .order_by('id')
+                .values_list('id', 'deuda_actual', 'monto_mensual')[:chunk_size]
+            )
+            if not filas:
+                break
+            ids = [f[0] for f in filas]
+
+            Cliente.objects.filter(id__in=ids).update(
+                deuda_actual=F('deuda_actual') + F('monto_mensual'),
+                fecha_actualizacion=timezone.now(),
+            )
+            Transaccion.objects.bulk_create([
+                Transaccion(
+                    cliente_id=cliente_id,
+                    tipo='cargo',
+                    monto=monto,
+                    saldo_anterior=deuda,
+                    saldo_posterior=deuda + monto,
+                    descripcion=descripcion,
+                    periodo=periodo,
+                )
+                for cliente_id, deuda, monto in filas
+            ])
+
+        ultimo_id = ids[-1]
+        monto = sum(f[2] for f in filas)
+        total += len(filas)
+        monto_total += monto
+        numero += 1
+        if on_chunk:
+            on_chunk(numero, len(filas), time.monotonic() - t0, monto)
+
+    segundos = time.monotonic() - inicio
+    logger.info('Facturación %s: %s clientes (S/ %s) en %s bloques, %.2fs',
+                periodo, total, monto_total, numero, segundos)
+    return {'periodo': periodo, 'facturados': total, 'monto': monto_total, 'chunks': numero, 'segundos': segundos}
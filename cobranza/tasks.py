@@ -1,20 +1,130 @@
-from celery import shared_task
+from celery import shared_task, chord, group
 import logging
-from django.core.management import call_command
+from datetime import date
+from decimal import Decimal
+from django.utils import timezone
+from zonas.models import Zona
+from clientes.models import Cliente
+from .models import EjecucionCiclo
+from .services import ejecutar_ciclo_cobranza, accion_ciclo_para_dia, ejecutar_facturacion
 
 logger = logging.getLogger(__name__)
 
 
 @shared_task(bind=True)
-def mark_cobranza_cycle_task(self):
-    """Wrapper task to invoke the management command that marks clientes en riesgo/cortados.
+def mark_cobranza_cycle_task(self, day=None):
+    """Fan-out del ciclo de cobranza: una subtarea por zona, reunidas en un chord.
 
-    We call the management command to reuse existing logic and ensure single-point maintenance.
+    El día se fija aquí para que todas las particiones apliquen la misma regla
+    aunque alguna se ejecute pasada la medianoche. El callback
+    `resumir_ciclo_cobranza_task` agrega los conteos y guarda un `EjecucionCiclo`.
     """
+    fecha = timezone.localdate()
+    day = day or fecha.day
+    if accion_ciclo_para_dia(day) is None:
+        logger.info('Ciclo de cobranza: no hay acciones para el día %s', day)
+        return {'success': True, 'particiones': 0}
+
+    zona_ids = list(Zona.objects.order_by('id').values_list('id', flat=True))
+    if not zona_ids:
+        return {'success': True, 'particiones': 0}
+
+    header = group(mark_cobranza_cycle_zona_task.s(day, zona_id) for zona_id in zona_ids)
+    chord(header)(resumir_ciclo_cobranza_task.s(day, fecha.isoformat()))
+    return {'success': True, 'particiones': len(zona_ids)}
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=30)
+def mark_cobranza_cycle_zona_task(self, day, zona_id, previos=0):
+    """Ejecuta el ciclo para los clientes de una zona.
+
+    Es idempotente: cada bloque cambia `estado` e inserta sus `CorteRegistro`
+    en la misma transacción, y sólo toma clientes que aún no están en el
+    estado destino. Un reintento retoma lo que faltó sin duplicar cortes;
+    `previos` lleva los marcados en bloques ya confirmados por los intentos
+    anteriores, para que el total de la zona no pierda esos clientes.
+    """
+    marcados = previos
+
+    def contar(numero, filas, segundos):
+        nonlocal marcados
+        marcados += filas
+
     try:
-        call_command('mark_cobranza_cycle')
-        return {'success': True}
-    except Exception as e:
-        logger.exception('Error ejecutando mark_cobranza_cycle via Celery')
-        # Re-raise to let Celery record failure and retry according to its configuration
-        raise
+        resultado = ejecutar_ciclo_cobranza(day, clientes=Cliente.objects.filter(zona_id=zona_id), on_chunk=contar)
+    except Exception as exc:
+        logger.exception('Error en ciclo de cobranza para zona %s', zona_id)
+        raise self.retry(exc=exc, kwargs={'previos': marcados})
+    return {'zona_id': zona_id, 'accion': resultado['accion'], 'marcados': marcados}
+
+
+@shared_task
+def resumir_ciclo_cobranza_task(resultados, day, fecha):
+    """Callback del chord: agrega los conteos por zona en un único registro."""
+    regla = accion_ciclo_para_dia(day)
+    ejecucion = EjecucionCiclo.objects.create(
+        fecha=fecha,
+        dia=day,
+        accion=regla['accion'] if regla else '',
+        particiones=len(resultados),
+        marcados=sum(r['marcados'] for r in resultados),
+        detalle={str(r['zona_id']): r['marcados'] for r in resultados},
+    )
+    logger.info('Ciclo de cobranza %s: %s clientes en %s zonas', fecha, ejecucion.marcados, ejecucion.particiones)
+    return {'success': True, 'ejecucion_id': ejecucion.id, 'marcados': ejecucion.marcados}
+
+
+@shared_task(bind=True)
+def facturacion_mensual_task(self, fecha=None):
+    """Fan-out de la facturación mensual: una subtarea por zona, reunidas en un chord.
+
+    Se ejecuta a diario; cada corrida factura a quienes vencieron hasta la
+    fecha y todavía no tienen cargo del mes. `fecha` ('AAAA-MM-DD') se fija
+    aquí para que todas las particiones facturen el mismo periodo.
+    """
+    fecha = fecha or timezone.localdate().isoformat()
+    zona_ids = list(Zona.objects.order_by('id').values_list('id', flat=True))
+    if not zona_ids:
+        return {'success': True, 'particiones': 0}
+
+    header = group(facturar_zona_task.s(fecha, zona_id) for zona_id in zona_ids)
+    chord(header)(resumir_facturacion_task.s(fecha))
+    return {'success': True, 'particiones': len(zona_ids)}
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=30)
+def facturar_zona_task(self, fecha, zona_id, previos=0, monto_previo='0'):
+    """Factura los clientes de una zona. Idempotente por (cliente, periodo).
+
+    Como en el ciclo de cobranza, `previos` y `monto_previo` llevan lo
+    facturado en bloques ya confirmados por los intentos anteriores.
+    """
+    facturados, monto_total = previos, Decimal(monto_previo)
+
+    def contar(numero, filas, segundos, monto):
+        nonlocal facturados, monto_total
+        facturados += filas
+        monto_total += monto
+
+    try:
+        ejecutar_facturacion(date.fromisoformat(fecha), clientes=Cliente.objects.filter(zona_id=zona_id), on_chunk=contar)
+    except Exception as exc:
+        logger.exception('Error en facturación para zona %s', zona_id)
+        raise self.retry(exc=exc, kwargs={'previos': facturados, 'monto_previo': str(monto_total)})
+    return {'zona_id': zona_id, 'facturados': facturados, 'monto': str(monto_total)}
+
+
+@shared_task
+def resumir_facturacion_task(resultados, fecha):
+    """Callback del chord: registra la corrida como EjecucionCiclo('facturacion')."""
+    dia = date.fromisoformat(fecha)
+    ejecucion = EjecucionCiclo.objects.create(
+        fecha=dia,
+        dia=dia.day,
+        accion='facturacion',
+        particiones=len(resultados),
+        marcados=sum(r['facturados'] for r in resultados),
+        detalle={str(r['zona_id']): r['facturados'] for r in resultados},
+    )
+    logger.info('Facturación %s: %s clientes en %s zonas', fecha, ejecucion.marcados, ejecucion.particiones)
+    return {'success': True, 'ejecucion_id': ejecucion.id, 'facturados': ejecucion.marcados}
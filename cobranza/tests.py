@@ -1,3 +1,344 @@
+from io import StringIO
+from datetime import date
 from django.test import TestCase
+from cobramax_core.pruebas import ConsultasMixin
+from django.core.management import call_command
+from django.contrib.auth import get_user_model
+from clientes.models import Cliente
+from zonas.models import Zona
+from decimal import Decimal
+from django.utils import timezone
+from .models import CorteRegistro, Pago, Transaccion
+from .services import reconciliar_deuda
+
+User = get_user_model()
+
+
+def crear_cliente(zona, dni, deuda=0, estado='activo', **extra):
+	user = User.objects.create_user(username=f'cli{dni}', password='x')
+	extra.setdefault('fecha_instalacion', '2025-01-01')
+	return Cliente.objects.create(
+		usuario=user,
+		dni=dni,
+		telefono_principal='900000000',
+		direccion='Calle Test',
+		zona=zona,
+		deuda_actual=deuda,
+		estado=estado,
+		**extra,
+	)
+
+
+class MarkCobranzaCycleTests(TestCase):
+	def setUp(self):
+		self.zona = Zona.objects.create(nombre='Zona Test', codigo='ZT')
+		self.deudores = [crear_cliente(self.zona, f'1000000{i}', deuda=50) for i in range(5)]
+		self.al_dia = crear_cliente(self.zona, '20000000', deuda=0)
+		self.suspendido = crear_cliente(self.zona, '30000000', deuda=80, estado='suspendido')
+
+	def test_corte_en_bloques(self):
+		out = StringIO()
+		call_command('mark_cobranza_cycle', dia=12, chunk_size=2, stdout=out)
+		self.assertEqual(Cliente.objects.filter(estado='suspendido').count(), 6)
+		self.assertEqual(CorteRegistro.objects.filter(tipo='corte').count(), 5)
+		self.assertIn('Cortados 5 clientes', out.getvalue())
+		self.assertIn('3 bloques', out.getvalue())
+		self.al_dia.refresh_from_db()
+		self.assertEqual(self.al_dia.estado, 'activo')
+
+	def test_alerta_es_idempotente(self):
+		call_command('mark_cobranza_cycle', dia=9, stdout=StringIO())
+		call_command('mark_cobranza_cycle', dia=9, stdout=StringIO())
+		self.assertEqual(Cliente.objects.filter(estado='moroso').count(), 5)
+		self.assertEqual(CorteRegistro.objects.filter(tipo='alerta').count(), 5)
+
+	def test_sin_acciones_antes_del_dia_8(self):
+		out = StringIO()
+		call_command('mark_cobranza_cycle', dia=3, stdout=out)
+		self.assertFalse(CorteRegistro.objects.exists())
+		self.assertIn('No hay acciones', out.getvalue())
+
+
+class CicloParticionadoTests(TestCase):
+	def setUp(self):
+		from cobramax_core.celery import app
+		self.app = app
+		self.app.conf.task_always_eager = True
+		self.zona_a = Zona.objects.create(nombre='Zona A', codigo='ZA')
+		self.zona_b = Zona.objects.create(nombre='Zona B', codigo='ZB')
+		crear_cliente(self.zona_a, '40000001', deuda=10)
+		crear_cliente(self.zona_a, '40000002', deuda=10)
+		crear_cliente(self.zona_b, '40000003', deuda=10)
+
+	def tearDown(self):
+		self.app.conf.task_always_eager = False
+
+	def test_fan_out_por_zona_y_resumen(self):
+		from .tasks import mark_cobranza_cycle_task
+		from .models import EjecucionCiclo
+		mark_cobranza_cycle_task.delay(day=15)
+		ejecucion = EjecucionCiclo.objects.get()
+		self.assertEqual(ejecucion.particiones, 2)
+		self.assertEqual(ejecucion.marcados, 3)
+		self.assertEqual(ejecucion.detalle, {str(self.zona_a.id): 2, str(self.zona_b.id): 1})
+
+	def test_reintento_suma_lo_marcado_en_intentos_anteriores(self):
+		from unittest.mock import patch
+		from .models import EjecucionCiclo
+		from .services import ejecutar_ciclo_cobranza
+		from .tasks import mark_cobranza_cycle_task
+		intentos = []
+
+		def falla_tras_el_primer_bloque(day, clientes=None, on_chunk=None):
+			intentos.append(day)
+
+			def bloque(*args):
+				on_chunk(*args)
+				if len(intentos) == 1:
+					raise RuntimeError('conexión perdida')
+			return ejecutar_ciclo_cobranza(day, clientes=clientes, chunk_size=1, on_chunk=bloque)
+
+		with patch('cobranza.tasks.ejecutar_ciclo_cobranza', side_effect=falla_tras_el_primer_bloque), \
+				self.assertLogs('cobranza.tasks', 'ERROR'):
+			mark_cobranza_cycle_task.delay(day=15)
+		self.assertEqual(len(intentos), 3)
+		ejecucion = EjecucionCiclo.objects.get()
+		self.assertEqual(ejecucion.detalle, {str(self.zona_a.id): 2, str(self.zona_b.id): 1})
+		self.assertEqual(ejecucion.marcados, CorteRegistro.objects.count())
+
+	def test_reintento_de_zona_no_duplica_cortes(self):
+		from .tasks import mark_cobranza_cycle_zona_task
+		mark_cobranza_cycle_zona_task.delay(15, self.zona_a.id)
+		resultado = mark_cobranza_cycle_zona_task.delay(15, self.zona_a.id).get()
+		self.assertEqual(resultado['marcados'], 0)
+		self.assertEqual(CorteRegistro.objects.filter(cliente__zona=self.zona_a).count(), 2)
+
+
+class ListaPagosCursorTests(ConsultasMixin, TestCase):
+	def setUp(self):
+		from django.utils import timezone
+		from .models import Pago
+		self.zona = Zona.objects.create(nombre='Zona Pagos', codigo='ZP')
+		cliente = crear_cliente(self.zona, '40000000')
+		self.admin = User.objects.create_user(username='admin_pagos', password='x', tipo_usuario='admin')
+		ahora = timezone.now()
+		# Varias filas con la misma fecha: el id desempata
+		self.pagos = [
+			Pago.objects.create(cliente=cliente, monto=10 + i, metodo_pago='efectivo',
+								fecha_pago=ahora if i < 4 else ahora - timezone.timedelta(days=i),
+								registrado_por=self.admin)
+			for i in range(7)
+		]
+		self.client.force_login(self.admin)
+
+	def test_recorre_todas_las_paginas_sin_duplicados(self):
+		vistos = []
+		params = {'formato': 'json', 'tamanio': 2}
+		while True:
+			datos = self.client.get('/cobranza/', params).json()
+			vistos.extend(fila['id'] for fila in datos['resultados'])
+			if not datos['hay_mas']:
+				break
+			params['cursor'] = datos['siguiente']
+		self.assertEqual(len(vistos), len(self.pagos))
+		self.assertEqual(set(vistos), {p.id for p in self.pagos})
+
+	def test_pagina_siguiente_no_crece_en_consultas(self):
+		primera = self.client.get('/cobranza/', {'formato': 'json', 'tamanio': 2}).json()
+		with self.assertNumQueries(3):
+			self.client.get('/cobranza/', {'formato': 'json', 'tamanio': 2, 'cursor': primera['siguiente']})
+
+	def test_lista_html_sin_consultas_por_fila(self):
+		cliente = Cliente.objects.get(dni='40000000')
+
+		def agregar(n):
+			for i in range(n):
+				otro = crear_cliente(self.zona, f'4100000{i}')
+				Pago.objects.create(cliente=otro if i % 2 else cliente, monto=5, metodo_pago='yape',
+									fecha_pago=timezone.now(), registrado_por=self.admin)
+
+		self.assertQueriesNoCrecen(lambda: self.client.get('/cobranza/'), agregar)
+
+	def test_cursor_invalido_vuelve_al_inicio(self):
+		respuesta = self.client.get('/cobranza/', {'formato': 'json', 'tamanio': 2, 'cursor': 'basura'})
+		self.assertEqual(len(respuesta.json()['resultados']), 2)
+
+
+class LibroDeudaTests(TestCase):
+	def setUp(self):
+		self.zona = Zona.objects.create(nombre='Zona Libro', codigo='ZL')
+		self.cliente = crear_cliente(self.zona, '50000000', deuda=100, estado='moroso')
+		self.admin = User.objects.create_user(username='admin_libro', password='x', tipo_usuario='admin')
+
+	def crear_pago(self, monto, estado='pendiente'):
+		return Pago.objects.create(
+			cliente=self.cliente, monto=monto, metodo_pago='efectivo', estado=estado,
+			fecha_pago=timezone.now(), registrado_por=self.admin,
+		)
+
+	def deuda(self):
+		return Cliente.objects.values_list('deuda_actual', flat=True).get(pk=self.cliente.pk)
+
+	def test_saldo_inicial_en_el_libro(self):
+		apertura = Transaccion.objects.get(cliente=self.cliente)
+		self.assertEqual((apertura.tipo, apertura.monto, apertura.saldo_posterior), ('ajuste', Decimal('100'), Decimal('100')))
+
+	def test_validar_pago_descuenta_una_sola_vez(self):
+		pago = self.crear_pago(30)
+		self.assertEqual(self.deuda(), Decimal('100'))
+		self.client.force_login(self.admin)
+		self.client.post(f'/cobranza/{pago.id}/validar/', {'accion': 'aprobar'})
+		self.assertEqual(self.deuda(), Decimal('70'))
+		movimiento = Transaccion.objects.get(pago=pago)
+		self.assertEqual(
+			(movimiento.tipo, movimiento.monto, movimiento.saldo_anterior, movimiento.saldo_posterior),
+			('pago', Decimal('-30'), Decimal('100'), Decimal('70')),
+		)
+		# Guardar otra vez el pago completado no vuelve a descontar
+		pago.refresh_from_db()
+		pago.observaciones = 'revisado'
+		pago.save()
+		self.assertEqual(self.deuda(), Decimal('70'))
+
+	def test_reversion_y_reconexion(self):
+		pago = self.crear_pago(100, estado='completado')
+		self.cliente.refresh_from_db()
+		self.assertEqual((self.cliente.deuda_actual, self.cliente.estado), (Decimal('0'), 'activo'))
+		pago.estado = 'rechazado'
+		pago.save()
+		self.assertEqual(self.deuda(), Decimal('100'))
+		self.assertEqual(Transaccion.objects.filter(pago=pago).count(), 2)
+
+	def test_borrar_pago_completado_conserva_el_libro(self):
+		pago = self.crear_pago(40, estado='completado')
+		pendiente = self.crear_pago(10)
+		self.assertEqual(self.deuda(), Decimal('60'))
+		pago.delete()
+		pendiente.delete()
+		self.assertEqual(self.deuda(), Decimal('100'))
+		asientos = Transaccion.objects.filter(cliente=self.cliente, pago__isnull=True).order_by('pk')
+		self.assertEqual([a.monto for a in asientos], [Decimal('100'), Decimal('-40'), Decimal('40')])
+		self.assertIn('(eliminado)', asientos.last().descripcion)
+		self.assertEqual(reconciliar_deuda()['diferencias'], 0)
+
+	def test_editar_cliente_no_pisa_un_movimiento_concurrente(self):
+		from .services import registrar_movimiento
+		leido = Cliente.objects.get(pk=self.cliente.pk)
+		registrar_movimiento(self.cliente.pk, 'ajuste', Decimal('-30'), 'Descuento')
+		leido.direccion = 'Av. Nueva 123'
+		leido.save()
+		self.assertEqual(self.deuda(), Decimal('70'))
+		self.assertEqual(Cliente.objects.get(pk=self.cliente.pk).direccion, 'Av. Nueva 123')
+		self.assertEqual(reconciliar_deuda()['diferencias'], 0)
+
+	def test_reconciliar_informa_y_corrige(self):
+		self.crear_pago(40, estado='completado')
+		out = StringIO()
+		call_command('reconciliar_deuda', stdout=out)
+		self.assertIn('sin diferencias', out.getvalue())
+
+		# Un cambio fuera del libro aparece como diferencia
+		Cliente.objects.filter(pk=self.cliente.pk).update(deuda_actual=75)
+		out = StringIO()
+		call_command('reconciliar_deuda', chunk_size=1, stdout=out)
+		self.assertIn('diferencia 15', out.getvalue())
+		self.assertEqual(self.deuda(), Decimal('75'))
+
+		call_command('reconciliar_deuda', corregir=True, stdout=StringIO())
+		self.assertEqual(self.deuda(), Decimal('60'))
+
+
+class FacturacionMensualTests(TestCase):
+	def setUp(self):
+		self.zona_a = Zona.objects.create(nombre='Zona A', codigo='ZA')
+		self.zona_b = Zona.objects.create(nombre='Zona B', codigo='ZB')
+		self.dia_5 = crear_cliente(self.zona_a, '60000001', deuda=10, monto_mensual=50, dia_vencimiento=5)
+		self.dia_20 = crear_cliente(self.zona_a, '60000002', monto_mensual=60, dia_vencimiento=20)
+		self.sin_dia = crear_cliente(self.zona_b, '60000003', estado='moroso', monto_mensual=40)
+		self.dia_31 = crear_cliente(self.zona_b, '60000004', monto_mensual=70, dia_vencimiento=31)
+		# No se facturan: suspendido, sin monto y aún no instalado
+		crear_cliente(self.zona_a, '60000005', estado='suspendido', monto_mensual=30, dia_vencimiento=1)
+		crear_cliente(self.zona_a, '60000006', dia_vencimiento=1)
+		crear_cliente(self.zona_b, '60000007', monto_mensual=30, dia_vencimiento=1, fecha_instalacion='2027-01-01')
+
+	def deuda(self, cliente):
+		return Cliente.objects.values_list('deuda_actual', flat=True).get(pk=cliente.pk)
+
+	def test_facturacion_por_bloques_e_idempotente(self):
+		out = StringIO()
+		call_command('facturar_mensual', fecha='2026-03-10', chunk_size=1, stdout=out)
+		self.assertIn('Facturados 2 clientes por S/ 90', out.getvalue())
+		self.assertIn('2 bloques', out.getvalue())
+		self.assertEqual((self.deuda(self.dia_5), self.deuda(self.sin_dia), self.deuda(self.dia_20)),
+						 (Decimal('60'), Decimal('40'), Decimal('0')))
+		cargo = Transaccion.objects.get(cliente=self.dia_5, tipo='cargo')
+		self.assertEqual((cargo.periodo, cargo.saldo_anterior, cargo.saldo_posterior), ('2026-03', Decimal('10'), Decimal('60')))
+
+		# Repetir el día, o correr más tarde en el mes, sólo factura a los nuevos vencidos
+		out = StringIO()
+		call_command('facturar_mensual', fecha='2026-03-10', stdout=out)
+		self.assertIn('Facturados 0 clientes', out.getvalue())
+		call_command('facturar_mensual', fecha='2026-03-25', stdout=StringIO())
+		self.assertEqual(Transaccion.objects.filter(tipo='cargo', periodo='2026-03').count(), 3)
+		self.assertEqual(self.deuda(self.dia_5), Decimal('60'))
+
+		out = StringIO()
+		call_command('reconciliar_deuda', stdout=out)
+		self.assertIn('sin diferencias', out.getvalue())
+
+	def test_ultimo_dia_del_mes(self):
+		call_command('facturar_mensual', fecha='2026-02-27', stdout=StringIO())
+		self.assertFalse(Transaccion.objects.filter(cliente=self.dia_31, tipo='cargo').exists())
+		call_command('facturar_mensual', fecha='2026-02-28', stdout=StringIO())
+		self.assertEqual(self.deuda(self.dia_31), Decimal('70'))
+
+	def test_particiones_por_zona(self):
+		from cobramax_core.celery import app
+		from .tasks import facturacion_mensual_task, facturar_zona_task
+		from .models import EjecucionCiclo
+		app.conf.task_always_eager = True
+		try:
+			facturacion_mensual_task.delay('2026-03-31')
+			# Reintentar una zona no vuelve a cobrar
+			self.assertEqual(facturar_zona_task.delay('2026-03-31', self.zona_a.id).get()['facturados'], 0)
+		finally:
+			app.conf.task_always_eager = False
+		ejecucion = EjecucionCiclo.objects.get(accion='facturacion')
+		self.assertEqual(ejecucion.detalle, {str(self.zona_a.id): 2, str(self.zona_b.id): 2})
+		self.assertEqual(ejecucion.marcados, 4)
+
+	def test_reintento_de_zona_suma_lo_facturado_antes(self):
+		from unittest.mock import patch
+		from django.db.models import Sum
+		from cobramax_core.celery import app
+		from .models import EjecucionCiclo
+		from .services import ejecutar_facturacion
+		from .tasks import facturacion_mensual_task, facturar_zona_task
+		intentos = []
+
+		def falla_tras_el_primer_bloque(fecha, clientes=None, on_chunk=None):
+			intentos.append(fecha)
+
+			def bloque(*args):
+				on_chunk(*args)
+				if len(intentos) == 1:
+					raise RuntimeError('conexión perdida')
+			return ejecutar_facturacion(fecha, clientes=clientes, chunk_size=1, on_chunk=bloque)
+
+		app.conf.task_always_eager = True
+		try:
+			with patch('cobranza.tasks.ejecutar_facturacion', side_effect=falla_tras_el_primer_bloque), \
+					self.assertLogs('cobranza.tasks', 'ERROR'):
+				resultado = facturar_zona_task.delay('2026-03-31', self.zona_a.id).get()
+				intentos.clear()
+				facturacion_mensual_task.delay('2026-04-30')
+		finally:
+			app.conf.task_always_eager = False
+		cargos = Transaccion.objects.filter(tipo='cargo', periodo='2026-03')
+		self.assertEqual(resultado['facturados'], cargos.count())
+		self.assertEqual(Decimal(resultado['monto']), cargos.aggregate(total=Sum('monto'))['total'])
+		self.assertEqual(len(intentos), 3)
+		ejecucion = EjecucionCiclo.objects.get(accion='facturacion')
+		self.assertEqual(ejecucion.detalle, {str(self.zona_a.id): 2, str(self.zona_b.id): 2})
+		self.assertEqual(ejecucion.marcados, Transaccion.objects.filter(tipo='cargo', periodo='2026-04').count())
 
-# Create your tests here.
@@ -2,12 +2,14 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Q, Sum
 from django.utils import timezone
 from django.http import JsonResponse
 from clientes.models import Cliente
 from .models import Pago, Transaccion
 from usuarios.decorators import require_roles
+from zonas.services import alcance_de
+from cobramax_core.paginacion import paginar_por_cursor
+from cobramax_core.estadisticas import estadisticas, contar, sumar
 
 @login_required
 @require_roles(['admin', 'oficina', 'cobrador', 'cliente'])
@@ -15,25 +17,10 @@ def lista_pagos(request):
     """Lista de pagos según el rol del usuario"""
     user = request.user
     
-    if user.tipo_usuario == 'admin':
-        pagos = Pago.objects.all()
-    elif user.tipo_usuario == 'oficina':
-        pagos = Pago.objects.all()
-    elif user.tipo_usuario == 'cobrador':
-        # Cobradores solo ven pagos de sus clientes
-        zonas_cobrador = user.zona_set.filter(activa=True)
-        clientes_cobrador = Cliente.objects.filter(zona__in=zonas_cobrador)
-        pagos = Pago.objects.filter(cliente__in=clientes_cobrador)
-    elif user.tipo_usuario == 'cliente':
-        # Clientes solo ven sus propios pagos
-        try:
-            cliente = Cliente.objects.get(usuario=user)
-            pagos = Pago.objects.filter(cliente=cliente)
-        except Cliente.DoesNotExist:
-            pagos = Pago.objects.none()
-            messages.info(request, "No tienes información de cliente registrada.")
-    else:
-        pagos = Pago.objects.none()
+    # Admin y oficina ven todo; cobrador y cliente, su alcance (zonas.services)
+    pagos = Pago.objects.visible_to(user)
+    if user.tipo_usuario == 'cliente' and not alcance_de(user).clientes:
+        messages.info(request, "No tienes información de cliente registrada.")
     
     # Filtros
     estado_filter = request.GET.get('estado')
@@ -50,14 +37,30 @@ def lista_pagos(request):
     if fecha_hasta:
         pagos = pagos.filter(fecha_pago__lte=fecha_hasta)
     
-  # Estadísticas
-    total_pagos = pagos.count()
-    total_monto = pagos.aggregate(Sum('monto'))['monto__sum'] or 0
-    pagos_completados = pagos.filter(estado='completado').count()
-    pagos_pendientes = total_pagos - pagos_completados  # ← Agregar esta línea
+    # Página actual por cursor (fecha_pago, id); ?formato=json para scroll infinito
+    pagina = paginar_por_cursor(request, pagos.select_related('cliente', 'validado_por'), ('-fecha_pago', '-id'))
+    if request.GET.get('formato') == 'json':
+        return JsonResponse(pagina.como_json(lambda pago: {
+            'id': pago.id,
+            'codigo_transaccion': pago.codigo_transaccion,
+            'cliente': pago.cliente.nombre_completo(),
+            'dni': pago.cliente.dni,
+            'monto': float(pago.monto),
+            'metodo_pago': pago.metodo_pago,
+            'estado': pago.estado,
+            'fecha_pago': pago.fecha_pago.isoformat(),
+        }))
+    
+    # Estadísticas (una sola consulta)
+    stats = estadisticas(pagos, total=contar(), monto=sumar('monto'), completados=contar(estado='completado'))
+    total_pagos = stats['total']
+    total_monto = stats['monto']
+    pagos_completados = stats['completados']
+    pagos_pendientes = total_pagos - pagos_completados
     
     context = {
-        'pagos': pagos,
+        'pagos': pagina.objetos,
+        'pagina': pagina,
         'user': user,
         'total_pagos': total_pagos,
         'total_monto': total_monto,
@@ -103,12 +106,8 @@ def registrar_pago(request, cliente_id=None):
         except Exception as e:
             messages.error(request, f'Error al registrar el pago: {str(e)}')
     
-    # Si es cobrador, solo puede ver sus clientes
-    if request.user.tipo_usuario == 'cobrador':
-        zonas_cobrador = request.user.zona_set.filter(activa=True)
-        clientes = Cliente.objects.filter(zona__in=zonas_cobrador)
-    else:
-        clientes = Cliente.objects.all()
+    # Cobradores y clientes solo ven los clientes de su alcance
+    clientes = Cliente.objects.visible_to(request.user)
     
     context = {
         'cliente': cliente,
@@ -122,14 +121,15 @@ def registrar_pago(request, cliente_id=None):
 @require_roles(['admin', 'oficina', 'cobrador', 'cliente'])
 def detalle_pago(request, pago_id):
     """Detalle de un pago específico"""
-    pago = get_object_or_404(Pago, id=pago_id)
+    pago = get_object_or_404(Pago.objects.select_related('cliente', 'registrado_por', 'validado_por'), id=pago_id)
     user = request.user
     
-    # Verificar permisos
-    if user.tipo_usuario == 'cobrador' and pago.cliente.zona.cobrador != user:
+    # Verificar permisos contra el alcance ya resuelto (sin consultas extra)
+    permitido = alcance_de(user).permite_cliente(pago.cliente_id)
+    if user.tipo_usuario == 'cobrador' and not permitido:
         messages.error(request, "No tienes permisos para ver este pago.")
         return redirect('lista_pagos')
-    elif user.tipo_usuario == 'cliente' and pago.cliente.usuario != user:
+    elif user.tipo_usuario == 'cliente' and not permitido:
         messages.error(request, "Solo puedes ver tus propios pagos.")
         return redirect('dashboard')
     
@@ -157,12 +157,9 @@ def validar_pago(request, pago_id):
             pago.estado = 'completado'
             pago.validado_por = request.user
             pago.fecha_validacion = timezone.now()
+            # Pago.save() descuenta la deuda a través del libro
             pago.save()
             
-            # Actualizar deuda del cliente
-            pago.cliente.deuda_actual -= pago.monto
-            pago.cliente.save()
-            
             messages.success(request, f"Pago {pago.codigo_transaccion} validado exitosamente.")
             
         elif accion == 'rechazar':
@@ -1,6 +1,6 @@
 # notificaciones/admin.py
 from django.contrib import admin
-from .models import Notificacion, PlantillaNotificacion, RegistroEnvio  # ← Quitar ConfiguracionNotificacion
+from .models import Notificacion, PlantillaNotificacion, RegistroEnvio, CampaniaNotificacion  # ← Quitar ConfiguracionNotificacion
 
 
 @admin.register(PlantillaNotificacion)
@@ -67,4 +67,11 @@ class RegistroEnvioAdmin(admin.ModelAdmin):
     list_display = ['notificacion', 'fecha_intento', 'exitoso', 'mensaje_error']
     list_filter = ['exitoso', 'fecha_intento']
     search_fields = ['notificacion__cliente__nombre', 'mensaje_error']
-    readonly_fields = ['notificacion', 'fecha_intento', 'exitoso', 'mensaje_error', 'respuesta_api']
\ No newline at end of file
+    readonly_fields = ['notificacion', 'fecha_intento', 'exitoso', 'mensaje_error', 'respuesta_api']
+
+
+@admin.register(CampaniaNotificacion)
+class CampaniaNotificacionAdmin(admin.ModelAdmin):
+    list_display = ['id', 'tipo', 'canal', 'zona', 'total_destinatarios', 'creada_por', 'fecha_creacion']
+    list_filter = ['tipo', 'canal', 'fecha_creacion']
+    readonly_fields = ['total_destinatarios', 'fecha_creacion']
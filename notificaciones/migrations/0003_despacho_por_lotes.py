@@ -0,0 +1,31 @@
+# Generated by Django 5.0.2 on 2026-10-18 00:38
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientes', '0003_add_caserio'),
+        ('notificaciones', '0002_registroenvio_delete_configuracionnotificacion_and_more'),
+        ('zonas', '0005_create_hierarchy'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificacion',
+            name='reclamada_en',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='notificacion',
+            name='estado',
+            field=models.CharField(choices=[('pendiente', 'Pendiente'), ('enviando', 'Enviando'), ('enviado', 'Enviado'), ('fallido', 'Fallido'), ('leido', 'Leído')], default='pendiente', max_length=20, verbose_name='Estado'),
+        ),
+        migrations.AddIndex(
+            model_name='notificacion',
+            index=models.Index(fields=['estado', 'id'], name='notificacio_estado_5b6c72_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.0.2 on 2026-10-18 00:39
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notificaciones', '0003_despacho_por_lotes'),
+        ('zonas', '0005_create_hierarchy'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CampaniaNotificacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(max_length=20, verbose_name='Tipo')),
+                ('mensaje', models.TextField(verbose_name='Mensaje')),
+                ('canal', models.CharField(default='whatsapp', max_length=20, verbose_name='Canal')),
+                ('estado_cliente', models.CharField(blank=True, default='', max_length=10)),
+                ('total_destinatarios', models.PositiveIntegerField(default=0)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('creada_por', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='campanias_creadas', to=settings.AUTH_USER_MODEL)),
+                ('plantilla', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='campanias', to='notificaciones.plantillanotificacion')),
+                ('zona', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='campanias', to='zonas.zona')),
+            ],
+            options={
+                'verbose_name': 'Campaña de Notificación',
+                'verbose_name_plural': 'Campañas de Notificaciones',
+                'ordering': ['-fecha_creacion'],
+            },
+        ),
+        migrations.AddField(
+            model_name='notificacion',
+            name='campania',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='notificaciones', to='notificaciones.campanianotificacion'),
+        ),
+    ]
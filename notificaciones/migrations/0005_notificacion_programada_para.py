@@ -0,0 +1,18 @@
+# Generated by Django 5.0.2 on 2026-10-18 00:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notificaciones', '0004_campanianotificacion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificacion',
+            name='programada_para',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.0.2 on 2026-10-18 00:53
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientes', '0004_indice_paginacion'),
+        ('notificaciones', '0005_notificacion_programada_para'),
+        ('zonas', '0005_create_hierarchy'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notificacion',
+            index=models.Index(fields=['-fecha_creacion', '-id'], name='notificacio_fecha_c_b493c4_idx'),
+        ),
+    ]
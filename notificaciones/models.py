@@ -35,6 +35,43 @@ class PlantillaNotificacion(models.Model):
         return f"{self.nombre} ({self.get_tipo_display()})"
 
 
+class CampaniaNotificacion(models.Model):
+    """Envío masivo: agrupa las notificaciones creadas desde notificacion_masiva"""
+    
+    tipo = models.CharField(max_length=20, verbose_name="Tipo")
+    mensaje = models.TextField(verbose_name="Mensaje")
+    canal = models.CharField(max_length=20, default='whatsapp', verbose_name="Canal")
+    zona = models.ForeignKey(Zona, on_delete=models.SET_NULL, null=True, blank=True, related_name='campanias')
+    estado_cliente = models.CharField(max_length=10, blank=True, default='')
+    plantilla = models.ForeignKey(PlantillaNotificacion, on_delete=models.SET_NULL, null=True, blank=True, related_name='campanias')
+    total_destinatarios = models.PositiveIntegerField(default=0)
+    creada_por = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name='campanias_creadas')
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = "Campaña de Notificación"
+        verbose_name_plural = "Campañas de Notificaciones"
+        ordering = ['-fecha_creacion']
+    
+    def __str__(self):
+        return f"Campaña #{self.id} - {self.tipo} ({self.total_destinatarios} destinatarios)"
+    
+    def progreso(self):
+        """Conteo de notificaciones de la campaña por estado (una sola consulta)"""
+        conteos = dict(
+            self.notificaciones.order_by().values_list('estado').annotate(total=models.Count('id'))
+        )
+        pendientes = conteos.get('pendiente', 0) + conteos.get('enviando', 0)
+        return {
+            'campania_id': self.id,
+            'total': self.total_destinatarios,
+            'enviadas': conteos.get('enviado', 0) + conteos.get('leido', 0),
+            'fallidas': conteos.get('fallido', 0),
+            'pendientes': pendientes,
+            'finalizada': pendientes == 0,
+        }
+
+
 class Notificacion(models.Model):
     """Notificaciones enviadas a clientes"""
     
@@ -55,6 +92,7 @@ class Notificacion(models.Model):
     
     ESTADO_CHOICES = [
         ('pendiente', 'Pendiente'),
+        ('enviando', 'Enviando'),
         ('enviado', 'Enviado'),
         ('fallido', 'Fallido'),
         ('leido', 'Leído'),
@@ -67,6 +105,7 @@ class Notificacion(models.Model):
     canal = models.CharField(max_length=20, choices=CANAL_CHOICES, default='whatsapp', verbose_name="Canal")
     estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='pendiente', verbose_name="Estado")
     plantilla = models.ForeignKey(PlantillaNotificacion, on_delete=models.SET_NULL, null=True, blank=True, related_name='notificaciones')
+    campania = models.ForeignKey(CampaniaNotificacion, on_delete=models.SET_NULL, null=True, blank=True, related_name='notificaciones')
     
     # Metadata
     enviado_por = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name='notificaciones_enviadas')
@@ -79,11 +118,20 @@ class Notificacion(models.Model):
     destinatario_email = models.EmailField(blank=True, null=True)
     error_mensaje = models.TextField(blank=True, null=True, verbose_name="Mensaje de Error")
     intentos_envio = models.IntegerField(default=0, verbose_name="Intentos de Envío")
+    # Momento en que un worker de despacho tomó la notificación (estado 'enviando')
+    reclamada_en = models.DateTimeField(null=True, blank=True)
+    # No enviar antes de esta fecha (p.ej. reprogramada por límite de envío)
+    programada_para = models.DateTimeField(null=True, blank=True)
     
     class Meta:
         verbose_name = "Notificación"
         verbose_name_plural = "Notificaciones"
         ordering = ['-fecha_creacion']
+        indexes = [
+            models.Index(fields=['estado', 'id']),
+            # Paginación por cursor (fecha_creacion, id)
+            models.Index(fields=['-fecha_creacion', '-id']),
+        ]
     
     def __str__(self):
         return f"{self.get_tipo_display()} - {self.cliente.nombre_completo} ({self.estado})"
@@ -1,8 +1,19 @@
 # notificaciones/services.py (versión segura)
+import json
 import logging
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from django.conf import settings
-from django.core.mail import send_mail
+from django.core.cache import cache
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import F, Q
 from django.utils import timezone
+from cobramax_core.caches import exigir_cache_compartida
+from .utils import compilar_mensaje, compilar_plantilla, variables_clientes
 
 logger = logging.getLogger(__name__)
 
@@ -17,99 +28,225 @@ except ImportError:
 # Intentar importar el cliente de Twilio (opcional)
 try:
     from twilio.rest import Client as TwilioClient
+    from twilio.http.http_client import TwilioHttpClient
     TWILIO_AVAILABLE = True
 except Exception:
     TwilioClient = None
+    TwilioHttpClient = None
     TWILIO_AVAILABLE = False
 
+
+# =======================
+# Transportes de proveedor
+# =======================
+
+class Transporte:
+    """Interfaz común de los transportes: cómo llega físicamente un mensaje al proveedor.
+
+    `enviar` y `enviar_lote` retornan dicts {'success', 'id_externo'|'error', ...}.
+    """
+    canal = None
+
+    def enviar(self, destino, mensaje, asunto=None, html_message=None):
+        raise NotImplementedError
+
+    def enviar_lote(self, envios):
+        """Envía varios mensajes ({'destino', 'mensaje', 'asunto', 'html_message'})"""
+        return [
+            self.enviar(e['destino'], e['mensaje'], e.get('asunto'), e.get('html_message'))
+            for e in envios
+        ]
+
+    def cerrar(self):
+        """Libera conexiones abiertas (si las hay)"""
+        pass
+
+
+_twilio_http_client = None
+_twilio_http_lock = threading.Lock()
+
+
+def _twilio_http():
+    """Cliente HTTP de Twilio compartido por el proceso (sesión con pool de conexiones)"""
+    global _twilio_http_client
+    with _twilio_http_lock:
+        if _twilio_http_client is None:
+            _twilio_http_client = TwilioHttpClient(
+                pool_connections=True,
+                timeout=getattr(settings, 'TWILIO_HTTP_TIMEOUT', 10),
+            )
+    return _twilio_http_client
+
+
+class TwilioTransporte(Transporte):
+    """WhatsApp / SMS vía Twilio reutilizando la sesión HTTP del proceso"""
+
+    def __init__(self, canal):
+        self.canal = canal
+        self.account_sid = getattr(settings, 'TWILIO_ACCOUNT_SID', '')
+        self.auth_token = getattr(settings, 'TWILIO_AUTH_TOKEN', '')
+        self.remitente = LimitadorEnvios.remitente(canal)
+        self._client = None
+
+    def _get_client(self):
+        if self._client is None:
+            self._client = TwilioClient(self.account_sid, self.auth_token, http_client=_twilio_http())
+        return self._client
+
+    def enviar(self, destino, mensaje, asunto=None, html_message=None):
+        try:
+            # Twilio espera números en formato E.164 y el prefijo 'whatsapp:' para WhatsApp
+            to_number = destino if destino.startswith('+') else f'+{destino}'
+            if self.canal == 'whatsapp':
+                from_, to = f'whatsapp:{self.remitente}', f'whatsapp:{to_number}'
+            else:
+                from_, to = self.remitente, to_number
+            message = self._get_client().messages.create(body=mensaje, from_=from_, to=to)
+            logger.info(f"{self.canal} enviado via Twilio SID={message.sid} status={getattr(message, 'status', None)}")
+            return {
+                'success': True,
+                'id_externo': getattr(message, 'sid', None),
+                'estado': getattr(message, 'status', None) or 'queued'
+            }
+        except Exception as e:
+            logger.error(f"Error enviando {self.canal} con Twilio: {e}")
+            # 429 = throttling del proveedor: el despachador lo reprograma
+            return {'success': False, 'error': str(e), 'throttled': getattr(e, 'status', None) == 429}
+
+
+class CorreoTransporte(Transporte):
+    """Email por el backend de Django con una conexión por lote.
+
+    `enviar_lote` abre la conexión, entrega todos los mensajes con un único
+    `send_messages` y la cierra, así ningún llamador deja sockets SMTP
+    abiertos aunque no llame a `cerrar`.
+    """
+    canal = 'email'
+
+    def enviar(self, destino, mensaje, asunto=None, html_message=None):
+        return self.enviar_lote([{'destino': destino, 'mensaje': mensaje, 'asunto': asunto, 'html_message': html_message}])[0]
+
+    def enviar_lote(self, envios):
+        remitente = getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@cobramax.com')
+        correos = []
+        for e in envios:
+            correo = EmailMultiAlternatives(e.get('asunto') or '', e['mensaje'], remitente, [e['destino']])
+            if e.get('html_message'):
+                correo.attach_alternative(e['html_message'], 'text/html')
+            correos.append(correo)
+        try:
+            with get_connection(fail_silently=False) as conexion:
+                conexion.send_messages(correos)
+        except Exception as e:
+            logger.error(f"Error enviando email: {str(e)}")
+            return [{'success': False, 'error': str(e)} for _ in envios]
+        return [{'success': True, 'id_externo': f'email-{timezone.now().timestamp()}'} for _ in envios]
+
+
+class SimuladoTransporte(Transporte):
+    """Simular envío para desarrollo (sin credenciales de proveedor)"""
+
+    def __init__(self, canal):
+        self.canal = canal
+
+    def enviar(self, destino, mensaje, asunto=None, html_message=None):
+        logger.info(f"SIMULACIÓN {self.canal} a {destino}: {mensaje}")
+        return {
+            'success': True,
+            'id_externo': f'sim-{timezone.now().timestamp()}',
+            'estado': 'delivered'
+        }
+
+
+class FakeTransporte(Transporte):
+    """Proveedor falso en proceso para pruebas de carga sin red.
+
+    Latencia (segundos) y tasa de error (0-1) configurables con
+    NOTIFICACIONES_FAKE_LATENCIA y NOTIFICACIONES_FAKE_TASA_ERROR.
+    """
+
+    def __init__(self, canal, latencia=None, tasa_error=None):
+        self.canal = canal
+        self.latencia = getattr(settings, 'NOTIFICACIONES_FAKE_LATENCIA', 0.05) if latencia is None else latencia
+        self.tasa_error = getattr(settings, 'NOTIFICACIONES_FAKE_TASA_ERROR', 0.0) if tasa_error is None else tasa_error
+        self._random = random.Random()
+
+    def enviar(self, destino, mensaje, asunto=None, html_message=None):
+        if self.latencia:
+            time.sleep(self.latencia)
+        if self._random.random() < self.tasa_error:
+            return {'success': False, 'error': 'Error simulado del proveedor falso'}
+        return {'success': True, 'id_externo': f'fake-{uuid.uuid4().hex[:12]}', 'estado': 'delivered'}
+
+
+def obtener_transporte(canal):
+    """Transporte a usar para `canal` según settings.NOTIFICACIONES_TRANSPORTE.
+
+    'fake' fuerza el proveedor falso; 'auto' (defecto) usa Twilio/correo si
+    hay configuración y la simulación en caso contrario.
+    """
+    if getattr(settings, 'NOTIFICACIONES_TRANSPORTE', 'auto') == 'fake':
+        return FakeTransporte(canal)
+    if canal == 'email':
+        return CorreoTransporte()
+    credenciales = all([
+        getattr(settings, 'TWILIO_ACCOUNT_SID', ''),
+        getattr(settings, 'TWILIO_AUTH_TOKEN', ''),
+        LimitadorEnvios.remitente(canal),
+    ])
+    if canal in ('whatsapp', 'sms') and credenciales and TWILIO_AVAILABLE:
+        return TwilioTransporte(canal)
+    if canal == 'whatsapp':
+        logger.warning("Credenciales de Twilio no configuradas o librería no disponible. Simulando envío.")
+    return SimuladoTransporte(canal)
+
+
+# =======================
+# Servicios por canal
+# =======================
+
 class WhatsAppService:
     """Servicio para enviar mensajes por WhatsApp"""
     
     def __init__(self):
-        self.account_sid = getattr(settings, 'TWILIO_ACCOUNT_SID', '')
-        self.auth_token = getattr(settings, 'TWILIO_AUTH_TOKEN', '')
-        self.whatsapp_number = getattr(settings, 'TWILIO_WHATSAPP_NUMBER', '')
+        self.transporte = obtener_transporte('whatsapp')
     
     def enviar_mensaje(self, telefono, mensaje):
         """
-        Enviar mensaje por WhatsApp usando Twilio API
+        Enviar mensaje por WhatsApp usando el transporte configurado
         """
         try:
-            # Si no hay credenciales completas, continuar simulando
-            if not all([self.account_sid, self.auth_token, self.whatsapp_number]):
-                logger.warning("Credenciales de Twilio no configuradas. Simulando envío.")
-                return self._simular_envio(telefono, mensaje)
-
-            # Si la librería de Twilio está disponible, usarla
-            if TWILIO_AVAILABLE and TwilioClient is not None:
-                try:
-                    client = TwilioClient(self.account_sid, self.auth_token)
-                    # Twilio espera números en formato E.164 y el prefijo 'whatsapp:' para WhatsApp
-                    to_number = telefono if telefono.startswith('+') else f'+{telefono}'
-                    message = client.messages.create(
-                        body=mensaje,
-                        from_=f'whatsapp:{self.whatsapp_number}',
-                        to=f'whatsapp:{to_number}'
-                    )
-                    logger.info(f"WhatsApp enviado via Twilio SID={message.sid} status={getattr(message, 'status', None)}")
-                    return {
-                        'success': True,
-                        'id_externo': getattr(message, 'sid', None),
-                        'estado': getattr(message, 'status', None) or 'queued'
-                    }
-                except Exception as e:
-                    logger.error(f"Error enviando WhatsApp con Twilio: {e}")
-                    # si falla con Twilio, retornar fallo en vez de simular para visibilidad
-                    return {'success': False, 'error': str(e)}
-
-            # Si llegamos aquí (Twilio no disponible) simular envío
-            logger.warning("Twilio no disponible en el entorno. Simulando envío de WhatsApp.")
-            return self._simular_envio(telefono, mensaje)
-            
+            return self.transporte.enviar(telefono, mensaje)
         except Exception as e:
             logger.error(f"Error enviando WhatsApp: {str(e)}")
             return {'success': False, 'error': str(e)}
-    
-    def _simular_envio(self, telefono, mensaje):
-        """Simular envío para desarrollo"""
-        logger.info(f"SIMULACIÓN WhatsApp a {telefono}: {mensaje}")
-        return {
-            'success': True, 
-            'id_externo': f'sim-{timezone.now().timestamp()}',
-            'estado': 'delivered'
-        }
 
-# ... (el resto del código de services.py permanece igual)
 class EmailService:
     """Servicio para enviar emails"""
     
+    def __init__(self):
+        self.transporte = obtener_transporte('email')
+    
     def enviar_email(self, destinatario, asunto, mensaje, html_message=None):
         try:
-            send_mail(
-                subject=asunto,
-                message=mensaje,
-                from_email=getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@cobramax.com'),
-                recipient_list=[destinatario],
-                html_message=html_message,
-                fail_silently=False,
-            )
-            return {'success': True, 'id_externo': f'email-{timezone.now().timestamp()}'}
+            return self.transporte.enviar(destinatario, mensaje, asunto, html_message)
         except Exception as e:
             logger.error(f"Error enviando email: {str(e)}")
             return {'success': False, 'error': str(e)}
+    
+    def enviar_lote(self, envios):
+        """Enviar varios emails por la misma conexión"""
+        return self.transporte.enviar_lote(envios)
 
 class SMSService:
     """Servicio para enviar SMS (usando Twilio)"""
     
+    def __init__(self):
+        self.transporte = obtener_transporte('sms')
+    
     def enviar_sms(self, telefono, mensaje):
         try:
-            # Simulación
-            logger.info(f"SIMULACIÓN SMS a {telefono}: {mensaje}")
-            return {
-                'success': True,
-                'id_externo': f'sms-sim-{timezone.now().timestamp()}',
-                'estado': 'sent'
-            }
+            return self.transporte.enviar(telefono, mensaje)
         except Exception as e:
             logger.error(f"Error enviando SMS: {str(e)}")
             return {'success': False, 'error': str(e)}
@@ -122,6 +259,11 @@ class NotificacionService:
         self.email_service = EmailService()
         self.sms_service = SMSService()
     
+    def cerrar(self):
+        """Cerrar las conexiones persistentes de los transportes"""
+        for servicio in (self.whatsapp_service, self.email_service, self.sms_service):
+            servicio.transporte.cerrar()
+    
     def enviar_notificacion(self, notificacion):
         """
         Enviar una notificación específica
@@ -179,20 +321,8 @@ class NotificacionService:
     
     def _personalizar_mensaje(self, mensaje, cliente):
         """Personalizar el mensaje con variables del cliente"""
-        variables = {
-            '{nombre}': cliente.nombre_completo,
-            '{deuda}': f"S/ {cliente.deuda_actual}",
-            '{servicio}': cliente.tipo_servicio or 'servicio',
-            '{fecha_limite}': (timezone.now() + timezone.timedelta(days=5)).strftime('%d/%m/%Y'),
-            '{zona}': cliente.zona.nombre,
-            '{cobrador}': cliente.cobrador_asignado.get_full_name() if cliente.cobrador_asignado else 'nuestro cobrador',
-        }
-        
-        mensaje_personalizado = mensaje
-        for variable, valor in variables.items():
-            mensaje_personalizado = mensaje_personalizado.replace(variable, str(valor))
-        
-        return mensaje_personalizado
+        variables = variables_clientes([cliente.id]).get(cliente.id, {})
+        return compilar_mensaje(mensaje).render(variables)
     
     def crear_notificacion_automatica(self, tipo, cliente, canal='whatsapp', programada_para=None):
         """Crear notificación automática basada en plantillas"""
@@ -221,7 +351,7 @@ class NotificacionService:
                 mensaje=plantilla.mensaje,
                 canal=canal,
                 programada_para=programada_para,
-                creada_por=usuario_sistema or cliente.cobrador_asignado
+                creada_por=usuario_sistema or cliente.cobrador
             )
             
             notificacion.save()
@@ -229,4 +359,292 @@ class NotificacionService:
             
         except Exception as e:
             logger.error(f"Error creando notificación automática: {str(e)}")
-            return None
\ No newline at end of file
+            return None
+
+class LimitadorEnvios:
+    """Token bucket compartido por canal y por número/remitente.
+
+    El estado de cada cubeta (tokens disponibles, última recarga) vive en la
+    caché de Django, que debe ser compartida (Redis) para que el límite se
+    respete entre todos los workers de Celery: si hay límites configurados y
+    la caché es local, falla (ver `exigir_cache_compartida`). La
+    lectura-escritura de cada cubeta se serializa con un candado `cache.add`.
+
+    Presupuestos en settings, como {'capacidad': ráfaga, 'por_segundo': tasa}:
+      - NOTIFICACIONES_LIMITES: por canal ('whatsapp', 'sms', 'email').
+      - NOTIFICACIONES_LIMITES_REMITENTE: por número/remitente de origen.
+    """
+
+    PREFIJO = 'notif_rl'
+
+    def __init__(self):
+        self.limites_canal = getattr(settings, 'NOTIFICACIONES_LIMITES', {})
+        self.limites_remitente = getattr(settings, 'NOTIFICACIONES_LIMITES_REMITENTE', {})
+        if self.limites_canal or self.limites_remitente:
+            exigir_cache_compartida('El límite de envíos (NOTIFICACIONES_LIMITES)')
+
+    @staticmethod
+    def remitente(canal):
+        """Número o dirección de origen usada por cada canal"""
+        if canal == 'whatsapp':
+            return getattr(settings, 'TWILIO_WHATSAPP_NUMBER', '')
+        if canal == 'sms':
+            return getattr(settings, 'TWILIO_SMS_NUMBER', '')
+        if canal == 'email':
+            return getattr(settings, 'DEFAULT_FROM_EMAIL', '')
+        return ''
+
+    def _consumir(self, clave, capacidad, por_segundo):
+        """Intenta tomar un token. Retorna 0 si lo obtuvo o los segundos a esperar."""
+        candado = f'{clave}:lock'
+        for _ in range(50):
+            if cache.add(candado, 1, timeout=2):
+                break
+            time.sleep(0.005)
+        else:
+            # Candado abandonado o contención extrema: pedir reintento corto
+            return 0.05
+        try:
+            ahora = time.time()
+            tokens, ultima = cache.get(clave) or (capacidad, ahora)
+            tokens = min(capacidad, tokens + (ahora - ultima) * por_segundo)
+            if tokens >= 1:
+                tokens -= 1
+                espera = 0
+            else:
+                espera = (1 - tokens) / por_segundo
+            cache.set(clave, (tokens, ahora), timeout=max(60, int(capacidad / por_segundo) + 1))
+            return espera
+        finally:
+            cache.delete(candado)
+
+    def _devolver(self, clave):
+        """Devuelve un token tomado de una cubeta cuando otra cubeta rechazó el envío"""
+        estado = cache.get(clave)
+        if estado:
+            cache.set(clave, (estado[0] + 1, estado[1]), timeout=60)
+
+    def reservar(self, canal):
+        """Reserva un envío por `canal`. Retorna 0 si puede enviarse ya, o segundos de espera."""
+        cubetas = []
+        if canal in self.limites_canal:
+            cubetas.append((f'{self.PREFIJO}:{canal}', self.limites_canal[canal]))
+        remitente = self.remitente(canal)
+        if remitente in self.limites_remitente:
+            cubetas.append((f'{self.PREFIJO}:{canal}:{remitente}', self.limites_remitente[remitente]))
+
+        tomadas = []
+        for clave, limite in cubetas:
+            espera = self._consumir(clave, limite['capacidad'], limite['por_segundo'])
+            if espera:
+                for tomada in tomadas:
+                    self._devolver(tomada)
+                return espera
+            tomadas.append(clave)
+        return 0
+
+
+class DespachadorNotificaciones:
+    """Despacho por lotes de notificaciones pendientes.
+
+    Cada lote se reclama con `select_for_update(skip_locked=True)` y se marca
+    como 'enviando' antes de soltar el bloqueo, de modo que varios workers
+    pueden vaciar la cola en paralelo sin enviar dos veces la misma fila.
+    Los envíos del lote se hacen en un pool de hilos acotado; cada hilo
+    reutiliza sus propios servicios de proveedor. Los resultados se escriben
+    de vuelta con `bulk_update` y `bulk_create`.
+
+    Los hilos no tocan la base de datos: reciben los datos ya resueltos.
+    """
+
+    def __init__(self, batch_size=None, max_workers=None, reclamo_timeout=None, filtro=None):
+        # `filtro` (un Q) restringe la cola, p.ej. a las notificaciones de una campaña
+        self.filtro = filtro or Q()
+        self.batch_size = batch_size or getattr(settings, 'NOTIFICACIONES_BATCH_SIZE', 100)
+        self.max_workers = max_workers or getattr(settings, 'NOTIFICACIONES_MAX_WORKERS', 8)
+        # Minutos tras los cuales una fila 'enviando' huérfana vuelve a ser elegible
+        self.reclamo_timeout = reclamo_timeout or getattr(settings, 'NOTIFICACIONES_RECLAMO_TIMEOUT', 15)
+        # Espera máxima (s) que un hilo hace por un token antes de reprogramar el mensaje
+        self.max_espera = getattr(settings, 'NOTIFICACIONES_MAX_ESPERA', 2)
+        # Retraso mínimo (s) con el que se reprograma un mensaje limitado
+        self.retraso_reintento = getattr(settings, 'NOTIFICACIONES_RETRASO_REINTENTO', 30)
+        self.limitador = LimitadorEnvios()
+        self._local = threading.local()
+        self._servicios = []
+        self._servicios_lock = threading.Lock()
+
+    def _servicio(self):
+        """NotificacionService propio del hilo actual (un cliente de proveedor por hilo)"""
+        servicio = getattr(self._local, 'servicio', None)
+        if servicio is None:
+            servicio = self._local.servicio = NotificacionService()
+            with self._servicios_lock:
+                self._servicios.append(servicio)
+        return servicio
+
+    def reclamar_lote(self):
+        """Toma hasta `batch_size` notificaciones y las marca como 'enviando'."""
+        from .models import Notificacion
+
+        ahora = timezone.now()
+        vencidas = ahora - timezone.timedelta(minutes=self.reclamo_timeout)
+        with transaction.atomic():
+            ids = list(
+                Notificacion.objects.select_for_update(skip_locked=True)
+                .filter(self.filtro)
+                .filter(Q(estado='pendiente') | Q(estado='enviando', reclamada_en__lt=vencidas))
+                .filter(Q(programada_para__isnull=True) | Q(programada_para__lte=ahora))
+                .order_by('id')
+                .values_list('id', flat=True)[:self.batch_size]
+            )
+            if ids:
+                Notificacion.objects.filter(id__in=ids).update(
+                    estado='enviando',
+                    reclamada_en=ahora,
+                    intentos_envio=F('intentos_envio') + 1,
+                )
+        return list(Notificacion.objects.filter(id__in=ids).select_related('cliente', 'plantilla').order_by('id'))
+
+    def _preparar(self, notificacion, variables):
+        cliente = notificacion.cliente
+        plantilla = notificacion.plantilla
+        if plantilla is not None and plantilla.contenido == notificacion.mensaje:
+            compilado = compilar_plantilla(plantilla)
+        else:
+            compilado = compilar_mensaje(notificacion.mensaje)
+        return {
+            'canal': notificacion.canal,
+            'telefono': cliente.telefono_principal or cliente.telefono,
+            'email': cliente.email,
+            'mensaje': compilado.render(variables.get(notificacion.cliente_id, {})),
+            'asunto': f'Cobramax - {notificacion.get_tipo_display()}',
+        }
+
+    def _enviar(self, datos):
+        """Envía un mensaje ya preparado. Se ejecuta dentro del pool de hilos.
+
+        Antes de enviar espera un token del limitador; si la espera supera
+        `max_espera`, devuelve un resultado 'throttled' para reprogramarlo.
+        """
+        limitado = self._esperar_token(datos['canal'])
+        if limitado:
+            return limitado
+        servicio = self._servicio()
+        try:
+            if datos['canal'] == 'whatsapp':
+                return servicio.whatsapp_service.enviar_mensaje(datos['telefono'], datos['mensaje'])
+            if datos['canal'] == 'email':
+                return servicio.email_service.enviar_email(datos['email'], datos['asunto'], datos['mensaje'])
+            if datos['canal'] == 'sms':
+                return servicio.sms_service.enviar_sms(datos['telefono'], datos['mensaje'])
+            return {'success': False, 'error': f"Canal no soportado: {datos['canal']}"}
+        except Exception as e:
+            logger.error(f"Error enviando notificación: {e}")
+            return {'success': False, 'error': str(e)}
+
+    def _esperar_token(self, canal):
+        """None si hay token para enviar; resultado 'throttled' si la espera es excesiva"""
+        while True:
+            espera = self.limitador.reservar(canal)
+            if not espera:
+                return None
+            if espera > self.max_espera:
+                return {'success': False, 'throttled': True, 'reintentar_en': espera}
+            time.sleep(espera)
+
+    def _enviar_correos(self, lista):
+        """Envía los emails de un lote por una sola conexión (`send_messages`)."""
+        resultados = [self._esperar_token('email') for _ in lista]
+        permitidos = [datos for datos, limitado in zip(lista, resultados) if limitado is None]
+        try:
+            enviados = iter(self._servicio().email_service.enviar_lote([
+                {'destino': d['email'], 'mensaje': d['mensaje'], 'asunto': d['asunto']}
+                for d in permitidos
+            ]) if permitidos else [])
+            return [limitado or next(enviados) for limitado in resultados]
+        except Exception as e:
+            logger.error(f"Error enviando lote de emails: {e}")
+            return [limitado or {'success': False, 'error': str(e)} for limitado in resultados]
+
+    def _guardar_resultados(self, notificaciones, envios, resultados):
+        from .models import Notificacion, RegistroEnvio
+
+        ahora = timezone.now()
+        registros = []
+        for notificacion, datos, resultado in zip(notificaciones, envios, resultados):
+            notificacion.reclamada_en = None
+            if resultado.get('throttled'):
+                # Limitado por presupuesto: vuelve a la cola con retraso, sin contar como intento
+                retraso = max(resultado.get('reintentar_en') or 0, self.retraso_reintento)
+                notificacion.estado = 'pendiente'
+                notificacion.programada_para = ahora + timezone.timedelta(seconds=retraso)
+                notificacion.intentos_envio -= 1
+                continue
+            exito = bool(resultado.get('success'))
+            notificacion.estado = 'enviado' if exito else 'fallido'
+            notificacion.fecha_envio = ahora if exito else None
+            notificacion.error_mensaje = None if exito else resultado.get('error', 'Error desconocido')
+            if datos['canal'] == 'email':
+                notificacion.destinatario_email = datos['email']
+            else:
+                notificacion.destinatario_telefono = datos['telefono']
+            registros.append(RegistroEnvio(
+                notificacion=notificacion,
+                exitoso=exito,
+                mensaje_error=notificacion.error_mensaje,
+                respuesta_api=json.dumps(resultado, default=str),
+            ))
+
+        with transaction.atomic():
+            Notificacion.objects.bulk_update(notificaciones, [
+                'estado', 'fecha_envio', 'error_mensaje', 'reclamada_en', 'programada_para',
+                'intentos_envio', 'destinatario_telefono', 'destinatario_email',
+            ])
+            RegistroEnvio.objects.bulk_create(registros)
+
+    def procesar_lote(self, pool):
+        """Reclama, envía y registra un lote.
+
+        Retorna (enviadas, fallidas, reprogramadas) o None si la cola está vacía.
+        """
+        notificaciones = self.reclamar_lote()
+        if not notificaciones:
+            return None
+
+        # Variables de todo el lote en una consulta; cada texto se compila una vez
+        variables = variables_clientes({n.cliente_id for n in notificaciones})
+        envios = [self._preparar(n, variables) for n in notificaciones]
+        resultados = [None] * len(envios)
+        correos = [i for i, datos in enumerate(envios) if datos['canal'] == 'email']
+        otros = [i for i, datos in enumerate(envios) if datos['canal'] != 'email']
+
+        # Los emails del lote van juntos por una conexión; el resto, uno por hilo
+        futuro_correos = pool.submit(self._enviar_correos, [envios[i] for i in correos]) if correos else None
+        for i, resultado in zip(otros, pool.map(self._enviar, [envios[i] for i in otros])):
+            resultados[i] = resultado
+        if futuro_correos:
+            for i, resultado in zip(correos, futuro_correos.result()):
+                resultados[i] = resultado
+
+        self._guardar_resultados(notificaciones, envios, resultados)
+        enviadas = sum(1 for r in resultados if r.get('success'))
+        reprogramadas = sum(1 for r in resultados if r.get('throttled'))
+        return enviadas, len(resultados) - enviadas - reprogramadas, reprogramadas
+
+    def despachar(self, max_lotes=None):
+        """Vacía la cola lote a lote (hasta `max_lotes` si se indica)."""
+        enviadas = fallidas = reprogramadas = lotes = 0
+        # El pool vive todo el despacho para que cada hilo conserve su cliente de proveedor
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while max_lotes is None or lotes < max_lotes:
+                resultado = self.procesar_lote(pool)
+                if resultado is None:
+                    break
+                enviadas += resultado[0]
+                fallidas += resultado[1]
+                reprogramadas += resultado[2]
+                lotes += 1
+        for servicio in self._servicios:
+            servicio.cerrar()
+        self._servicios = []
+        return {'enviadas': enviadas, 'fallidas': fallidas, 'reprogramadas': reprogramadas, 'lotes': lotes}
@@ -1,42 +1,65 @@
 # notificaciones/tasks.py
-from celery import shared_task
+from celery import shared_task, group
+from django.conf import settings
 from django.utils import timezone
 from datetime import timedelta
 from django.db.models import Q
 import logging
-from .models import Notificacion, PlantillaNotificacion
+from .models import Notificacion, PlantillaNotificacion, CampaniaNotificacion
 from clientes.models import Cliente
-from .services import NotificacionService
+from .services import NotificacionService, DespachadorNotificaciones
 
 logger = logging.getLogger(__name__)
 
 @shared_task
-def enviar_notificaciones_pendientes():
-    """Enviar notificaciones pendientes programadas"""
+def enviar_notificaciones_pendientes(max_lotes=None):
+    """Enviar notificaciones pendientes por lotes.
+
+    Varios workers pueden ejecutar esta tarea a la vez: cada lote se reclama
+    con skip_locked, así que ninguna notificación se envía dos veces.
+    """
     try:
-        notificaciones = Notificacion.objects.filter(
-            Q(estado='pendiente') | Q(estado='programado'),
-            Q(programada_para__isnull=True) | Q(programada_para__lte=timezone.now())
+        resultado = DespachadorNotificaciones().despachar(max_lotes=max_lotes)
+        logger.info(
+            f"Tarea notificaciones: {resultado['enviadas']} enviadas, "
+            f"{resultado['fallidas']} fallidas en {resultado['lotes']} lotes"
         )
-        
-        service = NotificacionService()
-        enviadas = 0
-        fallidas = 0
-        
-        for notificacion in notificaciones:
-            resultado = service.enviar_notificacion(notificacion)
-            if resultado.get('success'):
-                enviadas += 1
-            else:
-                fallidas += 1
-        
-        logger.info(f"Tarea notificaciones: {enviadas} enviadas, {fallidas} fallidas")
-        return {'enviadas': enviadas, 'fallidas': fallidas}
+        return resultado
         
     except Exception as e:
         logger.error(f"Error en tarea notificaciones: {str(e)}")
         return {'error': str(e)}
 
+@shared_task
+def enviar_campania(campania_id):
+    """Reparte el envío de una campaña entre varios workers.
+
+    Cada subtarea vacía la cola de la campaña con el despachador por lotes;
+    skip_locked evita que dos subtareas tomen las mismas notificaciones.
+    """
+    campania = CampaniaNotificacion.objects.get(id=campania_id)
+    batch_size = getattr(settings, 'NOTIFICACIONES_BATCH_SIZE', 100)
+    max_tareas = getattr(settings, 'NOTIFICACIONES_CAMPANIA_WORKERS', 4)
+    lotes = -(-campania.total_destinatarios // batch_size)
+    tareas = max(1, min(max_tareas, lotes))
+    group(despachar_campania.s(campania_id) for _ in range(tareas)).apply_async()
+    return {'campania_id': campania_id, 'tareas': tareas}
+
+
+@shared_task
+def despachar_campania(campania_id):
+    """Envía las notificaciones pendientes de una campaña"""
+    try:
+        resultado = DespachadorNotificaciones(filtro=Q(campania_id=campania_id)).despachar()
+        if resultado['reprogramadas']:
+            # Retomar la campaña cuando vuelvan a estar disponibles los mensajes limitados
+            retraso = getattr(settings, 'NOTIFICACIONES_RETRASO_REINTENTO', 30)
+            despachar_campania.apply_async((campania_id,), countdown=retraso)
+        return resultado
+    except Exception as e:
+        logger.error(f"Error despachando campaña {campania_id}: {str(e)}")
+        return {'error': str(e)}
+
 @shared_task
 def enviar_recordatorios_pago_automaticos():
     """Enviar recordatorios automáticos a clientes morosos"""
@@ -1,3 +1,203 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.core import mail
+from django.contrib.auth import get_user_model
+from cobramax_core.pruebas import ConsultasMixin
+from clientes.models import Cliente
+from zonas.models import Zona
+from .models import Notificacion, RegistroEnvio
+from .services import DespachadorNotificaciones
 
-# Create your tests here.
+User = get_user_model()
+
+
+class DespachoNotificacionesTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.zona = Zona.objects.create(nombre='Zona Test', codigo='ZT')
+		user = User.objects.create_user(username='cli', password='x')
+		self.cliente = Cliente.objects.create(
+			usuario=user, dni='12345678', telefono_principal='+51900000000', direccion='Calle',
+			zona=self.zona, fecha_instalacion='2025-01-01', email='cli@example.com',
+		)
+
+	def crear(self, canal='whatsapp', n=1):
+		return [
+			Notificacion.objects.create(cliente=self.cliente, zona=self.zona, tipo='general', mensaje=f'Hola {i}', canal=canal)
+			for i in range(n)
+		]
+
+	def test_despacha_en_lotes_y_registra(self):
+		self.crear(n=5)
+		self.crear(canal='email')
+		resultado = DespachadorNotificaciones(batch_size=2, max_workers=3).despachar()
+		self.assertEqual(resultado, {'enviadas': 6, 'fallidas': 0, 'reprogramadas': 0, 'lotes': 3})
+		self.assertEqual(Notificacion.objects.filter(estado='enviado').count(), 6)
+		self.assertEqual(RegistroEnvio.objects.filter(exitoso=True).count(), 6)
+		self.assertEqual(len(mail.outbox), 1)
+
+	def test_no_reenvia_notificaciones_reclamadas(self):
+		self.crear(n=3)
+		despachador = DespachadorNotificaciones(batch_size=10)
+		reclamadas = despachador.reclamar_lote()
+		self.assertEqual(len(reclamadas), 3)
+		# Otro worker no encuentra nada que reclamar mientras están 'enviando'
+		self.assertEqual(DespachadorNotificaciones().reclamar_lote(), [])
+		self.assertEqual(Notificacion.objects.get(id=reclamadas[0].id).intentos_envio, 1)
+
+	def test_canal_invalido_queda_fallido(self):
+		self.crear(canal='fax')
+		resultado = DespachadorNotificaciones().despachar()
+		self.assertEqual(resultado['fallidas'], 1)
+		self.assertEqual(Notificacion.objects.get().estado, 'fallido')
+
+	@override_settings(
+		NOTIFICACIONES_LIMITES={'whatsapp': {'capacidad': 1, 'por_segundo': 0.01}},
+		NOTIFICACIONES_MAX_ESPERA=0,
+	)
+	def test_limite_reprograma_en_vez_de_fallar(self):
+		self.crear(n=3)
+		resultado = DespachadorNotificaciones(max_workers=1).despachar()
+		self.assertEqual((resultado['enviadas'], resultado['reprogramadas'], resultado['fallidas']), (1, 2, 0))
+		reprogramadas = Notificacion.objects.filter(estado='pendiente')
+		self.assertEqual(reprogramadas.count(), 2)
+		self.assertTrue(all(n.programada_para > timezone.now() and n.intentos_envio == 0 for n in reprogramadas))
+		self.assertEqual(RegistroEnvio.objects.count(), 1)
+
+	@override_settings(
+		NOTIFICACIONES_LIMITES={'whatsapp': {'capacidad': 1, 'por_segundo': 0.01}}, CACHE_COMPARTIDA=False, DEBUG=False,
+	)
+	def test_limite_sin_cache_compartida_falla(self):
+		from django.core.exceptions import ImproperlyConfigured
+		self.crear()
+		with self.assertRaises(ImproperlyConfigured):
+			DespachadorNotificaciones().despachar()
+		self.assertEqual(Notificacion.objects.get().estado, 'pendiente')
+		# Sin límites configurados no hace falta coordinar nada
+		with self.settings(NOTIFICACIONES_LIMITES={}, NOTIFICACIONES_LIMITES_REMITENTE={}):
+			self.assertEqual(DespachadorNotificaciones().despachar()['enviadas'], 1)
+
+	@override_settings(NOTIFICACIONES_TRANSPORTE='fake', NOTIFICACIONES_FAKE_LATENCIA=0, NOTIFICACIONES_FAKE_TASA_ERROR=1.0)
+	def test_proveedor_falso_con_errores(self):
+		self.crear(n=2)
+		self.crear(canal='email', n=2)
+		resultado = DespachadorNotificaciones().despachar()
+		self.assertEqual((resultado['enviadas'], resultado['fallidas']), (0, 4))
+		self.assertEqual(len(mail.outbox), 0)
+		self.assertTrue(RegistroEnvio.objects.filter(mensaje_error__icontains='simulado').exists())
+
+	def test_emails_del_lote_comparten_conexion(self):
+		from unittest.mock import patch
+		from django.core.mail import get_connection
+		self.crear(canal='email', n=3)
+		with patch('notificaciones.services.get_connection', wraps=get_connection) as conexiones:
+			DespachadorNotificaciones().despachar()
+		self.assertEqual(conexiones.call_count, 1)
+		self.assertEqual(len(mail.outbox), 3)
+
+	def test_conexion_smtp_se_cierra_en_cada_lote(self):
+		from unittest.mock import patch
+		from .services import EmailService
+		with patch('notificaciones.services.get_connection') as conexion:
+			EmailService().enviar_email('a@correo.pe', 'Asunto', 'Hola')
+			conexion.return_value.__enter__.return_value.send_messages.side_effect = OSError('SMTP caído')
+			resultado = EmailService().enviar_lote([{'destino': 'b@correo.pe', 'mensaje': 'Hola'}])
+		self.assertFalse(resultado[0]['success'])
+		self.assertEqual(conexion.return_value.__exit__.call_count, 2)
+
+
+class CampaniaMasivaTests(ConsultasMixin, TestCase):
+	def setUp(self):
+		from cobramax_core.celery import app
+		self.app = app
+		self.app.conf.task_always_eager = True
+		self.admin = User.objects.create_user(username='adm', password='x', tipo_usuario='admin')
+		self.zona = Zona.objects.create(nombre='Zona Test', codigo='ZT')
+		for i in range(3):
+			user = User.objects.create_user(username=f'cli{i}', password='x')
+			Cliente.objects.create(
+				usuario=user, dni=f'1234567{i}', telefono_principal='+51900000000', direccion='Calle',
+				zona=self.zona, fecha_instalacion='2025-01-01',
+			)
+
+	def tearDown(self):
+		self.app.conf.task_always_eager = False
+
+	def test_masiva_crea_campania_y_reporta_progreso(self):
+		from django.urls import reverse
+		from .models import CampaniaNotificacion
+		self.client.force_login(self.admin)
+		resp = self.client.post(
+			reverse('notificacion_masiva'),
+			data={'tipo': 'general', 'mensaje': 'Aviso general', 'zona': self.zona.id},
+			HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+		)
+		data = resp.json()
+		campania = CampaniaNotificacion.objects.get(id=data['campania_id'])
+		self.assertEqual(campania.total_destinatarios, 3)
+
+		with self.assertMaxQueries(5):
+			progreso = self.client.get(data['progreso_url']).json()
+		self.assertEqual(progreso['enviadas'], 3)
+		self.assertEqual(progreso['fallidas'], 0)
+		self.assertTrue(progreso['finalizada'])
+
+	def test_lista_sin_consultas_por_fila(self):
+		from django.urls import reverse
+		self.client.force_login(self.admin)
+
+		def agregar(n):
+			for cliente in Cliente.objects.all():
+				for _ in range(n):
+					Notificacion.objects.create(
+						tipo='general', cliente=cliente, zona=self.zona, mensaje='Hola', canal='email', enviado_por=self.admin,
+					)
+
+		agregar(1)
+		self.assertQueriesNoCrecen(lambda: self.client.get(reverse('lista_notificaciones')), agregar, filas=3)
+
+
+class PlantillasCompiladasTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.zona = Zona.objects.create(nombre='Zona Norte', codigo='ZN')
+		self.clientes = []
+		for i in range(4):
+			user = User.objects.create_user(username=f'cli{i}', password='x', first_name=f'Ana{i}', last_name='Pérez')
+			self.clientes.append(Cliente.objects.create(
+				usuario=user, dni=f'8765432{i}', telefono_principal='+51900000000', direccion='Calle',
+				zona=self.zona, fecha_instalacion='2025-01-01', email=f'cli{i}@example.com', deuda_actual=25,
+			))
+
+	def test_compila_una_vez_por_version_de_plantilla(self):
+		from .models import PlantillaNotificacion
+		from .utils import compilar_plantilla
+		plantilla = PlantillaNotificacion.objects.create(nombre='P', tipo='pago', contenido='Hola {{ nombre }}, debes {{deuda}}')
+		compilada = compilar_plantilla(plantilla)
+		self.assertIs(compilar_plantilla(plantilla), compilada)
+		self.assertEqual(compilada.render({'nombre': 'Ana', 'deuda': 'S/ 5'}), 'Hola Ana, debes S/ 5')
+		self.assertEqual(compilada.render({'nombre': 'Ana'}), 'Hola Ana, debes {{deuda}}')
+
+		plantilla.contenido = 'Adiós {{nombre}}'
+		plantilla.save()
+		self.assertIsNot(compilar_plantilla(plantilla), compilada)
+		self.assertEqual(compilar_plantilla(plantilla).render({'nombre': 'Ana'}), 'Adiós Ana')
+
+	def test_despacho_personaliza_sin_consultas_por_destinatario(self):
+		from .models import PlantillaNotificacion
+		plantilla = PlantillaNotificacion.objects.create(nombre='P', tipo='pago', contenido='Hola {{nombre}} de {zona}: {{deuda}}')
+		for cliente in self.clientes:
+			Notificacion.objects.create(
+				cliente=cliente, zona=self.zona, tipo='pago', mensaje=plantilla.contenido,
+				plantilla=plantilla, canal='email',
+			)
+		from .utils import variables_clientes
+		with self.assertNumQueries(1):
+			variables = variables_clientes([c.id for c in self.clientes])
+		self.assertEqual(variables[self.clientes[0].id]['nombre'], 'Ana0 Pérez')
+
+		DespachadorNotificaciones(batch_size=2).despachar()
+		cuerpos = sorted(m.body for m in mail.outbox)
+		self.assertEqual(cuerpos[0], 'Hola Ana0 Pérez de Zona Norte: S/ 25.00')
+		self.assertEqual(len(cuerpos), 4)
@@ -24,6 +24,7 @@ urlpatterns = [
     # API endpoints
     path('api/plantillas/', views.obtener_plantillas_por_tipo, name='api_plantillas'),
     path('api/estadisticas/', views.estadisticas_notificaciones, name='api_estadisticas'),
+    path('api/campanias/<int:campania_id>/progreso/', views.progreso_campania, name='api_progreso_campania'),
     path('api/clientes-autocomplete/', views.obtener_clientes_autocomplete, name='api_clientes_autocomplete'),
     # Utilities / testing
     path('test-send/', views.test_send_notification, name='test_send_notification'),
@@ -0,0 +1,85 @@
+# notificaciones/utils.py
+import re
+from datetime import timedelta
+from functools import lru_cache
+from django.utils import timezone
+from clientes.models import Cliente
+
+# Acepta {{variable}} (plantillas) y {variable} (mensajes antiguos)
+VARIABLE_RE = re.compile(r'\{\{\s*(\w+)\s*\}\}|\{(\w+)\}')
+
+
+class MensajeCompilado:
+    """Mensaje con variables ya separado en partes fijas y nombres de variable.
+
+    Renderizar es un `join` sobre la lista de partes, sin volver a recorrer
+    el texto. Las variables desconocidas se dejan tal cual aparecen.
+    """
+
+    def __init__(self, texto):
+        self.partes = []
+        pos = 0
+        for m in VARIABLE_RE.finditer(texto):
+            if m.start() > pos:
+                self.partes.append((False, texto[pos:m.start()]))
+            self.partes.append((True, (m.group(1) or m.group(2), m.group(0))))
+            pos = m.end()
+        if pos < len(texto):
+            self.partes.append((False, texto[pos:]))
+        self.variables = {valor[0] for es_variable, valor in self.partes if es_variable}
+
+    def render(self, variables):
+        salida = []
+        for es_variable, valor in self.partes:
+            if es_variable:
+                nombre, original = valor
+                salida.append(str(variables[nombre]) if nombre in variables else original)
+            else:
+                salida.append(valor)
+        return ''.join(salida)
+
+
+@lru_cache(maxsize=512)
+def _compilar(clave, texto):
+    return MensajeCompilado(texto)
+
+
+def compilar_mensaje(texto):
+    """Compila (una sola vez por texto) el contenido de un mensaje"""
+    return _compilar(('texto', texto), texto)
+
+
+def compilar_plantilla(plantilla):
+    """Compila una PlantillaNotificacion; la caché se invalida al modificarla"""
+    return _compilar(('plantilla', plantilla.id, plantilla.fecha_modificacion), plantilla.contenido)
+
+
+def variables_clientes(cliente_ids):
+    """Variables de personalización de varios clientes con una sola consulta.
+
+    Retorna {cliente_id: {'nombre': ..., 'deuda': ..., ...}}.
+    """
+    fecha_limite = (timezone.localdate() + timedelta(days=5)).strftime('%d/%m/%Y')
+    filas = Cliente.objects.filter(id__in=cliente_ids).order_by().values(
+        'id', 'nombre', 'apellido', 'dni', 'deuda_actual', 'monto_mensual', 'plan_contratado',
+        'usuario__first_name', 'usuario__last_name', 'zona__nombre',
+        'zona__cobrador__first_name', 'zona__cobrador__last_name',
+    )
+    variables = {}
+    for f in filas:
+        nombre = f"{f['usuario__first_name'] or ''} {f['usuario__last_name'] or ''}".strip()
+        if not nombre:
+            nombre = f"{f['nombre']} {f['apellido']}".strip()
+        cobrador = f"{f['zona__cobrador__first_name'] or ''} {f['zona__cobrador__last_name'] or ''}".strip()
+        variables[f['id']] = {
+            'nombre': nombre,
+            'dni': f['dni'],
+            'deuda': f"S/ {f['deuda_actual']}",
+            'monto': f"S/ {f['monto_mensual']}",
+            'servicio': f['plan_contratado'] or 'servicio',
+            'plan': f['plan_contratado'] or 'servicio',
+            'fecha_limite': fecha_limite,
+            'zona': f['zona__nombre'] or '',
+            'cobrador': cobrador or 'nuestro cobrador',
+        }
+    return variables
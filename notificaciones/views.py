@@ -1,24 +1,26 @@
 # notificaciones/views.py
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.http import JsonResponse
 from django.db.models import Count, Q
 from django.utils import timezone
 from datetime import timedelta
-from .models import Notificacion, PlantillaNotificacion, RegistroEnvio
+from .models import Notificacion, PlantillaNotificacion, RegistroEnvio, CampaniaNotificacion
 from .forms import NotificacionForm, PlantillaNotificacionForm, NotificacionMasivaForm
 from clientes.models import Cliente
 from zonas.models import Zona
 from .services import NotificacionService
-from .tasks import enviar_mensaje_directo
+from .tasks import enviar_mensaje_directo, enviar_campania
 from django import forms
 from types import SimpleNamespace
 import json
 from django.views.decorators.http import require_GET
 import logging
 from usuarios.decorators import require_roles
-from django.db import models
+from cobramax_core.paginacion import paginar_por_cursor
+from cobramax_core.estadisticas import estadisticas, contar, ttl_dashboard
 
 
 # =======================
@@ -29,16 +31,23 @@ from django.db import models
 @require_roles(['admin', 'oficina'])
 def dashboard_notificaciones(request):
     """Dashboard principal de notificaciones"""
-    # Filtros temporales
-    hoy = timezone.now()
+    # Filtros temporales (al minuto, para que la caché de estadísticas sea reutilizable)
+    hoy = timezone.now().replace(second=0, microsecond=0)
     hace_7_dias = hoy - timedelta(days=7)
     hace_30_dias = hoy - timedelta(days=30)
 
-    # Estadísticas generales
-    total_notificaciones = Notificacion.objects.count()
-    notificaciones_pendientes = Notificacion.objects.filter(estado='pendiente').count()
-    notificaciones_enviadas = Notificacion.objects.filter(estado='enviado').count()
-    notificaciones_fallidas = Notificacion.objects.filter(estado='fallido').count()
+    # Estadísticas generales y tasa de éxito de 7 días en una sola consulta
+    stats = estadisticas(
+        Notificacion.objects.all(), ttl=ttl_dashboard(),
+        total=contar(), pendientes=contar(estado='pendiente'),
+        enviadas=contar(estado='enviado'), fallidas=contar(estado='fallido'),
+        intentos_7_dias=contar(fecha_creacion__gte=hace_7_dias),
+        enviadas_7_dias=contar(fecha_creacion__gte=hace_7_dias, estado='enviado'),
+    )
+    total_notificaciones = stats['total']
+    notificaciones_pendientes = stats['pendientes']
+    notificaciones_enviadas = stats['enviadas']
+    notificaciones_fallidas = stats['fallidas']
 
     # Notificaciones recientes (últimas 10)
     notificaciones_recientes = Notificacion.objects.select_related(
@@ -51,9 +60,8 @@ def dashboard_notificaciones(request):
     ).values('tipo').annotate(total=Count('id'))
 
     # Tasa de éxito (últimos 7 días)
-    envios_7_dias = Notificacion.objects.filter(fecha_creacion__gte=hace_7_dias)
-    total_enviadas = envios_7_dias.filter(estado='enviado').count()
-    total_intentos = envios_7_dias.count()
+    total_enviadas = stats['enviadas_7_dias']
+    total_intentos = stats['intentos_7_dias']
     tasa_exito = (total_enviadas / total_intentos * 100) if total_intentos > 0 else 0
 
     context = {
@@ -74,8 +82,8 @@ def dashboard_notificaciones(request):
 def lista_notificaciones(request):
     """Lista completa de notificaciones con filtros"""
     notificaciones = Notificacion.objects.select_related(
-        'cliente', 'zona', 'enviado_por'
-    ).order_by('-fecha_creacion')
+        'cliente__zona', 'zona', 'enviado_por'
+    )
     
     # Filtros
     estado = request.GET.get('estado')
@@ -89,10 +97,23 @@ def lista_notificaciones(request):
     if zona_id:
         notificaciones = notificaciones.filter(zona_id=zona_id)
     
+    # Página actual por cursor (fecha_creacion, id); ?formato=json para scroll infinito
+    pagina = paginar_por_cursor(request, notificaciones, ('-fecha_creacion', '-id'))
+    if request.GET.get('formato') == 'json':
+        return JsonResponse(pagina.como_json(lambda n: {
+            'id': n.id,
+            'tipo': n.tipo,
+            'cliente': n.cliente.nombre_completo(),
+            'canal': n.canal,
+            'estado': n.estado,
+            'fecha_creacion': n.fecha_creacion.isoformat(),
+        }))
+    
     zonas = Zona.objects.all()
     
     context = {
-        'notificaciones': notificaciones,
+        'notificaciones': pagina.objetos,
+        'pagina': pagina,
         'zonas': zonas,
         'estado_filtro': estado,
         'tipo_filtro': tipo,
@@ -201,28 +222,52 @@ def notificacion_masiva(request):
             if usar_plantilla and plantilla:
                 mensaje = plantilla.contenido
             
-            # Crear notificaciones
-            contador_exitosas = 0
-            contador_fallidas = 0
+            # Crear la campaña e insertar sus destinatarios en bloque
+            campania = CampaniaNotificacion.objects.create(
+                tipo=tipo,
+                mensaje=mensaje,
+                canal='whatsapp',  # Por defecto
+                zona=zona,
+                estado_cliente=estado_cliente or '',
+                plantilla=plantilla if usar_plantilla else None,
+                creada_por=request.user,
+            )
+            destinatarios = Notificacion.objects.bulk_create(
+                (
+                    Notificacion(
+                        cliente_id=c['id'],
+                        zona_id=c['zona_id'],
+                        tipo=tipo,
+                        mensaje=mensaje,
+                        canal=campania.canal,
+                        plantilla=campania.plantilla,
+                        campania=campania,
+                        enviado_por=request.user,
+                    )
+                    for c in clientes.order_by().values('id', 'zona_id').iterator()
+                ),
+                batch_size=1000,
+            )
+            campania.total_destinatarios = len(destinatarios)
+            campania.save(update_fields=['total_destinatarios'])
             
-            for cliente in clientes:
-                notificacion = Notificacion.objects.create(
-                    cliente=cliente,
-                    zona=cliente.zona,
-                    tipo=tipo,
-                    mensaje=mensaje,
-                    canal='whatsapp',  # Por defecto
-                    enviado_por=request.user
-                )
-                
-                if notificacion.enviar_notificacion():
-                    contador_exitosas += 1
-                else:
-                    contador_fallidas += 1
+            # El envío corre en Celery; si el broker no está disponible, las
+            # notificaciones quedan pendientes para la tarea periódica
+            try:
+                enviar_campania.delay(campania.id)
+            except Exception as e:
+                logging.getLogger(__name__).exception('Error encolando campaña %s: %s', campania.id, e)
             
+            is_ajax = request.headers.get('x-requested-with') == 'XMLHttpRequest'
+            if is_ajax:
+                return JsonResponse({
+                    'ok': True,
+                    'campania_id': campania.id,
+                    'progreso_url': reverse('api_progreso_campania', args=[campania.id]),
+                })
             messages.success(
                 request, 
-                f'Notificaciones masivas enviadas: {contador_exitosas} exitosas, {contador_fallidas} fallidas'
+                f'Campaña #{campania.id} creada: {campania.total_destinatarios} notificaciones en cola de envío'
             )
             return redirect('dashboard_notificaciones')
     else:
@@ -563,26 +608,30 @@ def estadisticas_notificaciones(request):
     return JsonResponse(data)
 
 
+@login_required
+@require_roles(['admin', 'oficina'])
+def progreso_campania(request, campania_id):
+    """API con el avance de una campaña masiva (enviadas/fallidas/pendientes)"""
+    campania = get_object_or_404(CampaniaNotificacion, id=campania_id)
+    return JsonResponse(campania.progreso())
+
+
 @login_required
 @require_GET
 def obtener_clientes_autocomplete(request):
-    """Endpoint simple para autocompletar clientes por nombre, telefono o email."""
+    """Endpoint simple para autocompletar clientes por nombre, DNI, telefono o email."""
     q = request.GET.get('q', '').strip()
     items = []
     if q:
-        qs = Cliente.objects.filter(
-            models.Q(nombre__icontains=q) |
-            models.Q(nombre_completo__icontains=q) |
-            models.Q(telefono__icontains=q) |
-            models.Q(email__icontains=q)
-        ).order_by('nombre')[:10]
+        qs = Cliente.objects.search(q, limit=10)
 
         for c in qs:
-            label = f"{c.nombre_completo or c.nombre} — {c.telefono or ''} {('<' + c.email + '>') if c.email else ''}"
+            nombre = c.nombre_completo() or c.nombre
+            label = f"{nombre} — {c.telefono or ''} {('<' + c.email + '>') if c.email else ''}"
             items.append({
                 'id': c.id,
                 'label': label,
-                'nombre': c.nombre_completo or c.nombre,
+                'nombre': nombre,
                 'telefono': c.telefono,
                 'email': c.email,
             })
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from reportes.models import IngresoDiario
+
+class Command(BaseCommand):
+    help = 'Reconstruye el acumulado IngresoDiario a partir de los pagos completados'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Filas por INSERT al recrear el acumulado')
+
+    def handle(self, *args, **options):
+        creadas = IngresoDiario.reconstruir(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'IngresoDiario reconstruido: {creadas} filas'))
@@ -0,0 +1,57 @@
+# Generated by Django 5.0.2 on 2026-10-18 00:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def poblar_ingresos_diarios(apps, schema_editor):
+    Pago = apps.get_model('cobranza', 'Pago')
+    IngresoDiario = apps.get_model('reportes', 'IngresoDiario')
+    filas = (
+        Pago.objects.filter(estado='completado')
+        .annotate(dia=TruncDate('fecha_pago'))
+        .values('dia', 'cliente__zona_id', 'metodo_pago')
+        .annotate(suma=Sum('monto'), num=Count('id'))
+        .order_by()
+    )
+    IngresoDiario.objects.bulk_create(
+        (
+            IngresoDiario(dia=f['dia'], zona_id=f['cliente__zona_id'], metodo_pago=f['metodo_pago'],
+                          suma_monto=f['suma'], num_pagos=f['num'])
+            for f in filas.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cobranza', '0003_ejecucionciclo'),
+        ('reportes', '0001_initial'),
+        ('zonas', '0005_create_hierarchy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngresoDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField()),
+                ('metodo_pago', models.CharField(max_length=15)),
+                ('suma_monto', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('num_pagos', models.PositiveIntegerField(default=0)),
+                ('zona', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ingresos_diarios', to='zonas.zona')),
+            ],
+            options={
+                'verbose_name': 'Ingreso Diario',
+                'verbose_name_plural': 'Ingresos Diarios',
+                'ordering': ['-dia'],
+                'indexes': [models.Index(fields=['dia'], name='reportes_in_dia_7b2e36_idx')],
+                'unique_together': {('dia', 'zona', 'metodo_pago')},
+            },
+        ),
+        migrations.RunPython(poblar_ingresos_diarios, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.2 on 2026-10-18 00:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reportes', '0002_ingresodiario'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reportegenerado',
+            name='huella',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+    ]
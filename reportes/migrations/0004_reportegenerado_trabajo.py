@@ -0,0 +1,50 @@
+# Generated by Django 5.0.2 on 2026-10-18 00:58
+
+from django.db import migrations, models
+
+
+def marcar_existentes(apps, schema_editor):
+    # Los reportes anteriores a la cola ya estaban generados
+    ReporteGenerado = apps.get_model('reportes', 'ReporteGenerado')
+    ReporteGenerado.objects.exclude(archivo='').exclude(archivo__isnull=True).update(estado='completado')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reportes', '0003_reportegenerado_huella'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reportegenerado',
+            name='error',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='reportegenerado',
+            name='estado',
+            field=models.CharField(choices=[('pendiente', 'Pendiente'), ('procesando', 'Procesando'), ('completado', 'Completado'), ('error', 'Error')], default='pendiente', max_length=12),
+        ),
+        migrations.AddField(
+            model_name='reportegenerado',
+            name='fecha_fin',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='reportegenerado',
+            name='fecha_inicio',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='reportegenerado',
+            name='resultado',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='reportegenerado',
+            name='tipo_reporte',
+            field=models.CharField(choices=[('ingresos', 'Reporte de Ingresos'), ('morosos', 'Reporte de Clientes Morosos'), ('pagos', 'Reporte de Pagos'), ('clientes', 'Reporte de Clientes'), ('zonas', 'Reporte de Zonas')], max_length=20),
+        ),
+        migrations.RunPython(marcar_existentes, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,12 @@
 # reportes/models.py
-from django.db import models
+from datetime import datetime, time
+from decimal import Decimal
+from django.db import models, transaction
+from django.db.models import F, Sum, Count
+from django.db.models.functions import TruncDate
 from django.contrib.auth import get_user_model
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 
 Usuario = get_user_model()
 
@@ -10,6 +16,13 @@ class ReporteGenerado(models.Model):
         ('morosos', 'Reporte de Clientes Morosos'),
         ('pagos', 'Reporte de Pagos'),
         ('clientes', 'Reporte de Clientes'),
+        ('zonas', 'Reporte de Zonas'),
+    ]
+    ESTADO_CHOICES = [
+        ('pendiente', 'Pendiente'),
+        ('procesando', 'Procesando'),
+        ('completado', 'Completado'),
+        ('error', 'Error'),
     ]
     
     tipo_reporte = models.CharField(max_length=20, choices=TIPO_REPORTE_CHOICES)
@@ -17,6 +30,14 @@ class ReporteGenerado(models.Model):
     archivo = models.FileField(upload_to='reportes/', blank=True, null=True)
     generado_por = models.ForeignKey(Usuario, on_delete=models.CASCADE)
     fecha_generacion = models.DateTimeField(auto_now_add=True)
+    # Hash de (tipo, parametros) para reutilizar exportaciones idénticas
+    huella = models.CharField(max_length=64, blank=True, db_index=True)
+    # Trabajo en segundo plano: estado y resultado JSON del cálculo
+    estado = models.CharField(max_length=12, choices=ESTADO_CHOICES, default='pendiente')
+    resultado = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    fecha_inicio = models.DateTimeField(null=True, blank=True)
+    fecha_fin = models.DateTimeField(null=True, blank=True)
     
     class Meta:
         verbose_name = "Reporte Generado"
@@ -24,4 +45,151 @@ class ReporteGenerado(models.Model):
         ordering = ['-fecha_generacion']
     
     def __str__(self):
-        return f"{self.get_tipo_reporte_display()} - {self.fecha_generacion.strftime('%d/%m/%Y %H:%M')}"
\ No newline at end of file
+        return f"{self.get_tipo_reporte_display()} - {self.fecha_generacion.strftime('%d/%m/%Y %H:%M')}"
+
+    @property
+    def terminado(self):
+        return self.estado in ('completado', 'error')
+
+class IngresoDiario(models.Model):
+    """Acumulado de pagos completados por (día, zona, método de pago).
+
+    Lo mantienen incrementalmente las señales de `Pago` (ver abajo) y se
+    reconstruye desde cero con `manage.py rebuild_ingresos_diarios`. Los
+    reportes leen de aquí en lugar de re-agregar toda la tabla de pagos.
+    La zona es la actual del cliente, como en `reconstruir`: si un cliente
+    cambia de zona, sus pagos pasan a la nueva (`mover_cliente`).
+    """
+    dia = models.DateField()
+    zona = models.ForeignKey('zonas.Zona', on_delete=models.CASCADE, related_name='ingresos_diarios')
+    metodo_pago = models.CharField(max_length=15)
+    suma_monto = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    num_pagos = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Ingreso Diario"
+        verbose_name_plural = "Ingresos Diarios"
+        ordering = ['-dia']
+        unique_together = ('dia', 'zona', 'metodo_pago')
+        indexes = [
+            models.Index(fields=['dia']),
+        ]
+
+    def __str__(self):
+        return f"{self.dia} - {self.zona_id} - {self.metodo_pago}: S/ {self.suma_monto} ({self.num_pagos})"
+
+    @property
+    def promedio(self):
+        return self.suma_monto / self.num_pagos if self.num_pagos else 0
+
+    @classmethod
+    def aplicar(cls, dia, zona_id, metodo_pago, monto, signo=1, pagos=1):
+        """Suma (signo=1) o resta (signo=-1) `pagos` pagos por `monto` con un UPDATE atómico."""
+        fila, _ = cls.objects.get_or_create(dia=dia, zona_id=zona_id, metodo_pago=metodo_pago)
+        cls.objects.filter(pk=fila.pk).update(
+            suma_monto=F('suma_monto') + signo * monto,
+            num_pagos=F('num_pagos') + signo * pagos,
+        )
+
+    @classmethod
+    def mover_cliente(cls, cliente_id, zona_origen, zona_destino):
+        """Pasa los pagos completados del cliente de una zona a otra, por día y método."""
+        from cobranza.models import Pago
+
+        filas = (
+            Pago.objects.filter(cliente_id=cliente_id, estado='completado')
+            .annotate(dia=TruncDate('fecha_pago'))
+            .values('dia', 'metodo_pago')
+            .annotate(suma=Sum('monto'), num=Count('id'))
+            .order_by()
+        )
+        with transaction.atomic():
+            for f in filas:
+                cls.aplicar(f['dia'], zona_origen, f['metodo_pago'], f['suma'], signo=-1, pagos=f['num'])
+                cls.aplicar(f['dia'], zona_destino, f['metodo_pago'], f['suma'], pagos=f['num'])
+
+    @classmethod
+    def reconstruir(cls, batch_size=1000):
+        """Recalcula todo el acumulado desde `Pago` en una sola agregación."""
+        from cobranza.models import Pago
+
+        filas = (
+            Pago.objects.filter(estado='completado')
+            .annotate(dia=TruncDate('fecha_pago'))
+            .values('dia', 'cliente__zona_id', 'metodo_pago')
+            .annotate(suma=Sum('monto'), num=Count('id'))
+            .order_by()
+        )
+        with transaction.atomic():
+            cls.objects.all().delete()
+            creadas = cls.objects.bulk_create(
+                (
+                    cls(dia=f['dia'], zona_id=f['cliente__zona_id'], metodo_pago=f['metodo_pago'],
+                        suma_monto=f['suma'], num_pagos=f['num'])
+                    for f in filas.iterator()
+                ),
+                batch_size=batch_size,
+            )
+        return len(creadas)
+
+
+# Señales: mantener IngresoDiario al guardar/eliminar pagos y al cambiar de zona un cliente
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from cobranza.models import Pago
+
+
+def _clave_rollup(pago):
+    """(día local, zona, método, monto) del pago, o None si no suma a ingresos."""
+    if pago.estado != 'completado':
+        return None
+    fecha = pago.fecha_pago
+    if isinstance(fecha, str):
+        fecha = parse_datetime(fecha) or datetime.combine(parse_date(fecha), time.min)
+    if timezone.is_aware(fecha):
+        fecha = timezone.localtime(fecha)
+    return (fecha.date(), pago.cliente.zona_id, pago.metodo_pago, Decimal(str(pago.monto)))
+
+
+@receiver(pre_save, sender=Pago)
+def pago_pre_save_rollup(sender, instance, **kwargs):
+    instance._rollup_anterior = None
+    if instance.pk:
+        original = Pago.objects.filter(pk=instance.pk).select_related('cliente').first()
+        if original:
+            instance._rollup_anterior = _clave_rollup(original)
+
+
+@receiver(post_save, sender=Pago)
+def pago_post_save_rollup(sender, instance, **kwargs):
+    anterior = getattr(instance, '_rollup_anterior', None)
+    nueva = _clave_rollup(instance)
+    if anterior == nueva:
+        return
+    if anterior:
+        IngresoDiario.aplicar(*anterior, signo=-1)
+    if nueva:
+        IngresoDiario.aplicar(*nueva)
+
+
+@receiver(post_delete, sender=Pago)
+def pago_post_delete_rollup(sender, instance, **kwargs):
+    clave = _clave_rollup(instance)
+    if clave:
+        IngresoDiario.aplicar(*clave, signo=-1)
+
+
+@receiver(pre_save, sender='clientes.Cliente')
+def cliente_pre_save_rollup(sender, instance, update_fields=None, **kwargs):
+    instance._zona_rollup_anterior = None
+    if instance.pk and (update_fields is None or 'zona' in update_fields):
+        instance._zona_rollup_anterior = (
+            sender.objects.filter(pk=instance.pk).values_list('zona_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender='clientes.Cliente')
+def cliente_post_save_rollup(sender, instance, created, **kwargs):
+    anterior = getattr(instance, '_zona_rollup_anterior', None)
+    if not created and anterior and anterior != instance.zona_id:
+        IngresoDiario.mover_cliente(instance.pk, anterior, instance.zona_id)
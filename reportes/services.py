@@ -0,0 +1,373 @@
+# reportes/services.py
+import csv
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.core.files import File
+from django.db.models import Q, Sum
+from django.utils import timezone
+from clientes.models import Cliente
+from cobramax_core.caches import cache_compartida, contador_en_curso
+from cobranza.models import Pago
+from zonas.models import Zona, rango_periodo
+from .models import ReporteGenerado, IngresoDiario
+
+logger = logging.getLogger(__name__)
+
+# openpyxl es opcional: sin él sólo se exporta CSV
+try:
+    from openpyxl import Workbook
+    XLSX_AVAILABLE = True
+except ImportError:
+    Workbook = None
+    XLSX_AVAILABLE = False
+
+FORMATOS = ('csv', 'xlsx')
+
+
+def _chunk():
+    return getattr(settings, 'REPORTES_EXPORTACION_CHUNK', 2000)
+
+
+def _fecha(valor):
+    try:
+        return datetime.strptime(valor, '%Y-%m-%d')
+    except (TypeError, ValueError):
+        return None
+
+
+def _nombre(nombre, apellido, mostrado):
+    return mostrado or f"{nombre or ''} {apellido or ''}".strip()
+
+
+def _filas_pagos(parametros, solo_completados=False):
+    pagos = Pago.objects.all()
+    if solo_completados:
+        pagos = pagos.filter(estado='completado')
+    elif parametros.get('estado'):
+        pagos = pagos.filter(estado=parametros['estado'])
+    desde = _fecha(parametros.get('fecha_desde'))
+    hasta = _fecha(parametros.get('fecha_hasta'))
+    if desde:
+        pagos = pagos.filter(fecha_pago__gte=desde)
+    if hasta:
+        pagos = pagos.filter(fecha_pago__lt=hasta + timedelta(days=1))
+    if parametros.get('zona'):
+        pagos = pagos.filter(cliente__zona_id=parametros['zona'])
+    if parametros.get('metodo_pago'):
+        pagos = pagos.filter(metodo_pago=parametros['metodo_pago'])
+
+    filas = pagos.order_by('fecha_pago', 'id').values_list(
+        'fecha_pago', 'codigo_transaccion', 'cliente__dni', 'cliente__nombre', 'cliente__apellido',
+        'cliente__nombre_mostrado', 'cliente__zona__nombre', 'monto', 'metodo_pago', 'estado',
+    )
+    for fecha, codigo, dni, nombre, apellido, mostrado, zona, monto, metodo, estado in filas.iterator(chunk_size=_chunk()):
+        yield [
+            timezone.localtime(fecha).strftime('%Y-%m-%d %H:%M'), codigo, dni,
+            _nombre(nombre, apellido, mostrado), zona or '', monto, metodo, estado,
+        ]
+
+
+def _filas_clientes(parametros, solo_morosos=False):
+    clientes = Cliente.objects.all()
+    if solo_morosos:
+        clientes = clientes.filter(estado='moroso')
+    elif parametros.get('estado'):
+        clientes = clientes.filter(estado=parametros['estado'])
+    if parametros.get('zona'):
+        clientes = clientes.filter(zona_id=parametros['zona'])
+
+    filas = clientes.order_by('id').values_list(
+        'dni', 'nombre', 'apellido', 'nombre_mostrado',
+        'telefono_principal', 'zona__nombre', 'plan_contratado', 'monto_mensual', 'deuda_actual', 'estado',
+    )
+    for dni, nombre, apellido, mostrado, telefono, zona, plan, mensual, deuda, estado in filas.iterator(chunk_size=_chunk()):
+        yield [dni, _nombre(nombre, apellido, mostrado), telefono, zona or '', plan or '', mensual, deuda, estado]
+
+
+def _ingresos_filtrados(parametros):
+    ingresos = IngresoDiario.objects.all()
+    desde = _fecha(parametros.get('fecha_desde'))
+    hasta = _fecha(parametros.get('fecha_hasta'))
+    if desde:
+        ingresos = ingresos.filter(dia__gte=desde.date())
+    if hasta:
+        ingresos = ingresos.filter(dia__lte=hasta.date())
+    if parametros.get('zona'):
+        ingresos = ingresos.filter(zona_id=parametros['zona'])
+    if parametros.get('metodo_pago'):
+        ingresos = ingresos.filter(metodo_pago=parametros['metodo_pago'])
+    return ingresos.order_by()
+
+
+def calcular_ingresos(parametros):
+    """Totales de ingresos, por día y por zona, desde el acumulado diario"""
+    ingresos = _ingresos_filtrados(parametros)
+    totales = ingresos.aggregate(total=Sum('suma_monto'), cantidad=Sum('num_pagos'))
+    total = float(totales['total'] or 0)
+    cantidad = totales['cantidad'] or 0
+    por_dia = ingresos.values('dia').annotate(total=Sum('suma_monto'), cantidad=Sum('num_pagos')).order_by('dia')
+    por_zona = ingresos.values('zona__nombre').annotate(total=Sum('suma_monto'), cantidad=Sum('num_pagos')).order_by('-total')
+    return {
+        'total_ingresos': total,
+        'total_pagos': cantidad,
+        'promedio_pago': round(total / cantidad, 2) if cantidad else 0,
+        'por_dia': [{'fecha': f['dia'].isoformat(), 'total': float(f['total']), 'cantidad': f['cantidad']} for f in por_dia],
+        'por_zona': [{'zona': f['zona__nombre'], 'total': float(f['total']), 'cantidad': f['cantidad']} for f in por_zona],
+    }
+
+
+def calcular_zonas(parametros):
+    """Rendimiento por zona: clientes por estado e ingresos del mes en curso"""
+    desde, _ = rango_periodo('mes')
+    zonas = Zona.objects.with_metrics('mes').order_by('nombre').values(
+        'id', 'nombre', 'codigo', 'total_clientes', 'clientes_activos', 'clientes_morosos',
+        'deuda_total', 'ingresos_periodo',
+    )
+    filas = []
+    for zona in zonas:
+        zona['deuda_total'] = float(zona['deuda_total'])
+        zona['ingresos_mes'] = float(zona.pop('ingresos_periodo'))
+        filas.append(zona)
+    return {'mes': desde.isoformat(), 'zonas': filas}
+
+
+COLUMNAS_PAGOS = ['Fecha', 'Código', 'DNI', 'Cliente', 'Zona', 'Monto', 'Método', 'Estado']
+COLUMNAS_CLIENTES = ['DNI', 'Cliente', 'Teléfono', 'Zona', 'Plan', 'Monto mensual', 'Deuda', 'Estado']
+
+# tipo_reporte -> filtros admitidos
+FILTROS = {
+    'ingresos': ('fecha_desde', 'fecha_hasta', 'zona', 'metodo_pago'),
+    'pagos': ('fecha_desde', 'fecha_hasta', 'zona', 'metodo_pago', 'estado'),
+    'morosos': ('zona',),
+    'clientes': ('zona', 'estado'),
+    'zonas': (),
+}
+
+# tipo_reporte -> (encabezados, generador de filas) para CSV/XLSX
+EXPORTACIONES = {
+    'ingresos': (COLUMNAS_PAGOS, lambda p: _filas_pagos(p, solo_completados=True)),
+    'pagos': (COLUMNAS_PAGOS, _filas_pagos),
+    'morosos': (COLUMNAS_CLIENTES, lambda p: _filas_clientes(p, solo_morosos=True)),
+    'clientes': (COLUMNAS_CLIENTES, _filas_clientes),
+}
+
+# tipo_reporte -> cálculo cuyo resultado se guarda como JSON en ReporteGenerado.resultado
+CALCULOS = {
+    'ingresos': calcular_ingresos,
+    'zonas': calcular_zonas,
+}
+
+
+def normalizar_parametros(tipo, datos, formato):
+    """Sólo los filtros que aplican al tipo, sin vacíos y en orden estable"""
+    filtros = FILTROS[tipo]
+    parametros = {clave: datos.get(clave) for clave in sorted(filtros) if datos.get(clave)}
+    parametros['formato'] = formato
+    return parametros
+
+
+def huella_reporte(tipo, parametros):
+    firma = json.dumps([tipo, parametros], sort_keys=True)
+    return hashlib.sha256(firma.encode()).hexdigest()
+
+
+def filas_reporte(tipo, parametros):
+    """Encabezado y filas del reporte, leídas de la base por bloques"""
+    columnas, generar = EXPORTACIONES[tipo]
+    yield columnas
+    yield from generar(parametros)
+
+
+def colgados():
+    """Q de los trabajos sin terminar que superaron `REPORTES_TIEMPO_MAXIMO`.
+
+    Quedan así si falló el encolado, se perdió el mensaje o el worker murió
+    a mitad del cálculo: ya no se esperan ni se reutilizan.
+    """
+    limite = timezone.now() - timedelta(seconds=getattr(settings, 'REPORTES_TIEMPO_MAXIMO', 600))
+    return Q(estado='pendiente', fecha_generacion__lt=limite) | Q(estado='procesando', fecha_inicio__lt=limite)
+
+
+def cerrar_colgados(reportes):
+    """Marca como error los trabajos colgados de `reportes` (queryset)"""
+    return reportes.filter(colgados()).update(
+        estado='error', error='El reporte superó el tiempo máximo sin terminar', fecha_fin=timezone.now(),
+    )
+
+
+def reporte_reutilizable(tipo, parametros):
+    """Un ReporteGenerado reciente con los mismos parámetros, o None.
+
+    Puede no tener archivo todavía si otra petición lo está generando; los
+    trabajos colgados no se reutilizan (`estado_reporte` los cierra).
+    """
+    ttl = getattr(settings, 'REPORTES_EXPORTACION_TTL', 3600)
+    if not ttl:
+        return None
+    return ReporteGenerado.objects.filter(
+        huella=huella_reporte(tipo, parametros),
+        fecha_generacion__gte=timezone.now() - timedelta(seconds=ttl),
+    ).exclude(estado='error').exclude(colgados()).first()
+
+
+def nombre_archivo(tipo, parametros):
+    return f"reporte_{tipo}_{timezone.localtime().strftime('%Y%m%d_%H%M%S')}.{parametros['formato']}"
+
+
+class _Eco:
+    """Pseudo-archivo para csv.writer: devuelve la línea en vez de guardarla"""
+
+    def write(self, valor):
+        return valor
+
+
+def csv_en_streaming(tipo, parametros, usuario):
+    """Genera el CSV línea a línea para un StreamingHttpResponse.
+
+    Cada línea se copia además a un archivo temporal; al terminar se guarda
+    como ReporteGenerado para que la misma exportación se reutilice. Si el
+    cliente corta la descarga no se registra nada.
+    """
+    writer = csv.writer(_Eco())
+    temporal = tempfile.NamedTemporaryFile('w+', encoding='utf-8', newline='', suffix='.csv', delete=False)
+    completo = False
+    try:
+        # BOM para que Excel detecte UTF-8
+        temporal.write('\ufeff')
+        yield '\ufeff'
+        for fila in filas_reporte(tipo, parametros):
+            linea = writer.writerow(fila)
+            temporal.write(linea)
+            yield linea
+        completo = True
+    finally:
+        temporal.close()
+        try:
+            if completo:
+                _registrar(tipo, parametros, usuario, temporal.name)
+        finally:
+            os.unlink(temporal.name)
+
+
+def _registrar(tipo, parametros, usuario, ruta, reporte=None):
+    reporte = reporte or ReporteGenerado(
+        tipo_reporte=tipo, parametros=parametros, generado_por=usuario,
+        huella=huella_reporte(tipo, parametros),
+    )
+    reporte.estado = 'completado'
+    reporte.fecha_fin = timezone.now()
+    with open(ruta, 'rb') as f:
+        reporte.archivo.save(nombre_archivo(tipo, parametros), File(f), save=True)
+    return reporte
+
+
+def generar_xlsx(reporte):
+    """Escribe el XLSX de un ReporteGenerado con openpyxl en modo write_only.
+
+    En ese modo las filas se vuelcan a disco a medida que se agregan, así que
+    la memoria no crece con el tamaño del reporte.
+    """
+    if not XLSX_AVAILABLE:
+        raise RuntimeError("La librería 'openpyxl' no está instalada; sólo se puede exportar CSV.")
+    libro = Workbook(write_only=True)
+    hoja = libro.create_sheet(reporte.get_tipo_reporte_display()[:31])
+    for fila in filas_reporte(reporte.tipo_reporte, reporte.parametros):
+        hoja.append(fila)
+    fd, ruta = tempfile.mkstemp(suffix='.xlsx')
+    os.close(fd)
+    try:
+        libro.save(ruta)
+        return _registrar(reporte.tipo_reporte, reporte.parametros, reporte.generado_por, ruta, reporte)
+    finally:
+        os.unlink(ruta)
+
+
+# =======================
+# Cola de reportes en segundo plano
+# =======================
+
+class ReportesSaturado(Exception):
+    """No hay cupo libre para otro reporte del mismo tipo"""
+
+
+def _limite(tipo):
+    limites = getattr(settings, 'REPORTES_CONCURRENCIA', {})
+    return limites.get(tipo, getattr(settings, 'REPORTES_CONCURRENCIA_DEFECTO', 2))
+
+
+@contextmanager
+def cupo_reporte(tipo):
+    """Limita los reportes simultáneos de un tipo entre todos los workers.
+
+    Igual que el cupo de OpenAI del chatbot: un contador en la caché
+    compartida que expira solo, así un worker caído no retiene el cupo. Sin
+    caché compartida el contador sería de cada proceso, así que se cuentan
+    en la base los trabajos del tipo en 'procesando' (aproximado: dos
+    workers que comprueban a la vez pueden pasar ambos).
+    """
+    timeout = getattr(settings, 'REPORTES_TIEMPO_MAXIMO', 600)
+    if not cache_compartida():
+        en_curso = ReporteGenerado.objects.filter(tipo_reporte=tipo, estado='procesando').exclude(colgados()).count()
+        if en_curso >= _limite(tipo):
+            raise ReportesSaturado(f'{en_curso} reportes {tipo} en curso (límite {_limite(tipo)})')
+        yield
+        return
+    with contador_en_curso(f'reportes:en_curso:{tipo}', timeout) as en_curso:
+        if en_curso > _limite(tipo):
+            raise ReportesSaturado(f'{en_curso - 1} reportes {tipo} en curso (límite {_limite(tipo)})')
+        yield
+
+
+def solicitar_reporte(tipo, parametros, usuario):
+    """Crea (o reutiliza) el trabajo de un reporte y lo encola.
+
+    Un trabajo idéntico reciente, terminado o en curso, se devuelve tal cual
+    en lugar de calcular el mismo reporte dos veces.
+    """
+    from .tasks import procesar_reporte_task
+
+    reporte = reporte_reutilizable(tipo, parametros)
+    if reporte is not None:
+        return reporte
+    reporte = ReporteGenerado.objects.create(
+        tipo_reporte=tipo, parametros=parametros, generado_por=usuario,
+        huella=huella_reporte(tipo, parametros),
+    )
+    if getattr(settings, 'REPORTES_ASINCRONO', True):
+        try:
+            procesar_reporte_task.delay(reporte.id)
+        except Exception as e:
+            # Sin tarea encolada nadie lo calcularía: no debe quedar 'pendiente'
+            logger.exception('No se pudo encolar el reporte %s', reporte.id)
+            ReporteGenerado.objects.filter(pk=reporte.pk).update(
+                estado='error', error=f'No se pudo encolar: {e}'[:500], fecha_fin=timezone.now(),
+            )
+            reporte.refresh_from_db()
+    else:
+        procesar_reporte_task.apply(args=[reporte.id])
+        reporte.refresh_from_db()
+    return reporte
+
+
+def ejecutar_reporte(reporte):
+    """Calcula un trabajo ya reservado: XLSX si se pidió archivo, si no el resultado JSON"""
+    ReporteGenerado.objects.filter(pk=reporte.pk).update(estado='procesando', fecha_inicio=timezone.now())
+    try:
+        if reporte.parametros.get('formato') == 'xlsx':
+            generar_xlsx(reporte)
+        else:
+            reporte.resultado = CALCULOS[reporte.tipo_reporte](reporte.parametros)
+            reporte.estado = 'completado'
+            reporte.fecha_fin = timezone.now()
+            reporte.save(update_fields=['resultado', 'estado', 'fecha_fin'])
+    except Exception as e:
+        logger.exception('Error generando el reporte %s', reporte.pk)
+        ReporteGenerado.objects.filter(pk=reporte.pk).update(estado='error', error=str(e)[:500], fecha_fin=timezone.now())
+        return False
+    return True
@@ -0,0 +1,34 @@
+from celery import shared_task
+import logging
+from django.conf import settings
+from django.db.models import Q
+from .models import ReporteGenerado
+from .services import colgados, cupo_reporte, ejecutar_reporte, ReportesSaturado
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(bind=True, max_retries=None)
+def procesar_reporte_task(self, reporte_id):
+    """Calcula un ReporteGenerado pendiente (resultado JSON o archivo XLSX).
+
+    Cada tipo de reporte tiene un cupo de ejecuciones simultáneas
+    (`REPORTES_CONCURRENCIA`); sin cupo la tarea se reprograma en vez de
+    sumar otra consulta pesada a la base. Los errores quedan en
+    `estado='error'` para que el cliente que consulta el estado se entere.
+    Una tarea reentregada retoma el trabajo si quedó colgado en 'procesando'
+    (el worker anterior murió a mitad del cálculo).
+    """
+    reporte = (
+        ReporteGenerado.objects.select_related('generado_por').filter(pk=reporte_id)
+        .filter(Q(estado='pendiente') | Q(colgados(), estado='procesando')).first()
+    )
+    if reporte is None:
+        return {'success': True, 'reporte_id': reporte_id}
+    try:
+        with cupo_reporte(reporte.tipo_reporte):
+            ok = ejecutar_reporte(reporte)
+    except ReportesSaturado as e:
+        logger.info('Reporte %s en espera: %s', reporte_id, e)
+        raise self.retry(countdown=getattr(settings, 'REPORTES_ESPERA_CUPO', 15))
+    return {'success': ok, 'reporte_id': reporte_id}
@@ -1,3 +1,332 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from decimal import Decimal
+from unittest.mock import patch
+from celery.exceptions import Retry
+from django.test import TestCase, override_settings
+from django.core.cache import cache
+from django.urls import reverse
+from django.utils import timezone
+from django.contrib.auth import get_user_model
+from clientes.models import Cliente
+from zonas.models import Zona
+from cobranza.models import Pago
+from cobramax_core.estadisticas import estadisticas, contar, sumar
+from cobramax_core.pruebas import ConsultasMixin
+from .models import IngresoDiario, ReporteGenerado
+from .services import CALCULOS
+from .tasks import procesar_reporte_task
 
-# Create your tests here.
+User = get_user_model()
+
+
+class IngresoDiarioTests(TestCase):
+	def setUp(self):
+		self.admin = User.objects.create_user(username='adm', password='x', tipo_usuario='admin')
+		self.zona = Zona.objects.create(nombre='Zona Test', codigo='ZT')
+		user = User.objects.create_user(username='cli', password='x')
+		self.cliente = Cliente.objects.create(
+			usuario=user, dni='12345678', telefono_principal='900000000', direccion='Calle',
+			zona=self.zona, fecha_instalacion='2025-01-01', deuda_actual=100,
+		)
+
+	def crear_pago(self, monto, estado='completado', metodo='yape'):
+		return Pago.objects.create(
+			cliente=self.cliente, monto=monto, metodo_pago=metodo, estado=estado,
+			fecha_pago=timezone.now(), registrado_por=self.admin,
+		)
+
+	def test_senales_mantienen_acumulado(self):
+		self.crear_pago(Decimal('30.00'))
+		pendiente = self.crear_pago(Decimal('20.00'), estado='pendiente')
+		fila = IngresoDiario.objects.get()
+		self.assertEqual((fila.suma_monto, fila.num_pagos), (Decimal('30.00'), 1))
+
+		pendiente.estado = 'completado'
+		pendiente.save()
+		fila.refresh_from_db()
+		self.assertEqual((fila.suma_monto, fila.num_pagos), (Decimal('50.00'), 2))
+
+		pendiente.estado = 'revertido'
+		pendiente.save()
+		fila.refresh_from_db()
+		self.assertEqual((fila.suma_monto, fila.num_pagos), (Decimal('30.00'), 1))
+
+	def test_cambio_de_zona_mueve_el_acumulado(self):
+		self.crear_pago(Decimal('30.00'))
+		pago = self.crear_pago(Decimal('20.00'))
+		self.crear_pago(Decimal('5.00'), metodo='efectivo')
+		otra = Zona.objects.create(nombre='Zona Nueva', codigo='ZN')
+		self.cliente.zona = otra
+		self.cliente.save()
+
+		def acumulado():
+			return sorted(
+				IngresoDiario.objects.filter(num_pagos__gt=0).values_list('zona_id', 'metodo_pago', 'suma_monto', 'num_pagos')
+			)
+		self.assertEqual(acumulado(), [(otra.id, 'efectivo', Decimal('5.00'), 1), (otra.id, 'yape', Decimal('50.00'), 2)])
+		# Los cambios posteriores del pago se aplican en la zona nueva y todo cuadra con una reconstrucción
+		pago.estado = 'revertido'
+		pago.save()
+		incremental = acumulado()
+		IngresoDiario.reconstruir()
+		self.assertEqual(acumulado(), incremental)
+
+	def test_reconstruir_coincide_con_pagos(self):
+		self.crear_pago(Decimal('10.00'))
+		self.crear_pago(Decimal('15.00'), metodo='efectivo')
+		IngresoDiario.objects.all().delete()
+		self.assertEqual(IngresoDiario.reconstruir(), 2)
+		self.assertEqual(IngresoDiario.objects.get(metodo_pago='efectivo').suma_monto, Decimal('15.00'))
+
+	def test_api_metodos_pago_lee_acumulado(self):
+		self.crear_pago(Decimal('10.00'))
+		self.client.force_login(self.admin)
+		resp = self.client.get(reverse('api_metodos_pago'))
+		self.assertEqual(resp.json(), {'metodos': [{'metodo': 'yape', 'total': 10.0}]})
+
+
+class EstadisticasTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.admin = User.objects.create_user(username='adm', password='x', tipo_usuario='admin')
+		self.zona = Zona.objects.create(nombre='Zona Test', codigo='ZT')
+		for i, (estado, deuda) in enumerate([('activo', 0), ('moroso', 40), ('moroso', 60), ('suspendido', 10)]):
+			user = User.objects.create_user(username=f'cli{i}', password='x')
+			Cliente.objects.create(
+				usuario=user, dni=f'1000000{i}', telefono_principal='900000000', direccion='Calle',
+				zona=self.zona, fecha_instalacion='2025-01-01', deuda_actual=deuda, estado=estado,
+			)
+
+	def test_una_sola_consulta(self):
+		with self.assertNumQueries(1):
+			stats = estadisticas(
+				Cliente.objects.all(), total=contar(), morosos=contar(estado='moroso'),
+				deuda_morosos=sumar('deuda_actual', estado='moroso'), deuda_cortados=sumar('deuda_actual', estado='cortado'),
+			)
+		self.assertEqual(stats, {'total': 4, 'morosos': 2, 'deuda_morosos': Decimal('100'), 'deuda_cortados': 0})
+
+	def test_cache_por_filtros(self):
+		morosos = Cliente.objects.filter(estado='moroso')
+		self.assertEqual(estadisticas(morosos, ttl=60, total=contar())['total'], 2)
+		Cliente.objects.filter(estado='activo').update(estado='moroso')
+		with self.assertNumQueries(0):
+			self.assertEqual(estadisticas(morosos, ttl=60, total=contar())['total'], 2)
+		# Otro filtro es otra entrada de caché
+		self.assertEqual(estadisticas(Cliente.objects.all(), ttl=60, total=contar())['total'], 4)
+		self.assertEqual(estadisticas(morosos, total=contar())['total'], 3)
+
+	def test_queryset_vacio(self):
+		self.assertEqual(estadisticas(Cliente.objects.none(), ttl=60, total=contar(), deuda=sumar('deuda_actual')),
+						 {'total': 0, 'deuda': 0})
+
+	@override_settings(ESTADISTICAS_CACHE_TTL=60)
+	def test_reporte_clientes(self):
+		self.client.force_login(self.admin)
+		resp = self.client.get(reverse('reporte_clientes'))
+		self.assertEqual(
+			[resp.context[k] for k in ('total_clientes', 'clientes_activos', 'clientes_suspendidos', 'clientes_morosos')],
+			[4, 1, 1, 2],
+		)
+
+
+class ExportacionReportesTests(TestCase):
+	def setUp(self):
+		self.media = tempfile.mkdtemp()
+		self.override = override_settings(MEDIA_ROOT=self.media, REPORTES_EXPORTACION_CHUNK=2)
+		self.override.enable()
+		self.admin = User.objects.create_user(username='adm', password='x', tipo_usuario='admin')
+		self.zona = Zona.objects.create(nombre='Zona Test', codigo='ZT')
+		user = User.objects.create_user(username='cli', password='x', first_name='Ana', last_name='Ruiz')
+		self.cliente = Cliente.objects.create(
+			usuario=user, dni='12345678', telefono_principal='900000000', direccion='Calle',
+			zona=self.zona, fecha_instalacion='2025-01-01', deuda_actual=100,
+		)
+		for monto, metodo in [(10, 'yape'), (20, 'efectivo'), (30, 'yape'), (40, 'yape'), (50, 'plin')]:
+			Pago.objects.create(
+				cliente=self.cliente, monto=monto, metodo_pago=metodo, estado='completado',
+				fecha_pago=timezone.now(), registrado_por=self.admin,
+			)
+		self.client.force_login(self.admin)
+
+	def tearDown(self):
+		self.override.disable()
+		shutil.rmtree(self.media, ignore_errors=True)
+
+	def descargar(self, respuesta):
+		return b''.join(respuesta.streaming_content).decode('utf-8-sig')
+
+	def test_csv_en_streaming_completo_y_registrado(self):
+		resp = self.client.get(reverse('exportar_reporte', args=['ingresos']), {'metodo_pago': 'yape'})
+		self.assertTrue(resp.streaming)
+		lineas = self.descargar(resp).splitlines()
+		self.assertEqual(lineas[0].split(',')[:4], ['Fecha', 'Código', 'DNI', 'Cliente'])
+		self.assertEqual(len(lineas), 4)
+		self.assertIn('Ana Ruiz', lineas[1])
+		reporte = ReporteGenerado.objects.get()
+		self.assertEqual(reporte.parametros, {'metodo_pago': 'yape', 'formato': 'csv'})
+		with reporte.archivo.open('rb') as f:
+			self.assertEqual(f.read().decode('utf-8-sig').splitlines(), lineas)
+
+	def test_parametros_identicos_reutilizan_archivo(self):
+		url = reverse('exportar_reporte', args=['pagos'])
+		primero = self.descargar(self.client.get(url, {'estado': 'completado', 'zona': ''}))
+		# Mismo filtro en otro orden y con parámetros ajenos al reporte
+		with self.assertNumQueries(3):
+			resp = self.client.get(url, {'pagina': '2', 'estado': 'completado'})
+		self.assertEqual(self.descargar(resp), primero)
+		self.assertEqual(ReporteGenerado.objects.count(), 1)
+
+		self.descargar(self.client.get(url, {'estado': 'pendiente'}))
+		self.assertEqual(ReporteGenerado.objects.count(), 2)
+
+	@override_settings(REPORTES_EXPORTACION_TTL=0)
+	def test_sin_reutilizacion(self):
+		url = reverse('exportar_reporte', args=['clientes'])
+		self.descargar(self.client.get(url))
+		self.descargar(self.client.get(url))
+		self.assertEqual(ReporteGenerado.objects.count(), 2)
+
+	def test_tipo_desconocido(self):
+		self.assertEqual(self.client.get(reverse('exportar_reporte', args=['zonas'])).status_code, 404)
+
+	def test_xlsx_en_segundo_plano(self):
+		url = reverse('exportar_reporte', args=['morosos'])
+		with override_settings(REPORTES_ASINCRONO=True), patch.object(procesar_reporte_task, 'delay') as delay:
+			resp = self.client.get(url, {'formato': 'xlsx'})
+		self.assertRedirects(resp, reverse('reportes_generados'))
+		reporte = ReporteGenerado.objects.get()
+		delay.assert_called_once_with(reporte.id)
+
+		procesar_reporte_task.apply(args=[reporte.id])
+		reporte.refresh_from_db()
+		self.assertEqual(reporte.estado, 'completado')
+		self.assertTrue(reporte.archivo.name.endswith('.xlsx'))
+		resp = self.client.get(url, {'formato': 'xlsx'})
+		self.assertIn('.xlsx', resp['Content-Disposition'])
+
+	@patch('reportes.views.XLSX_AVAILABLE', False)
+	def test_xlsx_no_disponible(self):
+		resp = self.client.get(reverse('exportar_reporte', args=['morosos']), {'formato': 'xlsx'})
+		self.assertRedirects(resp, reverse('reportes_generados'))
+		self.assertFalse(ReporteGenerado.objects.exists())
+
+
+class ColaReportesTests(ConsultasMixin, TestCase):
+	def setUp(self):
+		cache.clear()
+		self.admin = User.objects.create_user(username='adm', password='x', tipo_usuario='admin')
+		self.norte = Zona.objects.create(nombre='Norte', codigo='N')
+		self.sur = Zona.objects.create(nombre='Sur', codigo='S')
+		for i, (zona, estado, deuda) in enumerate([(self.norte, 'activo', 25), (self.norte, 'moroso', 75), (self.sur, 'moroso', 55)]):
+			user = User.objects.create_user(username=f'cli{i}', password='x')
+			cliente = Cliente.objects.create(
+				usuario=user, dni=f'1000000{i}', telefono_principal='900000000', direccion='Calle',
+				zona=zona, fecha_instalacion='2025-01-01', deuda_actual=deuda, estado=estado,
+			)
+			# Dos pagos por cliente (S/ 25): no deben multiplicar los conteos de clientes
+			for monto in (10, 15):
+				Pago.objects.create(
+					cliente=cliente, monto=monto, metodo_pago='yape', estado='completado',
+					fecha_pago=timezone.now(), registrado_por=self.admin,
+				)
+		self.client.force_login(self.admin)
+
+	def test_reporte_zonas_inline(self):
+		resp = self.client.post(reverse('encolar_reporte', args=['zonas']))
+		self.assertEqual(resp.status_code, 200)
+		datos = resp.json()
+		self.assertEqual(datos['estado'], 'completado')
+		zonas = {z['nombre']: z for z in datos['resultado']['zonas']}
+		self.assertEqual(
+			[zonas['Norte'][k] for k in ('total_clientes', 'clientes_activos', 'clientes_morosos', 'ingresos_mes')],
+			[2, 1, 1, 50.0],
+		)
+		self.assertEqual(zonas['Sur']['deuda_total'], 30.0)
+
+	def test_consultar_estado_es_barato(self):
+		reporte = self.client.post(reverse('encolar_reporte', args=['zonas'])).json()
+		with self.assertMaxQueries(4):
+			self.assertEqual(self.client.get(reporte['url_estado']).json()['estado'], 'completado')
+
+	@override_settings(REPORTES_ASINCRONO=True)
+	def test_encolar_y_consultar_estado(self):
+		with patch.object(procesar_reporte_task, 'delay') as delay:
+			resp = self.client.post(reverse('encolar_reporte', args=['ingresos']), {'metodo_pago': 'yape'})
+			# Un trabajo idéntico en curso se reutiliza
+			otra = self.client.post(reverse('encolar_reporte', args=['ingresos']), {'metodo_pago': 'yape'})
+		self.assertEqual(resp.status_code, 202)
+		datos = resp.json()
+		self.assertEqual(otra.json()['reporte_id'], datos['reporte_id'])
+		delay.assert_called_once_with(datos['reporte_id'])
+		self.assertEqual(self.client.get(datos['url_estado']).json()['estado'], 'pendiente')
+
+		procesar_reporte_task.apply(args=[datos['reporte_id']])
+		estado = self.client.get(datos['url_estado']).json()
+		self.assertEqual(estado['estado'], 'completado')
+		self.assertEqual((estado['resultado']['total_ingresos'], estado['resultado']['total_pagos']), (75.0, 6))
+
+	@override_settings(REPORTES_ASINCRONO=True, REPORTES_CONCURRENCIA={'zonas': 1})
+	def test_sin_cupo_se_reprograma(self):
+		with patch.object(procesar_reporte_task, 'delay'):
+			reporte_id = self.client.post(reverse('encolar_reporte', args=['zonas'])).json()['reporte_id']
+		cache.set('reportes:en_curso:zonas', 1)
+		with patch.object(procesar_reporte_task, 'retry', side_effect=Retry()) as retry:
+			procesar_reporte_task.apply(args=[reporte_id])
+		retry.assert_called_once()
+		self.assertEqual(ReporteGenerado.objects.get(pk=reporte_id).estado, 'pendiente')
+
+		cache.set('reportes:en_curso:zonas', 0)
+		procesar_reporte_task.apply(args=[reporte_id])
+		self.assertEqual(ReporteGenerado.objects.get(pk=reporte_id).estado, 'completado')
+		self.assertEqual(cache.get('reportes:en_curso:zonas'), 0)
+
+	def test_error_queda_registrado(self):
+		with patch.dict(CALCULOS, {'zonas': lambda parametros: 1 / 0}):
+			datos = self.client.post(reverse('encolar_reporte', args=['zonas'])).json()
+		self.assertEqual(datos['estado'], 'error')
+		self.assertIn('division', datos['error'])
+		# Un trabajo fallido no se reutiliza
+		self.assertEqual(self.client.post(reverse('encolar_reporte', args=['zonas'])).json()['estado'], 'completado')
+
+	@override_settings(REPORTES_ASINCRONO=True)
+	def test_fallo_al_encolar_no_deja_pendiente(self):
+		with patch.object(procesar_reporte_task, 'delay', side_effect=ConnectionError('broker caído')):
+			datos = self.client.post(reverse('encolar_reporte', args=['zonas'])).json()
+		self.assertEqual(datos['estado'], 'error')
+		self.assertIn('broker caído', datos['error'])
+		with patch.object(procesar_reporte_task, 'delay') as delay:
+			otra = self.client.post(reverse('encolar_reporte', args=['zonas'])).json()
+		self.assertNotEqual(otra['reporte_id'], datos['reporte_id'])
+		delay.assert_called_once_with(otra['reporte_id'])
+
+	@override_settings(REPORTES_ASINCRONO=True, REPORTES_TIEMPO_MAXIMO=60)
+	def test_trabajo_colgado_no_se_reutiliza(self):
+		with patch.object(procesar_reporte_task, 'delay'):
+			datos = self.client.post(reverse('encolar_reporte', args=['zonas'])).json()
+		hace_rato = timezone.now() - timezone.timedelta(seconds=120)
+		ReporteGenerado.objects.filter(pk=datos['reporte_id']).update(fecha_generacion=hace_rato)
+		estado = self.client.get(datos['url_estado']).json()
+		self.assertEqual(estado['estado'], 'error')
+		with patch.object(procesar_reporte_task, 'delay'):
+			otra = self.client.post(reverse('encolar_reporte', args=['zonas'])).json()
+		self.assertNotEqual(otra['reporte_id'], datos['reporte_id'])
+
+		# Una tarea reentregada retoma un trabajo que quedó colgado en 'procesando'
+		ReporteGenerado.objects.filter(pk=otra['reporte_id']).update(estado='procesando', fecha_inicio=hace_rato)
+		procesar_reporte_task.apply(args=[otra['reporte_id']])
+		self.assertEqual(ReporteGenerado.objects.get(pk=otra['reporte_id']).estado, 'completado')
+
+	@override_settings(REPORTES_ASINCRONO=True, REPORTES_CONCURRENCIA={'zonas': 1}, CACHE_COMPARTIDA=False)
+	def test_cupo_sin_cache_compartida_cuenta_en_la_base(self):
+		with patch.object(procesar_reporte_task, 'delay'):
+			reporte_id = self.client.post(reverse('encolar_reporte', args=['zonas'])).json()['reporte_id']
+		en_curso = ReporteGenerado.objects.create(
+			tipo_reporte='zonas', generado_por=self.admin, estado='procesando', fecha_inicio=timezone.now(),
+		)
+		with patch.object(procesar_reporte_task, 'retry', side_effect=Retry()) as retry:
+			procesar_reporte_task.apply(args=[reporte_id])
+		retry.assert_called_once()
+		en_curso.delete()
+		procesar_reporte_task.apply(args=[reporte_id])
+		self.assertEqual(ReporteGenerado.objects.get(pk=reporte_id).estado, 'completado')
@@ -8,6 +8,13 @@ urlpatterns = [
     path('morosos/', views.reporte_morosos, name='reporte_morosos'),
     path('clientes/', views.reporte_clientes, name='reporte_clientes'),
     path('zonas/', views.reporte_zonas, name='reporte_zonas'),
+    # Exportación completa (CSV en streaming / XLSX en segundo plano)
+    path('exportar/<str:tipo>/', views.exportar_reporte, name='exportar_reporte'),
+    path('generados/', views.reportes_generados, name='reportes_generados'),
+    path('generados/<int:reporte_id>/descargar/', views.descargar_reporte, name='descargar_reporte'),
+    # Cola de reportes: encolar y consultar estado
+    path('trabajos/<str:tipo>/', views.encolar_reporte, name='encolar_reporte'),
+    path('trabajos/estado/<int:reporte_id>/', views.estado_reporte, name='estado_reporte'),
     # API endpoints para gráficos y mapas
     path('api/ingresos-por-dia/', views.api_ingresos_por_dia, name='api_ingresos_por_dia'),
     path('api/clientes-por-zona/', views.api_clientes_por_zona, name='api_clientes_por_zona'),
@@ -1,59 +1,66 @@
 # reportes/views.py
-from django.shortcuts import render
+import os
+from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required
 from django.db.models import Sum, Count, Avg, Q
 from django.utils import timezone
 from datetime import datetime, timedelta
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse, FileResponse, Http404
+from django.views.decorators.http import require_POST
+from django.contrib import messages
 from clientes.models import Cliente
 from cobranza.models import Pago
 from zonas.models import Zona
 from django.db.models import F
-from django.db.models.functions import TruncDate
 from usuarios.decorators import require_roles
+from .models import IngresoDiario, ReporteGenerado
+from .services import (
+    EXPORTACIONES, CALCULOS, FORMATOS, XLSX_AVAILABLE, normalizar_parametros,
+    reporte_reutilizable, csv_en_streaming, nombre_archivo, solicitar_reporte, cerrar_colgados,
+)
+from cobramax_core.estadisticas import estadisticas, contar, sumar, ttl_dashboard
 
 
 @login_required
 @require_roles(['admin', 'oficina', 'cobrador'])
 def dashboard_reportes(request):
     """Dashboard principal de reportes"""
-    hoy = timezone.now()
+    hoy = timezone.localtime()
     inicio_mes = hoy.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
     
     # Estadísticas generales
-    total_clientes = Cliente.objects.count()
-    clientes_activos = Cliente.objects.filter(estado='activo').count()
-    clientes_morosos = Cliente.objects.filter(estado='moroso').count()
-    
-    # Estadísticas de pagos del mes
-    pagos_mes = Pago.objects.filter(
-        fecha_pago__gte=inicio_mes,
-        estado='completado'
+    stats_clientes = estadisticas(
+        Cliente.objects.all(), ttl=ttl_dashboard(),
+        total=contar(), activos=contar(estado='activo'), morosos=contar(estado='moroso'),
     )
-    total_ingresos_mes = pagos_mes.aggregate(Sum('monto'))['monto__sum'] or 0
-    total_pagos_mes = pagos_mes.count()
+    total_clientes = stats_clientes['total']
+    clientes_activos = stats_clientes['activos']
+    clientes_morosos = stats_clientes['morosos']
     
-    # Estadísticas por zona
-    zonas_stats = Zona.objects.annotate(
-        total_clientes=Count('cliente'),
-        clientes_morosos=Count('cliente', filter=Q(cliente__estado='moroso')),
-        ingresos_mes=Sum('cliente__pago__monto', 
-                        filter=Q(cliente__pago__fecha_pago__gte=inicio_mes,
-                               cliente__pago__estado='completado'))
+    # Estadísticas de pagos del mes (desde el acumulado diario)
+    ingresos_mes = IngresoDiario.objects.filter(dia__gte=inicio_mes.date()).aggregate(
+        total=Sum('suma_monto'), cantidad=Sum('num_pagos')
     )
+    total_ingresos_mes = ingresos_mes['total'] or 0
+    total_pagos_mes = ingresos_mes['cantidad'] or 0
+    
+    # Estadísticas por zona
+    zonas_stats = Zona.objects.with_metrics('mes')
     
     # Métodos de pago más usados
-    metodos_pago = Pago.objects.filter(estado='completado').values(
+    metodos_pago = IngresoDiario.objects.values(
         'metodo_pago'
     ).annotate(
-        total=Count('id'),
-        monto_total=Sum('monto')
+        total=Sum('num_pagos'),
+        monto_total=Sum('suma_monto')
     ).order_by('-monto_total')[:5]
 
     # Ingresos últimos 7 días (para Chart.js)
-    siete_dias = timezone.now() - timedelta(days=7)
-    pagos_7dias_qs = Pago.objects.filter(estado='completado', fecha_pago__gte=siete_dias)
-    pagos_7dias = pagos_7dias_qs.annotate(fecha=TruncDate('fecha_pago')).values('fecha').annotate(total=Sum('monto')).order_by('fecha')
+    siete_dias = timezone.localdate() - timedelta(days=7)
+    pagos_7dias = IngresoDiario.objects.filter(dia__gte=siete_dias).values(
+        fecha=F('dia')
+    ).annotate(total=Sum('suma_monto')).order_by('fecha')
     
     context = {
         'total_clientes': total_clientes,
@@ -79,49 +86,55 @@ def reporte_ingresos(request):
     zona_id = request.GET.get('zona')
     metodo_pago = request.GET.get('metodo_pago')
     
-    # Query base
+    # Query base: la tabla de detalle sale de Pago, los totales del acumulado diario
     pagos = Pago.objects.filter(estado='completado').select_related('cliente', 'cliente__zona')
+    ingresos = IngresoDiario.objects.all()
     
     # Aplicar filtros
     if fecha_desde:
         try:
             fecha_desde_dt = datetime.strptime(fecha_desde, '%Y-%m-%d')
             pagos = pagos.filter(fecha_pago__gte=fecha_desde_dt)
+            ingresos = ingresos.filter(dia__gte=fecha_desde_dt.date())
         except ValueError:
             pass
     
     if fecha_hasta:
         try:
             fecha_hasta_dt = datetime.strptime(fecha_hasta, '%Y-%m-%d')
-            pagos = pagos.filter(fecha_pago__lte=fecha_hasta_dt)
+            pagos = pagos.filter(fecha_pago__lt=fecha_hasta_dt + timedelta(days=1))
+            ingresos = ingresos.filter(dia__lte=fecha_hasta_dt.date())
         except ValueError:
             pass
     
     if zona_id:
         pagos = pagos.filter(cliente__zona_id=zona_id)
+        ingresos = ingresos.filter(zona_id=zona_id)
     
     if metodo_pago:
         pagos = pagos.filter(metodo_pago=metodo_pago)
+        ingresos = ingresos.filter(metodo_pago=metodo_pago)
     
     # Calcular totales
-    total_ingresos = pagos.aggregate(Sum('monto'))['monto__sum'] or 0
-    total_pagos = pagos.count()
-    promedio_pago = pagos.aggregate(Avg('monto'))['monto__avg'] or 0
+    totales = ingresos.aggregate(total=Sum('suma_monto'), cantidad=Sum('num_pagos'))
+    total_ingresos = totales['total'] or 0
+    total_pagos = totales['cantidad'] or 0
+    promedio_pago = total_ingresos / total_pagos if total_pagos else 0
     
     # Ingresos por día
-    ingresos_por_dia = pagos.extra({
-        'fecha': "DATE(fecha_pago)"
-    }).values('fecha').annotate(
-        total=Sum('monto'),
-        cantidad=Count('id')
+    ingresos_por_dia = ingresos.values(
+        fecha=F('dia')
+    ).annotate(
+        total=Sum('suma_monto'),
+        cantidad=Sum('num_pagos')
     ).order_by('fecha')
     
     # Ingresos por zona
-    ingresos_por_zona = pagos.values(
-        'cliente__zona__nombre'
+    ingresos_por_zona = ingresos.values(
+        'zona__nombre'
     ).annotate(
-        total=Sum('monto'),
-        cantidad=Count('id')
+        total=Sum('suma_monto'),
+        cantidad=Sum('num_pagos')
     ).order_by('-total')
     
     # Obtener zonas para el filtro
@@ -149,23 +162,22 @@ def reporte_ingresos(request):
 def api_ingresos_por_dia(request):
     """Devuelve ingresos por día (últimos 30 días) en JSON para Chart.js"""
     dias = int(request.GET.get('dias', 30))
-    fecha_inicio = timezone.now() - timedelta(days=dias)
-    pagos = Pago.objects.filter(estado='completado', fecha_pago__gte=fecha_inicio)
-    datos = pagos.annotate(fecha=TruncDate('fecha_pago')).values('fecha').annotate(total=Sum('monto')).order_by('fecha')
+    fecha_inicio = timezone.localdate() - timedelta(days=dias)
+    datos = IngresoDiario.objects.filter(dia__gte=fecha_inicio).values(fecha=F('dia')).annotate(total=Sum('suma_monto')).order_by('fecha')
     return JsonResponse({'datos': [{'fecha': d['fecha'].isoformat(), 'total': float(d['total'] or 0)} for d in datos]})
 
 
 @login_required
 @require_roles(['admin', 'oficina', 'cobrador'])
 def api_clientes_por_zona(request):
-    zonas = Zona.objects.annotate(total_clientes=Count('cliente')).values('nombre', 'total_clientes')
+    zonas = Zona.objects.with_metrics().values('nombre', 'total_clientes')
     return JsonResponse({'zonas': list(zonas)})
 
 
 @login_required
 @require_roles(['admin', 'oficina', 'cobrador'])
 def api_zonas_geo(request):
-    zonas = Zona.objects.annotate(total_clientes=Count('cliente')).filter(latitud__isnull=False, longitud__isnull=False)
+    zonas = Zona.objects.filter(latitud__isnull=False, longitud__isnull=False).with_metrics()
     datos = [
         {
             'nombre': z.nombre,
@@ -182,7 +194,7 @@ def api_zonas_geo(request):
 @require_roles(['admin', 'oficina', 'cobrador'])
 def api_metodos_pago(request):
     """Devuelve totales por método de pago en JSON para Chart.js"""
-    datos = Pago.objects.filter(estado='completado').values('metodo_pago').annotate(total=Sum('monto')).order_by('-total')
+    datos = IngresoDiario.objects.values('metodo_pago').annotate(total=Sum('suma_monto')).order_by('-total')
     resultados = [
         {'metodo': d['metodo_pago'] or 'Desconocido', 'total': float(d['total'] or 0)}
         for d in datos
@@ -207,8 +219,9 @@ def reporte_morosos(request):
         clientes_morosos = clientes_morosos.filter(zona_id=zona_id)
     
     # Calcular deuda total (usar campo 'deuda_actual' presente en Cliente)
-    deuda_total = clientes_morosos.aggregate(Sum('deuda_actual'))['deuda_actual__sum'] or 0
-    total_morosos = clientes_morosos.count()
+    stats = estadisticas(clientes_morosos, deuda=sumar('deuda_actual'), total=contar())
+    deuda_total = stats['deuda']
+    total_morosos = stats['total']
     
     # Morosos por zona
     morosos_por_zona = clientes_morosos.values(
@@ -249,10 +262,15 @@ def reporte_clientes(request):
         clientes = clientes.filter(estado=estado)
     
     # Estadísticas
-    total_clientes = clientes.count()
-    clientes_activos = clientes.filter(estado='activo').count()
-    clientes_suspendidos = clientes.filter(estado='suspendido').count()
-    clientes_morosos = clientes.filter(estado='moroso').count()
+    stats = estadisticas(
+        clientes, ttl=ttl_dashboard(),
+        total=contar(), activos=contar(estado='activo'),
+        suspendidos=contar(estado='suspendido'), morosos=contar(estado='moroso'),
+    )
+    total_clientes = stats['total']
+    clientes_activos = stats['activos']
+    clientes_suspendidos = stats['suspendidos']
+    clientes_morosos = stats['morosos']
     
     # Clientes por zona
     clientes_por_zona = clientes.values(
@@ -281,18 +299,110 @@ def reporte_clientes(request):
 @login_required
 @require_roles(['admin', 'oficina', 'cobrador'])
 def reporte_zonas(request):
-    """Reporte de rendimiento por zonas"""
-    zonas = Zona.objects.annotate(
-        total_clientes=Count('cliente'),
-        clientes_activos=Count('cliente', filter=Q(cliente__estado='activo')),
-        clientes_morosos=Count('cliente', filter=Q(cliente__estado='moroso')),
-        ingresos_mes=Sum('cliente__pago__monto', 
-                        filter=Q(cliente__pago__estado='completado',
-                               cliente__pago__fecha_pago__gte=timezone.now().replace(day=1)))
-    )
-    
-    context = {
-        'zonas': zonas,
+    """Reporte de rendimiento por zonas.
+
+    La tabla se calcula en segundo plano (`encolar_reporte`) y la página
+    consulta su estado hasta tenerla.
+    """
+    return render(request, 'reportes/zonas.html')
+
+
+# =======================
+# Exportación de reportes
+# =======================
+
+def _descargar(reporte):
+    return FileResponse(reporte.archivo.open('rb'), as_attachment=True, filename=os.path.basename(reporte.archivo.name))
+
+
+@login_required
+@require_roles(['admin', 'oficina', 'cobrador'])
+def exportar_reporte(request, tipo):
+    """Exporta un reporte completo (sin el límite de 50 filas de las vistas).
+
+    CSV se envía en streaming mientras se lee la base por bloques; XLSX se
+    genera en una tarea Celery. Si ya existe un archivo reciente con los
+    mismos filtros se descarga ese.
+    """
+    if tipo not in EXPORTACIONES:
+        raise Http404('Tipo de reporte no exportable')
+    formato = request.GET.get('formato', 'csv')
+    if formato not in FORMATOS:
+        formato = 'csv'
+    parametros = normalizar_parametros(tipo, request.GET, formato)
+
+    reporte = reporte_reutilizable(tipo, parametros)
+    if reporte and reporte.archivo:
+        return _descargar(reporte)
+
+    if formato == 'xlsx':
+        if not XLSX_AVAILABLE:
+            messages.error(request, 'La exportación a Excel no está disponible en este servidor. Usa CSV.')
+            return redirect('reportes_generados')
+        reporte = solicitar_reporte(tipo, parametros, request.user)
+        if reporte.estado == 'completado':
+            return _descargar(reporte)
+        messages.info(request, 'El reporte se está generando. Aparecerá en esta lista cuando esté listo.')
+        return redirect('reportes_generados')
+
+    respuesta = StreamingHttpResponse(csv_en_streaming(tipo, parametros, request.user), content_type='text/csv; charset=utf-8')
+    respuesta['Content-Disposition'] = f'attachment; filename="{nombre_archivo(tipo, parametros)}"'
+    return respuesta
+
+
+@login_required
+@require_roles(['admin', 'oficina', 'cobrador'])
+def reportes_generados(request):
+    """Últimos reportes exportados"""
+    reportes = ReporteGenerado.objects.select_related('generado_por')[:50]
+    return render(request, 'reportes/generados.html', {'reportes': reportes})
+
+
+@login_required
+@require_roles(['admin', 'oficina', 'cobrador'])
+def descargar_reporte(request, reporte_id):
+    reporte = get_object_or_404(ReporteGenerado, id=reporte_id)
+    if not reporte.archivo:
+        if reporte.estado == 'error':
+            messages.error(request, 'No se pudo generar el reporte.')
+        else:
+            messages.info(request, 'El reporte todavía se está generando.')
+        return redirect('reportes_generados')
+    return _descargar(reporte)
+
+
+@login_required
+@require_roles(['admin', 'oficina', 'cobrador'])
+@require_POST
+def encolar_reporte(request, tipo):
+    """Encola el cálculo de un reporte y retorna de inmediato el id del trabajo"""
+    if tipo not in CALCULOS:
+        raise Http404('Tipo de reporte no disponible en segundo plano')
+    datos = request.POST or request.GET
+    reporte = solicitar_reporte(tipo, normalizar_parametros(tipo, datos, 'json'), request.user)
+    return JsonResponse(_estado_json(reporte), status=200 if reporte.terminado else 202)
+
+
+@login_required
+@require_roles(['admin', 'oficina', 'cobrador'])
+def estado_reporte(request, reporte_id):
+    """Estado de un trabajo de reporte; incluye el resultado cuando terminó"""
+    reporte = get_object_or_404(ReporteGenerado, id=reporte_id)
+    if not reporte.terminado and cerrar_colgados(ReporteGenerado.objects.filter(pk=reporte.pk)):
+        reporte.refresh_from_db()
+    return JsonResponse(_estado_json(reporte))
+
+
+def _estado_json(reporte):
+    datos = {
+        'reporte_id': reporte.id,
+        'estado': reporte.estado,
+        'url_estado': reverse('estado_reporte', args=[reporte.id]),
     }
-    
-    return render(request, 'reportes/zonas.html', context)
\ No newline at end of file
+    if reporte.estado == 'completado':
+        datos['resultado'] = reporte.resultado
+        if reporte.archivo:
+            datos['url_descarga'] = reverse('descargar_reporte', args=[reporte.id])
+    elif reporte.estado == 'error':
+        datos['error'] = reporte.error
+    return datos
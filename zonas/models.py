@@ -1,9 +1,77 @@
 # zonas/models.py
+from datetime import date
+from django.apps import apps
 from django.db import models
+from django.db.models import Count, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 
 Usuario = get_user_model()
 
+
+def rango_periodo(period=None):
+    """(desde, hasta) inclusivo de un periodo de métricas.
+
+    `period` puede ser None o 'mes' (mes en curso), 'anio' (año en curso),
+    una fecha (desde ese día hasta hoy) o una tupla (desde, hasta).
+    """
+    hoy = timezone.localdate()
+    if period in (None, 'mes'):
+        return hoy.replace(day=1), hoy
+    if period == 'anio':
+        return hoy.replace(month=1, day=1), hoy
+    if isinstance(period, (tuple, list)):
+        return tuple(period)
+    if isinstance(period, date):
+        return period, hoy
+    raise ValueError(f'Periodo no reconocido: {period!r}')
+
+
+def _por_zona(queryset, agregado, output_field, campo_zona='zona'):
+    """Agregado de `queryset` correlacionado con la zona de la fila externa (0 si no hay filas)"""
+    sub = (
+        queryset.filter(**{campo_zona: OuterRef('pk')}).order_by()
+        .values(campo_zona).annotate(valor=agregado).values('valor')
+    )
+    return Coalesce(Subquery(sub, output_field=output_field), Value(0), output_field=output_field)
+
+
+class ZonaQuerySet(models.QuerySet):
+    def with_metrics(self, period=None):
+        """Anota clientes por estado, deuda e ingresos del periodo de cada zona.
+
+        Cada métrica es una subconsulta independiente agrupada por zona, en
+        lugar de juntar zona→clientes→pagos en un mismo JOIN: así los conteos
+        de clientes no se multiplican por sus pagos y el costo no crece con
+        clientes × pagos. Los ingresos salen del acumulado `IngresoDiario`.
+
+        Anota: total_clientes, clientes_activos, clientes_morosos,
+        deuda_total, ingresos_periodo y pagos_periodo.
+        """
+        Cliente = apps.get_model('clientes', 'Cliente')
+        IngresoDiario = apps.get_model('reportes', 'IngresoDiario')
+        desde, hasta = rango_periodo(period)
+        entero = models.IntegerField()
+        monto = models.DecimalField(max_digits=14, decimal_places=2)
+        ingresos = IngresoDiario.objects.filter(dia__gte=desde, dia__lte=hasta)
+        return self.annotate(
+            total_clientes=_por_zona(Cliente.objects.all(), Count('pk'), entero),
+            clientes_activos=_por_zona(Cliente.objects.filter(estado='activo'), Count('pk'), entero),
+            clientes_morosos=_por_zona(Cliente.objects.filter(estado='moroso'), Count('pk'), entero),
+            deuda_total=_por_zona(Cliente.objects.all(), Sum('deuda_actual'), monto),
+            ingresos_periodo=_por_zona(ingresos, Sum('suma_monto'), monto),
+            pagos_periodo=_por_zona(ingresos, Sum('num_pagos'), entero),
+        )
+
+    def visible_to(self, user):
+        """Zonas que `user` puede ver según su alcance (ver zonas.services)"""
+        from .services import alcance_de
+
+        alcance = alcance_de(user)
+        return self if alcance.todo else self.filter(pk__in=alcance.zonas)
+
+
 class Zona(models.Model):
     nombre = models.CharField(max_length=100, unique=True)
     descripcion = models.TextField(blank=True, default="")
@@ -20,6 +88,8 @@ class Zona(models.Model):
     activa = models.BooleanField(default=True)
     fecha_creacion = models.DateTimeField(auto_now_add=True)
     fecha_actualizacion = models.DateTimeField(auto_now=True)
+
+    objects = ZonaQuerySet.as_manager()
     
     class Meta:
         verbose_name = "Zona"
@@ -91,4 +161,53 @@ class Caserio(models.Model):
         verbose_name_plural = 'Caseríos'
 
     def __str__(self):
-        return f"{self.nombre} - {self.distrito.nombre} / {self.distrito.provincia.nombre}"
\ No newline at end of file
+        return f"{self.nombre} - {self.distrito.nombre} / {self.distrito.provincia.nombre}"
+
+# Invalidación del alcance cacheado de los cobradores (zonas.services)
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+
+@receiver(pre_save, sender=Zona)
+def zona_pre_save_alcance(sender, instance, **kwargs):
+    instance._cobrador_anterior = None
+    if instance.pk:
+        instance._cobrador_anterior = (
+            Zona.objects.filter(pk=instance.pk).values_list('cobrador_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Zona)
+@receiver(post_delete, sender=Zona)
+def zona_cambio_alcance(sender, instance, **kwargs):
+    from .services import invalidar_alcance
+
+    invalidar_alcance(instance.cobrador_id, getattr(instance, '_cobrador_anterior', None))
+
+
+@receiver(pre_save, sender='clientes.Cliente')
+def cliente_pre_save_alcance(sender, instance, update_fields=None, **kwargs):
+    instance._zona_anterior, instance._usuario_anterior = instance.zona_id, instance.usuario_id
+    if instance.pk and (update_fields is None or {'zona', 'usuario'} & set(update_fields)):
+        anterior = sender.objects.filter(pk=instance.pk).values_list('zona_id', 'usuario_id').first()
+        if anterior:
+            instance._zona_anterior, instance._usuario_anterior = anterior
+
+
+@receiver(post_save, sender='clientes.Cliente')
+@receiver(post_delete, sender='clientes.Cliente')
+def cliente_cambio_alcance(sender, instance, created=False, **kwargs):
+    from .services import invalidar_alcance
+
+    anterior = getattr(instance, '_zona_anterior', None)
+    usuario_anterior = getattr(instance, '_usuario_anterior', None)
+    # Solo altas, bajas, cambios de zona y de usuario modifican algún alcance
+    if (
+        kwargs.get('signal') is post_save and not created
+        and anterior == instance.zona_id and usuario_anterior == instance.usuario_id
+    ):
+        return
+    cobradores = Zona.objects.filter(
+        pk__in={instance.zona_id, anterior}, cobrador__isnull=False
+    ).values_list('cobrador_id', flat=True)
+    invalidar_alcance(instance.usuario_id, usuario_anterior, *cobradores)
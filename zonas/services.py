@@ -0,0 +1,95 @@
+# zonas/services.py
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from cobramax_core.caches import cache_compartida
+
+ROLES_SIN_RESTRICCION = ('admin', 'oficina')
+
+
+class Alcance:
+    """Zonas y clientes que un usuario puede ver.
+
+    `todo` es True para admin/oficina; en ese caso `zonas` y `clientes`
+    no se usan. Para un cobrador son las zonas activas que tiene asignadas
+    y los clientes de esas zonas; para un cliente, solo su propia ficha.
+    """
+
+    def __init__(self, todo=False, zonas=(), clientes=()):
+        self.todo = todo
+        self.zonas = frozenset(zonas)
+        self.clientes = frozenset(clientes)
+
+    def permite_cliente(self, cliente_id):
+        return self.todo or cliente_id in self.clientes
+
+    def permite_zona(self, zona_id):
+        return self.todo or zona_id in self.zonas
+
+    def filtro_clientes(self, campo='cliente'):
+        """Q que restringe un queryset a los clientes del alcance.
+
+        `campo` es la FK al cliente (None si el queryset es de Cliente). Es
+        un `<campo>_id__in` sobre los ids ya resueltos; si la lista es muy
+        larga (`ALCANCE_MAX_IDS`) se filtra por las zonas en su lugar para
+        no mandar miles de parámetros a la base.
+        """
+        if self.todo:
+            return Q()
+        prefijo = f'{campo}__' if campo else ''
+        if len(self.clientes) > getattr(settings, 'ALCANCE_MAX_IDS', 2000):
+            return Q(**{f'{prefijo}zona_id__in': self.zonas})
+        return Q(**{f'{campo}_id__in' if campo else 'pk__in': self.clientes})
+
+
+def _clave(usuario_id):
+    return f'alcance:usuario:{usuario_id}'
+
+
+def _resolver(user):
+    Zona = apps.get_model('zonas', 'Zona')
+    Cliente = apps.get_model('clientes', 'Cliente')
+    if user.tipo_usuario == 'cobrador':
+        zonas = list(Zona.objects.filter(cobrador_id=user.pk, activa=True).values_list('pk', flat=True))
+        clientes = Cliente.objects.filter(zona_id__in=zonas).values_list('pk', flat=True) if zonas else []
+        return Alcance(zonas=zonas, clientes=clientes)
+    if user.tipo_usuario == 'cliente':
+        return Alcance(clientes=Cliente.objects.filter(usuario_id=user.pk).values_list('pk', flat=True))
+    return Alcance()
+
+
+def alcance_de(user):
+    """Alcance del usuario, resuelto una vez y reutilizado.
+
+    Se guarda en el propio objeto usuario (dura lo que la petición) y en
+    la caché durante `ALCANCE_CACHE_TTL` segundos; `invalidar_alcance` la
+    limpia cuando cambian las zonas o los clientes de un cobrador. Solo se
+    cachea entre peticiones si la caché es compartida: con locmem la
+    invalidación no llegaría a los demás procesos.
+    """
+    if not getattr(user, 'is_authenticated', False):
+        return Alcance()
+    if user.tipo_usuario in ROLES_SIN_RESTRICCION:
+        return Alcance(todo=True)
+
+    memo = getattr(user, '_alcance', None)
+    if memo is not None and memo[0] == user.tipo_usuario:
+        return memo[1]
+
+    ttl = getattr(settings, 'ALCANCE_CACHE_TTL', 300) if cache_compartida() else 0
+    datos = cache.get(_clave(user.pk)) if ttl else None
+    if datos is not None and datos[0] == user.tipo_usuario:
+        alcance = Alcance(zonas=datos[1], clientes=datos[2])
+    else:
+        alcance = _resolver(user)
+        if ttl:
+            cache.set(_clave(user.pk), (user.tipo_usuario, list(alcance.zonas), list(alcance.clientes)), ttl)
+    user._alcance = (user.tipo_usuario, alcance)
+    return alcance
+
+
+def invalidar_alcance(*usuario_ids):
+    claves = [_clave(pk) for pk in usuario_ids if pk]
+    if claves:
+        cache.delete_many(claves)
@@ -1,6 +1,14 @@
-from django.test import TestCase
+from datetime import timedelta
+from decimal import Decimal
+from django.core.cache import cache
+from django.test import TestCase, override_settings
 from django.urls import reverse
-from .models import Departamento, Provincia, Distrito, Caserio
+from django.utils import timezone
+from django.contrib.auth import get_user_model
+from clientes.models import Cliente
+from cobranza.models import Pago
+from .models import Zona, Departamento, Provincia, Distrito, Caserio
+from .services import alcance_de
 
 
 class ZonasApiTests(TestCase):
@@ -38,3 +46,137 @@ class ZonasApiTests(TestCase):
 		self.assertEqual(resp.status_code, 200)
 		data = resp.json()
 		self.assertTrue(any(c['nombre'] == 'Caserio Test' for c in data))
+
+
+class ZonaMetricasTests(TestCase):
+	def setUp(self):
+		User = get_user_model()
+		self.admin = User.objects.create_user(username='adm', password='x', tipo_usuario='admin')
+		self.norte = Zona.objects.create(nombre='Norte', codigo='N')
+		self.vacia = Zona.objects.create(nombre='Vacia', codigo='V')
+		ahora = timezone.now()
+		for i, (estado, deuda) in enumerate([('activo', 35), ('moroso', 75), ('moroso', 95)]):
+			user = User.objects.create_user(username=f'cli{i}', password='x')
+			cliente = Cliente.objects.create(
+				usuario=user, dni=f'1000000{i}', telefono_principal='900000000', direccion='Calle',
+				zona=self.norte, fecha_instalacion='2025-01-01', deuda_actual=deuda, estado=estado,
+			)
+			# Tres pagos por cliente (S/ 35), uno fuera del periodo
+			for monto, fecha in [(10, ahora), (20, ahora), (5, ahora - timedelta(days=400))]:
+				Pago.objects.create(
+					cliente=cliente, monto=monto, metodo_pago='yape', estado='completado',
+					fecha_pago=fecha, registrado_por=self.admin,
+				)
+
+	def test_metricas_sin_multiplicar_por_pagos(self):
+		with self.assertNumQueries(1):
+			zonas = {z.nombre: z for z in Zona.objects.with_metrics()}
+		norte = zonas['Norte']
+		self.assertEqual((norte.total_clientes, norte.clientes_activos, norte.clientes_morosos), (3, 1, 2))
+		self.assertEqual(norte.deuda_total, Decimal('100'))
+		self.assertEqual((norte.ingresos_periodo, norte.pagos_periodo), (Decimal('90'), 6))
+		vacia = zonas['Vacia']
+		self.assertEqual((vacia.total_clientes, vacia.ingresos_periodo, vacia.pagos_periodo), (0, 0, 0))
+
+	def test_periodo_explicito(self):
+		hoy = timezone.localdate()
+		norte = Zona.objects.with_metrics((hoy - timedelta(days=500), hoy)).get(pk=self.norte.pk)
+		self.assertEqual((norte.ingresos_periodo, norte.pagos_periodo), (Decimal('105'), 9))
+		self.assertEqual(norte.total_clientes, 3)
+
+	def test_dashboard_usa_metricas(self):
+		self.client.force_login(self.admin)
+		resp = self.client.get(reverse('dashboard_reportes'))
+		norte = next(z for z in resp.context['zonas_stats'] if z.nombre == 'Norte')
+		self.assertEqual((norte.total_clientes, norte.clientes_morosos, norte.ingresos_periodo), (3, 2, Decimal('90')))
+
+
+@override_settings(ALCANCE_CACHE_TTL=300)
+class AlcanceCobradorTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		User = get_user_model()
+		self.admin = User.objects.create_user(username='adm', password='x', tipo_usuario='admin')
+		self.cobrador = User.objects.create_user(username='cob', password='x', tipo_usuario='cobrador')
+		self.norte = Zona.objects.create(nombre='Norte', codigo='N', cobrador=self.cobrador)
+		self.sur = Zona.objects.create(nombre='Sur', codigo='S')
+		self.clientes = {}
+		for i, zona in enumerate([self.norte, self.sur]):
+			user = User.objects.create_user(username=f'cli{i}', password='x', tipo_usuario='cliente')
+			cliente = Cliente.objects.create(
+				usuario=user, dni=f'2000000{i}', telefono_principal='900000000', direccion='Calle',
+				zona=zona, fecha_instalacion='2025-01-01',
+			)
+			self.clientes[zona.codigo] = cliente
+			Pago.objects.create(
+				cliente=cliente, monto=10, metodo_pago='yape', fecha_pago=timezone.now(), registrado_por=self.admin,
+			)
+
+	def tearDown(self):
+		cache.clear()
+
+	def _cobrador(self):
+		# Usuario recién leído, como en una petición nueva (sin alcance en memoria)
+		return get_user_model().objects.get(pk=self.cobrador.pk)
+
+	def _alcance(self):
+		return alcance_de(self._cobrador())
+
+	def test_visible_to_filtra_por_alcance(self):
+		norte = self.clientes['N']
+		self.assertEqual(list(Pago.objects.visible_to(self.cobrador).values_list('cliente_id', flat=True)), [norte.pk])
+		self.assertEqual(list(Cliente.objects.visible_to(self.cobrador)), [norte])
+		self.assertEqual(list(Zona.objects.visible_to(self.cobrador)), [self.norte])
+		self.assertEqual(Pago.objects.visible_to(self.admin).count(), 2)
+		self.assertEqual(list(Pago.objects.visible_to(norte.usuario).values_list('cliente_id', flat=True)), [norte.pk])
+
+	def test_alcance_en_cache_e_invalidacion(self):
+		self.assertEqual(self._alcance().zonas, {self.norte.pk})
+		with self.assertNumQueries(1):
+			# Solo la lectura del usuario: el alcance sale de la caché
+			self._alcance()
+		self.sur.cobrador = self.cobrador
+		self.sur.save()
+		self.assertEqual(self._alcance().clientes, {c.pk for c in self.clientes.values()})
+		self.norte.activa = False
+		self.norte.save()
+		self.assertEqual(self._alcance().zonas, {self.sur.pk})
+
+	def test_cambio_de_zona_del_cliente_invalida(self):
+		norte = self.clientes['N']
+		self.assertIn(norte.pk, self._alcance().clientes)
+		norte.zona = self.sur
+		norte.save()
+		self.assertEqual(self._alcance().clientes, set())
+
+	def test_cambio_de_usuario_del_cliente_invalida(self):
+		norte = self.clientes['N']
+		nuevo = get_user_model().objects.create_user(username='cli9', password='x', tipo_usuario='cliente')
+		anterior = get_user_model().objects.get(pk=norte.usuario_id)
+		self.assertEqual(alcance_de(anterior).clientes, {norte.pk})
+		norte.usuario = nuevo
+		norte.save()
+		self.assertEqual(alcance_de(get_user_model().objects.get(pk=anterior.pk)).clientes, set())
+		self.assertEqual(alcance_de(get_user_model().objects.get(pk=nuevo.pk)).clientes, {norte.pk})
+
+	@override_settings(CACHE_COMPARTIDA=False)
+	def test_sin_cache_compartida_no_cachea(self):
+		self._alcance()
+		with self.assertNumQueries(3):
+			# Usuario, zonas y clientes: nada sale de la caché local
+			self._alcance()
+
+	def test_filtro_por_zona_con_muchos_clientes(self):
+		with self.settings(ALCANCE_MAX_IDS=0):
+			pagos = Pago.objects.visible_to(self._cobrador())
+			self.assertIn('zona_id', str(pagos.query))
+			self.assertEqual(pagos.count(), 1)
+
+	def test_detalle_pago_usa_alcance(self):
+		self.client.force_login(self.cobrador)
+		ajeno = Pago.objects.get(cliente=self.clientes['S'])
+		propio = Pago.objects.get(cliente=self.clientes['N'])
+		self.assertRedirects(self.client.get(reverse('detalle_pago', args=[ajeno.pk])), reverse('lista_pagos'), fetch_redirect_response=False)
+		self.assertEqual(self.client.get(reverse('detalle_pago', args=[propio.pk])).status_code, 200)
+		resp = self.client.get(reverse('mapa_zonas'))
+		self.assertEqual(list(resp.context['zonas']), [self.norte])
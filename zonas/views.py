@@ -47,7 +47,7 @@ def detalle_zona(request, zona_id):
     
     # Permisos: admin, oficina o cobrador asignado a la zona
     # Si es cobrador hay una comprobación extra por objeto
-    if request.user.tipo_usuario == 'cobrador' and zona.cobrador != request.user:
+    if request.user.tipo_usuario == 'cobrador' and zona.cobrador_id != request.user.pk:
         messages.error(request, "No tienes permisos para ver esta zona")
         return redirect('dashboard')
     
@@ -61,11 +61,8 @@ def detalle_zona(request, zona_id):
 @require_roles(['admin', 'oficina', 'cobrador'])
 def mapa_zonas(request):
     """Mapa interactivo de todas las zonas"""
-    zonas = Zona.objects.filter(activa=True)
-
     # Si es cobrador, solo ver sus zonas
-    if request.user.tipo_usuario == 'cobrador':
-        zonas = zonas.filter(cobrador=request.user)
+    zonas = Zona.objects.filter(activa=True).visible_to(request.user).select_related('cobrador')
 
     context = {
         'zonas': zonas,